@@ -1,98 +1,151 @@
 # app.py
 import streamlit as st
 import json
+import math
+import uuid
+import zipfile
+import hashlib
 from delphibot_engine import (
     perform_study_phase,
+    conduct_interview_stage,
     formalize_structure_from_exploratory_summary,
     generate_final_catalog_from_summaries,
     reset_session_tokens_for_engine,
     ManagerAgent, 
     InterviewerAgent,
-    SummarizerAgent,
+    InterviewMemory,
     _run_agent_internal,
-    INPUT_PRICE_PER_MILLION_TOKENS,
-    OUTPUT_PRICE_PER_MILLION_TOKENS,
+    summarize_interview_transcript,
+    get_session_usage,
+    StudyUsage,
+    bind_study_usage,
+    set_study_budget,
+    BUDGET_DEGRADE_AT_FRACTION,
     PREDEFINED_PERSONAS_NEWSPAPER_TOPIC, 
     MAX_INTERVIEW_TURNS_DEFAULT,
-    session_input_tokens, 
-    session_output_tokens
+    MAX_PANEL_SIZE,
+    SIMULATION_MODE_TURN_BY_TURN,
+    SIMULATION_MODE_SINGLE_SHOT,
+    SIMULATION_MODE_SINGLE_SHOT_WITH_SUMMARY
 )
-from typing import Any, Dict, List, Optional
+from delphibot_catalog import new_catalog_state, render_catalog_markdown, list_catalog_factors, catalog_state_from_markdown
+from delphibot_delphi import MAX_DELPHI_ROUNDS_DEFAULT, run_delphi_rating_rounds, delphi_result_rows
+from delphibot_cross_impact import run_cross_impact_analysis, influence_ranking_rows, scenario_bundle_markdown
+from delphibot_export import EXPORT_FORMATS, export_study
+from delphibot_retrieval import get_prior_study_index
+from delphibot_estimator import calibrate, estimate_study, fit_study_to_budget, append_usage_history
+from delphibot_pipeline import StudyPipeline
+from delphibot_speculation import SpeculativeFormalization
+from delphibot_persona_pool import MAX_PARALLEL_INTERVIEWS, build_persona_pool, run_panel_interviews, run_structured_interviews_concurrently
+from delphibot_exploration import run_exploratory_fanout
+from delphibot_artifacts import ArtifactHandle, store_artifact, load_artifact
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from contextlib import contextmanager
 
-# --- VOICE IMPORTS ---
-from gtts import gTTS # For Google TTS
-import speech_recognition as sr
+# --- VOICE STACK (lazy) ---
+# gtts, speech_recognition and the OpenAI clients are only imported once voice output/input is enabled, so AI-only
+# sessions and the first page render never pay for them. Speech is streamed to the browser (delphibot_tts).
 import io 
-import asyncio
-from openai import AsyncOpenAI # For OpenAI TTS
-from openai.helpers import LocalAudioPlayer # For OpenAI TTS playback
 import os
+import threading
+import streamlit.components.v1 as components
+from delphibot_tts import TTSStreamServer, gtts_speech, openai_speech
 
-# --- Initialize OpenAI Async Client for TTS (once per session) ---
-if 'openai_async_client' not in st.session_state:
+# --- Process-wide shared resources (created once, shared by all sessions) ---
+@st.cache_resource
+def get_shared_openai_client() -> Optional[Any]:
     try:
-        st.session_state.openai_async_client = AsyncOpenAI() 
-        print("ENGINE: AsyncOpenAI client for TTS initialized.")
+        from openai import OpenAI
+        client = OpenAI(); print("ENGINE: Standard OpenAI client initialized.") # Uses OPENAI_API_KEY env var
+        return client
     except Exception as e:
-        st.session_state.openai_async_client = None
-        print(f"ENGINE WARNING: Could not initialize AsyncOpenAI client for TTS: {e}")
-
-# --- Initialize STT Recognizer and Microphone (once per session) ---
-if 'recognizer' not in st.session_state: st.session_state.recognizer = sr.Recognizer()
-if 'microphone' not in st.session_state:
-    try: st.session_state.microphone = sr.Microphone(); print("ENGINE: Microphone initialized.")
-    except Exception as e: st.session_state.microphone = None; print(f"ENGINE WARNING: Mic init failed: {e}.")
-
-# --- ASYNC HELPER TO PLAY OPENAI TTS STREAM ---
-async def play_openai_tts_stream_async(client: AsyncOpenAI, text: str, voice: str):
-    if not client: st.warning("OpenAI TTS client not available."); return
+        print(f"ENGINE WARNING: Could not initialize standard OpenAI client: {e}"); return None
+
+@st.cache_resource
+def get_shared_tts_stream_server() -> Optional[TTSStreamServer]:
+    try: return TTSStreamServer().start()
+    except OSError as e:
+        print(f"ENGINE WARNING: Could not start the TTS stream server: {e}"); return None
+
+@st.cache_resource
+def get_shared_microphone() -> Tuple[Optional[Any], threading.Lock]:
+    """The server's microphone plus a lock: only one session can record at a time."""
     try:
-        async with client.audio.speech.with_streaming_response.create(
-            model="gpt-4o-mini-tts", voice=voice, input=text, response_format="pcm",
-        ) as response:
-            print(f"ENGINE: OpenAI TTS - Streaming audio with voice '{voice}'...")
-            await LocalAudioPlayer().play(response)
-        print("ENGINE: OpenAI TTS - Speech finished.")
-    except Exception as e: st.error(f"OpenAI TTS Streaming Error: {e}"); print(f"ENGINE ERROR: OpenAI TTS Streaming: {e}")
+        import speech_recognition as sr
+        microphone = sr.Microphone(); print("ENGINE: Microphone initialized.")
+    except Exception as e: microphone = None; print(f"ENGINE WARNING: Mic init failed: {e}.")
+    return microphone, threading.Lock()
+
+@contextmanager
+def use_shared_microphone(microphone: Any) -> Iterator[Optional[Any]]:
+    """Opens the shared microphone, or yields None if another session is recording right now."""
+    microphone_lock = st.session_state.microphone_lock
+    if not microphone_lock.acquire(blocking=False): yield None; return
+    try:
+        with microphone as source: yield source
+    finally: microphone_lock.release()
+
+# Sessions only hold references to the shared objects; the Recognizer is per session (it adapts its energy threshold)
+def ensure_voice_output_ready():
+    if 'openai_client' not in st.session_state: st.session_state.openai_client = get_shared_openai_client()
+    st.session_state.tts_stream_server = get_shared_tts_stream_server()
+
+def ensure_voice_input_ready():
+    if 'microphone' in st.session_state: return
+    st.session_state.microphone, st.session_state.microphone_lock = get_shared_microphone()
+    if st.session_state.microphone is not None:
+        import speech_recognition as sr
+        st.session_state.recognizer = sr.Recognizer()
+    st.session_state.openai_client = get_shared_openai_client()
+
+# --- Per-session engine state: token usage of this session's study ---
+if 'study_usage' not in st.session_state: st.session_state.study_usage = StudyUsage()
+bind_study_usage(st.session_state.study_usage) # Every rerun may execute on another thread
 
 # --- UNIFIED TTS CONTROLLER FUNCTION ---
-def speak_text_controller(text_to_speak: str):
+def speak_text_controller(text_to_speak: str) -> Optional[str]:
+    """Registers the text with the TTS stream server; returns the stream path for render_speech_player (None if unavailable)."""
     provider = st.session_state.get('tts_provider_selection', "Google TTS (free)") # Use a new key for provider selection
-    if not st.session_state.get("enable_voice_output", False) or not text_to_speak: return
+    if not st.session_state.get("enable_voice_output", False) or not text_to_speak: return None
+    tts_stream_server = st.session_state.get("tts_stream_server")
+    if tts_stream_server is None: st.warning("TTS stream server not available. Cannot play audio."); return None
 
     print(f"ENGINE: TTS ({provider}) - Preparing: '{text_to_speak[:50]}...'")
-    try:
-        if provider == "Google TTS (free)":
-            with st.spinner(f"gTTS generating audio..."):
-                tts = gTTS(text=text_to_speak, lang='de', slow=False)
-                audio_fp = io.BytesIO(); tts.write_to_fp(audio_fp); audio_fp.seek(0)
-            st.audio(audio_fp, format="audio/mp3") 
-            print(f"ENGINE: TTS (gTTS) - Audio player rendered.")
-        
-        elif provider == "OpenAI TTS":
-            openai_client = st.session_state.get("openai_async_client")
-            selected_openai_voice = st.session_state.get("openai_tts_voice_selection", "alloy")
-            if openai_client:
-                with st.spinner(f"OpenAI TTS generating audio..."):
-                    asyncio.run(play_openai_tts_stream_async(openai_client, text_to_speak, selected_openai_voice))
-            else:
-                st.warning("OpenAI TTS client not initialized. Cannot play audio.")
-                print("ENGINE ERROR: OpenAI TTS client not ready.")
-        
-        # Add ElevenLabs here if you re-integrate it, using a similar pattern
-        # elif provider == "ElevenLabs":
-            # ... elevenlabs logic ...
+    if provider == "OpenAI TTS":
+        openai_client = st.session_state.get("openai_client")
+        if not openai_client:
+            st.warning("OpenAI TTS client not initialized. Cannot play audio."); print("ENGINE ERROR: OpenAI TTS client not ready."); return None
+        synthesize = openai_speech(openai_client, st.session_state.get("openai_tts_voice_selection", "alloy"))
+    else: synthesize = gtts_speech()
+    # Add ElevenLabs here if you re-integrate it: any function text -> iterator of MP3 bytes works
+    return tts_stream_server.register(text_to_speak, synthesize)
 
-    except Exception as e: st.error(f"TTS Error ({provider}): {e}"); print(f"ENGINE ERROR: TTS failed ({provider}): {e}")
+def render_speech_player(stream_path: str):
+    """<audio> element that plays the stream while it arrives. The URL is resolved in the browser (same host, TTS port) unless set."""
+    tts_stream_server = st.session_state.get("tts_stream_server")
+    if not tts_stream_server or not stream_path: return
+    components.html(f"""
+        <audio id="speech" controls autoplay preload="auto" style="width: 100%"></audio>
+        <script>
+            let base = {json.dumps(tts_stream_server.public_url)};
+            if (!base) {{
+                let page = window.location;
+                try {{ page = window.parent.location; }} catch (e) {{}}
+                base = `${{page.protocol}}//${{page.hostname}}:{tts_stream_server.port}`;
+            }}
+            document.getElementById("speech").src = base + {json.dumps(stream_path)};
+        </script>""", height=60)
 
 
 # --- STT Function ---
 def recognize_speech_from_mic_sr() -> str:
+    import speech_recognition as sr
     recognizer = st.session_state.get("recognizer")
     microphone = st.session_state.get("microphone")
     if not recognizer or not microphone: st.warning("STT components not ready."); return ""
     transcribed_text = ""
-    with microphone as source:
+    with use_shared_microphone(microphone) as source:
+        if source is None: st.warning("The microphone is in use by another session."); return ""
         recognizer.pause_threshold = 1.5 
         st.toast("Adjusting for ambient noise...", icon="🤫")
         try:
@@ -114,6 +167,7 @@ def recognize_speech_from_mic_sr() -> str:
 
 # --- Function for Speech-to-Text using OpenAI Whisper API ---
 def recognize_speech_from_mic_openai() -> str:
+    import speech_recognition as sr
     microphone = st.session_state.get("microphone")
     # Use the standard OpenAI client for STT
     openai_s2t_client = st.session_state.get("openai_client") 
@@ -129,7 +183,8 @@ def recognize_speech_from_mic_openai() -> str:
     transcribed_text = ""
     recognizer = st.session_state.get("recognizer", sr.Recognizer())
     
-    with microphone as source:
+    with use_shared_microphone(microphone) as source:
+        if source is None: st.warning("The microphone is in use by another session."); return ""
         recognizer.pause_threshold = 1.5 
         st.toast("Adjusting for ambient noise...", icon="🤫")
         try:
@@ -180,11 +235,14 @@ if 'openai_tts_voice_selection' not in st.session_state: st.session_state.openai
 if 'ai_formalized_interview_guide' not in st.session_state: st.session_state.ai_formalized_interview_guide = ""
 if 'ai_formalized_catalog_guide' not in st.session_state: st.session_state.ai_formalized_catalog_guide = ""
 if 'exploratory_transcript' not in st.session_state: st.session_state.exploratory_transcript = []
+if 'exploratory_fanout_results' not in st.session_state: st.session_state.exploratory_fanout_results = []
+if 'exploratory_fanout_k' not in st.session_state: st.session_state.exploratory_fanout_k = 1
 if 'selected_persona_expl_dict' not in st.session_state: st.session_state.selected_persona_expl_dict = {}
 if 'selected_persona_name_expl' not in st.session_state: st.session_state.selected_persona_name_expl = "N/A"
 if 'exploratory_summary_proposed_structure' not in st.session_state: st.session_state.exploratory_summary_proposed_structure = ""
 if 'user_confirmed_edited_exploratory_summary' not in st.session_state: st.session_state.user_confirmed_edited_exploratory_summary = ""
 if 'exploratory_interview_turn_count' not in st.session_state: st.session_state.exploratory_interview_turn_count = 0
+if 'exploratory_memory' not in st.session_state: st.session_state.exploratory_memory = InterviewMemory()
 if 'current_interviewer_question' not in st.session_state: st.session_state.current_interviewer_question = ""
 if 'human_answer_input' not in st.session_state: st.session_state.human_answer_input = ""
 if 'human_expert_name_title_input' not in st.session_state: st.session_state.human_expert_name_title_input = ""
@@ -195,27 +253,93 @@ if 'user_edited_interview_guide' not in st.session_state: st.session_state.user_
 if 'user_edited_catalog_guide' not in st.session_state: st.session_state.user_edited_catalog_guide = ""
 if 'editing_formalized_guides' not in st.session_state: st.session_state.editing_formalized_guides = False
 if 'num_structured_interviews_target' not in st.session_state: st.session_state.num_structured_interviews_target = 1 
+if 'structured_panel_size' not in st.session_state: st.session_state.structured_panel_size = 1
+if 'simulation_mode' not in st.session_state: st.session_state.simulation_mode = SIMULATION_MODE_TURN_BY_TURN
 if 'structured_interview_results_list' not in st.session_state: st.session_state.structured_interview_results_list = []
 if 'personas_used_in_study' not in st.session_state: st.session_state.personas_used_in_study = []
-if 'final_catalog_output' not in st.session_state: st.session_state.final_catalog_output = ""
+if 'final_catalog_output' not in st.session_state: st.session_state.final_catalog_output = None # ArtifactHandle of the catalog markdown
+if 'catalog_extraction_failed_for' not in st.session_state: st.session_state.catalog_extraction_failed_for = None # Catalog handle whose factor extraction failed
 if 'tokens_input' not in st.session_state: st.session_state.tokens_input = 0
 if 'tokens_output' not in st.session_state: st.session_state.tokens_output = 0
+if 'token_usage_by_model' not in st.session_state: st.session_state.token_usage_by_model = {}
+if 'token_cost_usd' not in st.session_state: st.session_state.token_cost_usd = 0.0
 if 'error_message' not in st.session_state: st.session_state.error_message = None
 if 'max_turns_per_interview_gui' not in st.session_state: st.session_state.max_turns_per_interview_gui = MAX_INTERVIEW_TURNS_DEFAULT 
 if 'metrics_expanded' not in st.session_state: st.session_state.metrics_expanded = True 
 if 'enable_voice_output' not in st.session_state: st.session_state.enable_voice_output = False
 if 'enable_voice_input' not in st.session_state: st.session_state.enable_voice_input = False
+if 'use_persona_library' not in st.session_state: st.session_state.use_persona_library = True
+if 'use_prior_studies' not in st.session_state: st.session_state.use_prior_studies = True
+if 'prior_study_indexed_catalog' not in st.session_state: st.session_state.prior_study_indexed_catalog = None
+if 'study_budget_usd' not in st.session_state: st.session_state.study_budget_usd = 0.0
+if 'budget_fallback_model_only' not in st.session_state: st.session_state.budget_fallback_model_only = False
+if 'catalog_synthesis_mode' not in st.session_state: st.session_state.catalog_synthesis_mode = "Incremental (merge per interview)"
+if 'catalog_state' not in st.session_state: st.session_state.catalog_state = new_catalog_state()
+if 'pipeline_summaries' not in st.session_state: st.session_state.pipeline_summaries = True
+if 'study_pipeline' not in st.session_state: st.session_state.study_pipeline = StudyPipeline()
+if 'speculative_formalization' not in st.session_state: st.session_state.speculative_formalization = None
+if 'delphi_result' not in st.session_state: st.session_state.delphi_result = None
+if 'cross_impact_result' not in st.session_state: st.session_state.cross_impact_result = None
+if 'study_export_zip' not in st.session_state: st.session_state.study_export_zip = None
 if 'study_context' not in st.session_state: 
     st.session_state.study_context = {}
 
-if 'openai_client' not in st.session_state:
-    try:
-        st.session_state.openai_client = OpenAI() # Uses OPENAI_API_KEY env var
-        print("ENGINE: Standard OpenAI client initialized.")
-    except Exception as e:
-        st.session_state.openai_client = None
-        print(f"ENGINE WARNING: Could not initialize standard OpenAI client: {e}")
 
+# --- Phase transitions (button callbacks: state changes before the rerun the click triggers anyway, no extra st.rerun()) ---
+HUMAN_INTERVIEW_TURN_PHASES = ("exploratory_human_awaits_question", "human_providing_answer_exploratory")
+
+def go_to_phase(phase: str, **session_updates: Any):
+    for key, value in session_updates.items(): st.session_state[key] = value
+    st.session_state.current_phase = phase
+
+def start_exploratory_round():
+    reset_session_tokens_for_engine(); st.session_state.exploratory_transcript = []; st.session_state.exploratory_fanout_results = []
+    st.session_state.exploratory_summary_proposed_structure = ""; st.session_state.error_message = None
+    st.session_state.exploratory_interview_turn_count = 0; st.session_state.current_interviewer_question = ""
+    st.session_state.selected_persona_expl_dict = {}; st.session_state.selected_persona_name_expl = "N/A"
+    st.session_state.personas_used_in_study = []; st.session_state.question_just_spoken = False
+    st.session_state.exploratory_memory = InterviewMemory()
+    if st.session_state.interview_mode == "AI Persona Simulation": st.session_state.current_phase = "exploratory_running_ai"
+    elif st.session_state.interview_mode == "Human as Interviewee (Text Input)":
+        name_to_use = st.session_state.human_expert_name_title_input if st.session_state.human_expert_name_title_input else "Human Expert (You)"
+        st.session_state.selected_persona_name_expl = name_to_use
+        st.session_state.current_phase = "exploratory_human_awaits_question"
+
+def ensure_speculative_formalization():
+    # Formalizes the AI-proposed summary while the user reviews it; confirming reuses or cheaply reconciles the result
+    speculation = st.session_state.speculative_formalization
+    if speculation is None or not speculation.matches(st.session_state.study_context, st.session_state.exploratory_summary_proposed_structure):
+        st.session_state.speculative_formalization = SpeculativeFormalization(st.session_state.study_context, st.session_state.exploratory_summary_proposed_structure)
+
+def apply_edited_guides(saved: bool):
+    # Callbacks run before the text areas are re-created, so the edits are read from the widget state
+    st.session_state.user_edited_interview_guide = st.session_state.get(f"user_edit_interview_guide_key_{st.session_state.run_id}", st.session_state.user_edited_interview_guide)
+    st.session_state.user_edited_catalog_guide = st.session_state.get(f"user_edit_catalog_guide_key_{st.session_state.run_id}", st.session_state.user_edited_catalog_guide)
+    st.session_state.study_context["InterviewGuideStructure_DEFINED"] = st.session_state.user_edited_interview_guide
+    st.session_state.study_context["DesiredOutputCatalogStructureGuidance_DEFINED"] = st.session_state.user_edited_catalog_guide
+    if saved:
+        st.session_state.ai_formalized_interview_guide = st.session_state.user_edited_interview_guide 
+        st.session_state.ai_formalized_catalog_guide = st.session_state.user_edited_catalog_guide
+    st.session_state.editing_formalized_guides = False; st.session_state.current_phase = "structure_confirmed_for_structured_rounds"
+
+def cancel_guide_edits():
+    st.session_state.user_edited_interview_guide = st.session_state.ai_formalized_interview_guide 
+    st.session_state.user_edited_catalog_guide = st.session_state.ai_formalized_catalog_guide
+    st.session_state.editing_formalized_guides = False
+
+def reset_study():
+    st.session_state.clear(); st.session_state.run_id = 0; st.session_state.current_phase = "initial_setup"
+    st.session_state.study_context = {}; st.session_state.interview_mode = "AI Persona Simulation"
+    st.session_state.max_turns_per_interview_gui = MAX_INTERVIEW_TURNS_DEFAULT
+    st.session_state.num_structured_interviews_target = 1; st.session_state.metrics_expanded = True
+    st.session_state.human_expert_name_title_input = ""
+    st.session_state.human_expert_role_input = ""
+    st.session_state.human_expert_expertise_input = ""
+    st.session_state.human_expert_perspective_input = ""
+    st.session_state.user_edited_interview_guide = ""
+    st.session_state.user_edited_catalog_guide = ""
+    st.session_state.exploratory_summary_proposed_structure ="" 
+    st.session_state.human_answer_input = ""
 
 # --- Callback function for "Submit My Answer" button ---
 def process_human_answer_and_advance():
@@ -226,6 +350,7 @@ def process_human_answer_and_advance():
         })
         st.session_state.exploratory_interview_turn_count += 1
         st.session_state.current_interviewer_question = "" 
+        st.session_state.question_just_spoken = False # Allow TTS for the next question
         if st.session_state.exploratory_interview_turn_count < st.session_state.max_turns_per_interview_gui:
             st.session_state.current_phase = "exploratory_human_awaits_question"
         else: 
@@ -233,23 +358,366 @@ def process_human_answer_and_advance():
         st.session_state.human_answer_input = "" 
     else: pass
 
+# --- Callback for "Record Answer": runs before the widgets are created, so it may fill the answer text area ---
+def record_human_answer():
+    with st.spinner("Listening for your answer..."):
+        transcribed_text = ""
+        if st.session_state.stt_provider == "OpenAI STT (Whisper based)" and st.session_state.get("openai_client"):
+            transcribed_text = recognize_speech_from_mic_openai()
+        else: # Default to Google
+            if st.session_state.stt_provider != "Google Web Speech":
+                 st.warning(f"STT Provider '{st.session_state.stt_provider}' selected but not ready, falling back to Google.")
+            transcribed_text = recognize_speech_from_mic_sr()
+    if transcribed_text: st.session_state.human_answer_input = transcribed_text
+
+# --- Human interview turn loop (fragment: a turn reruns only this unit, whatever the transcript/results size) ---
+def human_expert_profile_text() -> str:
+    human_profile_text_for_prompt = "Human Expert Profile:\n"
+    if st.session_state.human_expert_name_title_input: human_profile_text_for_prompt += f"- Name/Title: {st.session_state.human_expert_name_title_input}\n"
+    if st.session_state.human_expert_role_input: human_profile_text_for_prompt += f"- Role: {st.session_state.human_expert_role_input}\n"
+    if st.session_state.human_expert_expertise_input: human_profile_text_for_prompt += f"- Stated Expertise: {st.session_state.human_expert_expertise_input}\n"
+    if st.session_state.human_expert_perspective_input: human_profile_text_for_prompt += f"- Stated Perspective: {st.session_state.human_expert_perspective_input}\n"
+    if human_profile_text_for_prompt == "Human Expert Profile:\n": human_profile_text_for_prompt = "Human expert has not provided a specific profile.\n"
+    return human_profile_text_for_prompt
+
+def fetch_next_interviewer_question() -> bool:
+    with st.spinner("Interviewer AI is formulating a question..."):
+        interviewer_prompt = (
+            f"OverallStudyTopic: {st.session_state.study_context['OverallStudyTopic']}\nTargetYear: {st.session_state.study_context['TargetYear']}\n"
+            f"{st.session_state.exploratory_memory.render(st.session_state.exploratory_transcript)}\n"
+            f"You are conducting an 'exploratory_interview' with a human expert. {human_expert_profile_text()}"
+            f"Your general guidance is: \"{st.session_state.study_context.get('InterviewGuideExploratoryPrompt','')}\"\n"
+            f"Based on the history and profile, what is your next question? Output ONLY the question."
+        )
+        interviewer_response_obj = _run_agent_internal(InterviewerAgent, interviewer_prompt) 
+    if not (interviewer_response_obj and interviewer_response_obj.final_output): return False
+    st.session_state.current_interviewer_question = interviewer_response_obj.final_output.strip()
+    st.session_state.current_phase = "human_providing_answer_exploratory"
+    return True
+
+@st.fragment
+def human_interview_turn_fragment():
+    """
+    One turn: fetch the question (inline, no extra rerun), speak it, take the answer. Submitting reruns only this
+    fragment; the full page reruns once the interview leaves the turn loop (transcript processing or an error).
+    """
+    bind_study_usage(st.session_state.study_usage) # Fragment reruns skip the page-level binding
+    if st.session_state.current_phase not in HUMAN_INTERVIEW_TURN_PHASES: st.rerun()
+    if st.session_state.exploratory_interview_turn_count >= st.session_state.max_turns_per_interview_gui:
+        st.session_state.current_phase = "exploratory_processing_human_transcript"; st.rerun()
+    st.subheader(f"Exploratory Interview (Expert: {st.session_state.selected_persona_name_expl})")
+    st.markdown(f"Turn {st.session_state.exploratory_interview_turn_count + 1} of {st.session_state.max_turns_per_interview_gui}")
+    if st.session_state.current_phase == "exploratory_human_awaits_question" and not st.session_state.current_interviewer_question:
+        st.session_state.exploratory_memory.observe(st.session_state.exploratory_transcript) # Folds older turns while the expert answers
+        if not fetch_next_interviewer_question():
+            st.session_state.error_message = "Interviewer AI failed to generate question."; st.session_state.current_phase = "initial_setup"; st.rerun()
+
+    # Only proceed if there's an actual question to answer
+    if st.session_state.current_interviewer_question:
+        st.markdown(f"**Interviewer AI asks:**")
+        st.info(st.session_state.current_interviewer_question) # Display the question text
+        
+        # Register the speech only once per question; the player stays on reruns (replays use the kept audio)
+        if st.session_state.get("enable_voice_output", False):
+            if not st.session_state.get("question_just_spoken", False):
+                st.session_state.question_speech_path = speak_text_controller(st.session_state.current_interviewer_question)
+                st.session_state.question_just_spoken = True
+            render_speech_player(st.session_state.get("question_speech_path"))
+
+        st.markdown("---") # Visual separator before answer area
+
+        # --- STT Button and Text Area for human answer ---
+        if st.session_state.get("enable_voice_input", False) and st.session_state.get("microphone"):
+            st.button("🎤 Record Answer", key=f"record_btn_{st.session_state.run_id}_{st.session_state.exploratory_interview_turn_count}", on_click=record_human_answer)
+        
+        # Text area for answer is always present in this phase if there's a question
+        st.text_area("Your Answer (type, or record then edit):", height=150, key="human_answer_input")
+        
+        # The callback records the answer and advances the phase; the click's fragment rerun then fetches the next question
+        if st.button("Submit My Answer", 
+                     key=f"submit_human_ans_btn_{st.session_state.run_id}_{st.session_state.exploratory_interview_turn_count}",
+                     on_click=process_human_answer_and_advance): 
+            if not st.session_state.get("human_answer_input","").strip() and st.session_state.current_phase == "human_providing_answer_exploratory":
+                 st.warning("Please provide an answer before submitting.")
+            
+    else: 
+        st.warning("Waiting for Interviewer AI's question... Attempting to fetch/re-fetch.")
+        st.button("Retry Fetching Question", key=f"retry_fetch_q_in_provide_answer_{st.session_state.run_id}", on_click=go_to_phase,
+                  args=("exploratory_human_awaits_question",), kwargs={"current_interviewer_question": "", "question_just_spoken": False})
+
+# --- Study artifacts (session_state holds ArtifactHandles; results, catalog and export zip live in the artifact store) ---
+def store_interview_result(key: str, result: Dict[str, Any]):
+    """Appends the handle of an interview result to the list st.session_state[key]; the header fields stay in its meta."""
+    persona = result.get("selected_persona_dict") or {}
+    st.session_state[key].append(store_artifact(result, interview_id=result.get("interview_id"), selected_persona_name=result.get("selected_persona_name", "N/A"),
+                                                role_title=persona.get("role_title", persona.get("Role", "")), selected_persona_dict=persona))
+
+def stored_results(key: str) -> List[Dict[str, Any]]:
+    return [result for result in (load_artifact(handle) for handle in st.session_state[key]) if result is not None]
+
+def final_catalog_markdown() -> str:
+    return load_artifact(st.session_state.final_catalog_output, "")
+
+# --- Incremental catalog helpers ---
+def merge_result_into_incremental_catalog(results_structured: Dict[str, Any]):
+    if st.session_state.catalog_synthesis_mode != "Incremental (merge per interview)" or not (results_structured.get("summary") or "").strip(): return
+    # Through the pipeline's lock: background merges of earlier interviews may still be running
+    st.session_state.study_pipeline.merge_into_catalog(st.session_state.catalog_state, st.session_state.study_context, results_structured["summary"],
+                                                       results_structured.get("interview_id", results_structured.get("selected_persona_name", "")),
+                                                       results_structured.get("selected_persona_name", ""))
+
+def collect_background_summaries(wait: bool = False):
+    """Moves finished background summaries (in interview order) into structured_interview_results_list."""
+    pipeline = st.session_state.study_pipeline
+    for results_structured in (pipeline.collect_all() if wait else pipeline.collect_ready()):
+        if results_structured.get("error_message"): st.error(f"Error (interview {results_structured.get('selected_persona_name', '')}): {results_structured['error_message']}"); continue
+        store_interview_result("structured_interview_results_list", results_structured) # Catalog delta was already merged in the background
+    sync_token_usage_from_engine()
+
+def add_structured_interview_to_catalog():
+    st.session_state.num_structured_interviews_target += 1 # Ratings / impacts below refer to the old catalog
+    st.session_state.delphi_result = None; st.session_state.cross_impact_result = None; st.session_state.study_export_zip = None
+    st.session_state.current_phase = "structure_confirmed_for_structured_rounds"
+
+# --- Delphi rating rounds & cross-impact analysis ---
+def factors_from_catalog() -> Optional[List[Dict[str, Any]]]:
+    """Catalog factors; None (error shown) if a markdown-only catalog could not be structured. A failed extraction is not repeated."""
+    catalog_handle = st.session_state.final_catalog_output
+    if not st.session_state.catalog_state["systemebenen"] and catalog_handle: # Full re-synthesis: structure the markdown once
+        if st.session_state.catalog_extraction_failed_for != catalog_handle:
+            catalog_state = catalog_state_from_markdown(st.session_state.study_context, final_catalog_markdown())
+            if catalog_state is not None: st.session_state.catalog_state = catalog_state
+            else: st.session_state.catalog_extraction_failed_for = catalog_handle
+        if st.session_state.catalog_extraction_failed_for == catalog_handle:
+            st.error("The factors could not be extracted from the final catalog (use 'Retry Factor Extraction')."); return None
+    return list_catalog_factors(st.session_state.catalog_state)
+
+def display_delphi_rating_rounds():
+    st.header("Phase 4: Delphi Rating Rounds")
+    rating_personas = [handle.meta["selected_persona_dict"] for handle in st.session_state.structured_interview_results_list if handle.meta.get("selected_persona_dict")]
+    st.caption(f"The {len(rating_personas)} interviewed personas rate every catalog factor for relevance and likelihood (one call per persona and round); "
+               f"further rounds with group feedback only cover factors without consensus.")
+    max_rounds = st.number_input("Max. rating rounds:", min_value=1, max_value=5, value=MAX_DELPHI_ROUNDS_DEFAULT, key=f"delphi_max_rounds_{st.session_state.run_id}")
+    if st.button("Run Delphi Rating Rounds", key=f"delphi_rounds_btn_{st.session_state.run_id}", disabled=not rating_personas):
+        with st.spinner("Personas are rating the catalog factors..."):
+            factors = factors_from_catalog()
+            if factors: st.session_state.delphi_result = run_delphi_rating_rounds(st.session_state.study_context, factors, rating_personas, int(max_rounds))
+            elif factors is not None: st.error("The catalog contains no factors.")
+            sync_token_usage_from_engine()
+    delphi_result = st.session_state.delphi_result
+    if delphi_result:
+        st.caption(" | ".join(f"Round {r['round']}: {r['rated_factors']} factors rated, {r['converged']} converged" for r in delphi_result["rounds"]))
+        st.dataframe(delphi_result_rows(delphi_result), use_container_width=True)
+
+def display_cross_impact_analysis():
+    st.header("Phase 5: Cross-Impact Analysis")
+    st.caption("One call per source factor rates its impact (-3..+3) on all other factors; active/passive sums, influence ranking "
+               "and consistent scenario bundles are computed locally.")
+    if st.button("Run Cross-Impact Analysis", key=f"cross_impact_btn_{st.session_state.run_id}"):
+        with st.spinner("Eliciting the cross-impact matrix..."):
+            factors = factors_from_catalog()
+            if factors is not None and len(factors) >= 2: st.session_state.cross_impact_result = run_cross_impact_analysis(st.session_state.study_context, factors)
+            elif factors is not None: st.error("The catalog needs at least two factors for a cross-impact analysis.")
+            sync_token_usage_from_engine()
+    cross_impact = st.session_state.cross_impact_result
+    if cross_impact:
+        if any(cross_impact["failed_rows"]): st.warning(f"{sum(cross_impact['failed_rows'])} matrix row(s) could not be elicited and count as 0.")
+        st.markdown("**Influence ranking:**")
+        st.dataframe(influence_ranking_rows(cross_impact), use_container_width=True)
+        st.markdown("**Consistent scenario bundles (key factors):**")
+        st.markdown(scenario_bundle_markdown(cross_impact) or "No scenario bundles found.")
+        with st.expander("View Cross-Impact Matrix", expanded=False):
+            factor_names = [f"F{i + 1} {f.get('faktorname', '')}" for i, f in enumerate(cross_impact["factors"])]
+            st.dataframe({"Source \\ Target": factor_names, **{name: cross_impact["matrix"][:, j] for j, name in enumerate(factor_names)}}, use_container_width=True)
+
+# --- Study data export ---
+def display_study_export():
+    st.subheader("Export Study Data")
+    st.caption("Writes interviews, personas, factors, per-interview mentions and per-call usage/latency as Parquet or Arrow "
+               "(one file per table and study), plus gzip JSONL transcripts, for analytics across studies.")
+    export_format = st.selectbox("Export format:", options=list(EXPORT_FORMATS), key=f"export_format_{st.session_state.run_id}")
+    if st.button("Export Study Data", key=f"export_btn_{st.session_state.run_id}"):
+        with st.spinner("Exporting study data..."):
+            factors_from_catalog(); sync_token_usage_from_engine() # Structures a markdown-only catalog first
+            exploratory_results = stored_results("exploratory_fanout_results") or None
+            if st.session_state.exploratory_transcript:
+                exploratory_results = {"interview_id": f"{st.session_state.study_context.get('StudyId', '')}-exploratory",
+                                       "selected_persona_name": st.session_state.selected_persona_name_expl,
+                                       "selected_persona_dict": st.session_state.selected_persona_expl_dict,
+                                       "transcript": st.session_state.exploratory_transcript,
+                                       "summary": st.session_state.user_confirmed_edited_exploratory_summary or st.session_state.exploratory_summary_proposed_structure}
+            paths = export_study(st.session_state.study_context.get("StudyId"), stored_results("structured_interview_results_list"),
+                                 st.session_state.catalog_state, st.session_state.study_usage, exploratory_results, export_format=export_format)
+            zip_buffer = io.BytesIO()
+            with zipfile.ZipFile(zip_buffer, "w") as zip_file:
+                for table_name, path in paths.items(): zip_file.write(path, arcname=f"{table_name}/{os.path.basename(path)}")
+            st.session_state.study_export_zip = store_artifact(zip_buffer.getvalue())
+        st.success(f"Exported {len(paths)} tables of study `{st.session_state.study_context.get('StudyId', '')}`.")
+    if st.session_state.study_export_zip:
+        st.download_button("Download Study Data (.zip)", data=load_artifact(st.session_state.study_export_zip, b""), mime="application/zip",
+                           file_name=f"study_{st.session_state.study_context.get('StudyId', 'export')}.zip")
+
+# --- Prior study index ---
+def index_study_for_retrieval():
+    """Adds the finished catalog's factors and the interview summaries to the local index used by later studies."""
+    prior_study_index = get_prior_study_index()
+    if prior_study_index is None: return
+    summaries = [res["summary"] for res in stored_results("structured_interview_results_list") if res.get("summary", "").strip()]
+    exploratory_summary = st.session_state.user_confirmed_edited_exploratory_summary or st.session_state.exploratory_summary_proposed_structure
+    if exploratory_summary: summaries.insert(0, exploratory_summary)
+    prior_study_index.index_study(st.session_state.study_context, st.session_state.catalog_state, summaries)
+
+# --- AI interview simulation mode ---
+SIMULATION_MODE_LABELS = {
+    SIMULATION_MODE_TURN_BY_TURN: "Turn by turn (2 calls per turn)",
+    SIMULATION_MODE_SINGLE_SHOT: "Single-shot (1 call per interview)",
+    SIMULATION_MODE_SINGLE_SHOT_WITH_SUMMARY: "Single-shot incl. summary",
+}
+
+def apply_simulation_mode():
+    """on_change callback: later AI interviews of the running study use the new mode, too."""
+    if st.session_state.study_context: st.session_state.study_context["SimulationMode"] = st.session_state.simulation_mode
+
+# --- Pre-flight cost estimate & budget ---
+@st.cache_data(ttl=300, show_spinner=False)
+def cached_calibration() -> Dict[str, Any]:
+    return calibrate()
+
+def study_shape_options() -> Dict[str, Any]:
+    """Estimator options that follow from the sidebar settings."""
+    return {"incremental_catalog": st.session_state.catalog_synthesis_mode == "Incremental (merge per interview)",
+            "exploratory_interviews": st.session_state.exploratory_fanout_k if st.session_state.interview_mode == "AI Persona Simulation" else 1,
+            "panel_size": st.session_state.structured_panel_size}
+
+def apply_budget_fit(study_context: Dict[str, Any]):
+    """on_click callback: degrades the study shape (turns, interviews, model) until its estimate fits the budget."""
+    fit = fit_study_to_budget(study_context, st.session_state.study_budget_usd, st.session_state.num_structured_interviews_target,
+                              st.session_state.max_turns_per_interview_gui, calibration=cached_calibration(), **study_shape_options())
+    st.session_state.num_structured_interviews_target = fit["num_structured_interviews"]
+    st.session_state.max_turns_per_interview_gui = fit["max_turns"]
+    st.session_state.budget_fallback_model_only = fit["fallback_model_only"]
+    apply_study_budget()
+
+def apply_study_budget():
+    """Passes the sidebar budget (and the cheapest-model fallback of a fit) to the engine; also while a study is running."""
+    bind_study_usage(st.session_state.study_usage) # Callbacks run before the script body binds the session's usage
+    set_study_budget(st.session_state.study_budget_usd or None, degrade_at=0.0 if st.session_state.budget_fallback_model_only else BUDGET_DEGRADE_AT_FRACTION,
+                     expected_output_tokens=cached_calibration()["output_tokens"])
+
+def change_study_budget():
+    st.session_state.budget_fallback_model_only = False # A fit only holds for the budget it was made for
+    apply_study_budget()
+
+def display_preflight_estimate(study_context: Dict[str, Any]):
+    calibration = cached_calibration()
+    shape = (study_context, st.session_state.num_structured_interviews_target, st.session_state.max_turns_per_interview_gui)
+    estimate = estimate_study(*shape, calibration=calibration, **study_shape_options())
+    parallel_s = estimate_study(*shape, parallel_interviews=MAX_PARALLEL_INTERVIEWS, calibration=calibration, **study_shape_options())["wall_clock_s"]
+    with st.expander(f"Estimated cost: ${estimate['cost_usd']:.4f} (~{estimate['wall_clock_s'] / 60:.0f} min)"):
+        st.caption(f"{estimate['calls']} calls, ~{estimate['input_tokens']:,} input / ~{estimate['output_tokens']:,} output tokens. "
+                   f"Wall clock ~{estimate['wall_clock_s'] / 60:.1f} min sequential, ~{parallel_s / 60:.1f} min with parallel interviews "
+                   f"(AI interviewees; human answers not included). "
+                   + (f"Calibrated from {calibration['calibrated_from_calls']} earlier calls." if calibration['calibrated_from_calls'] else "Default calibration (no usage history yet)."))
+        st.caption("Per agent: " + " | ".join(f"`{agent}`: {usage['calls']}x, {usage['input_tokens']:,} in" for agent, usage in estimate["by_agent"].items()))
+    if st.session_state.study_budget_usd and estimate["cost_usd"] > st.session_state.study_budget_usd:
+        st.warning(f"The estimate exceeds the budget of ${st.session_state.study_budget_usd:.2f}.")
+        st.button("Fit study to budget", key="fit_budget_btn", on_click=apply_budget_fit, args=(study_context,),
+                  help="Fewer turns first, then fewer interviews, then the cheapest model for all agents.")
+    if st.session_state.study_budget_usd and st.session_state.budget_fallback_model_only: st.caption("All agents will run on the cheapest model to stay within budget.")
+
+# --- HELPER FUNCTIONS FOR METRICS ---
+METRICS_REFRESH_SECONDS = 5
+
+def sync_token_usage_from_engine():
+    usage = get_session_usage()
+    st.session_state.tokens_input = usage["input_tokens"]; st.session_state.tokens_output = usage["output_tokens"]
+    st.session_state.token_usage_by_model = usage["by_model"]; st.session_state.token_cost_usd = usage["cost_usd"]
+
+def token_cost_metrics_panel():
+    usage = st.session_state.study_usage.snapshot() # Read directly: fragment reruns do not pass the page-level bind_study_usage
+    with st.expander("View Session Token Usage & Estimated Cost", expanded=st.session_state.metrics_expanded):
+        if usage["input_tokens"] == 0 and usage["output_tokens"] == 0:
+            st.caption("No tokens used yet in this run/phase.")
+        else:
+            total_cost_usd = usage["cost_usd"]
+            usd_to_eur_rate = 0.88 
+            total_cost_eur = total_cost_usd * usd_to_eur_rate
+            col1, col2, col3 = st.columns(3)
+            with col1: st.metric(label="Input Tokens", value=f"{usage['input_tokens']:,}")
+            with col2: st.metric(label="Output Tokens", value=f"{usage['output_tokens']:,}")
+            with col3: st.metric(label="Total Est. Cost (EUR)", value=f"€{total_cost_eur:.5f}")
+            budget = usage["budget"]
+            if budget and budget["state"] != "ok":
+                st.warning(f"Study budget (${budget['max_cost_usd']:.2f}) {'used up' if budget['state'] == 'exhausted' else 'nearly used up'}: "
+                           f"{budget['degraded_calls']} call(s) moved to the fallback model, {budget['skipped_calls']} skipped, interviews end early.")
+            if usage["by_model"]:
+                st.caption("Per model: " + " | ".join(
+                    f"`{model}`: {model_usage['calls']} calls, {model_usage['input_tokens']:,} in / {model_usage['output_tokens']:,} out"
+                    for model, model_usage in usage["by_model"].items()))
 
-# --- HELPER FUNCTION TO DISPLAY METRICS ---
 def display_token_cost_metrics():
+    """Own fragment: while human interview turns rerun only their fragment, the panel refreshes itself on a timer."""
     if st.session_state.study_context.get("OverallStudyTopic"):
-        with st.expander("View Session Token Usage & Estimated Cost", expanded=st.session_state.metrics_expanded):
-            if st.session_state.tokens_input == 0 and st.session_state.tokens_output == 0:
-                st.caption("No tokens used yet in this run/phase.")
-            else:
-                cost_input = (st.session_state.tokens_input / 1_000_000) * INPUT_PRICE_PER_MILLION_TOKENS
-                cost_output = (st.session_state.tokens_output / 1_000_000) * OUTPUT_PRICE_PER_MILLION_TOKENS
-                total_cost_usd = cost_input + cost_output
-                usd_to_eur_rate = 0.88 
-                total_cost_eur = total_cost_usd * usd_to_eur_rate
-                col1, col2, col3 = st.columns(3)
-                with col1: st.metric(label="Input Tokens", value=f"{st.session_state.tokens_input:,}")
-                with col2: st.metric(label="Output Tokens", value=f"{st.session_state.tokens_output:,}")
-                with col3: st.metric(label="Total Est. Cost (EUR)", value=f"€{total_cost_eur:.5f}")
+        run_every = METRICS_REFRESH_SECONDS if st.session_state.current_phase in HUMAN_INTERVIEW_TURN_PHASES else None
+        st.fragment(token_cost_metrics_panel, run_every=run_every)()
+
+# --- Results Browser (lazy rendering) ---
+RESULTS_PAGE_SIZE = 5
+TRANSCRIPT_ROWS_PER_PAGE = 10
+
+@st.cache_data(show_spinner=False, max_entries=32) # Process-wide; only the interviews currently toggled open need to stay cached
+def render_transcript_rows(cache_key: str, _transcript: List[Dict[str, Any]]) -> List[Tuple[bool, str]]:
+    """(is_event, markdown) per transcript row. Cached by cache_key only, so it must be unique across sessions (interview id or transcript_cache_key)."""
+    rows = []
+    for qa_idx, qa in enumerate(_transcript):
+        if "event" in qa: rows.append((True, f"Event: {qa['event']}"))
+        else: rows.append((False, f"**Q{qa_idx+1}:** {qa['question']}\n\n**A{qa_idx+1}:** {qa['answer']}"))
+    return rows
+
+def transcript_cache_key(prefix: str, transcript: List[Dict[str, Any]]) -> str:
+    """Key for a transcript that is still growing (the cache is shared by all sessions): study id plus a content hash."""
+    digest = hashlib.sha256(json.dumps(transcript, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    return f"{prefix}_{st.session_state.study_context.get('StudyId', '')}_{digest}"
+
+def display_transcript_window(cache_key: str, transcript: List[Dict[str, Any]], page_widget_key: str):
+    rows = render_transcript_rows(cache_key, transcript)
+    start = 0
+    if len(rows) > TRANSCRIPT_ROWS_PER_PAGE:
+        num_pages = math.ceil(len(rows) / TRANSCRIPT_ROWS_PER_PAGE)
+        page = st.number_input(f"Transcript page (1-{num_pages}):", min_value=1, max_value=num_pages, value=1, key=page_widget_key)
+        start = (page - 1) * TRANSCRIPT_ROWS_PER_PAGE
+    for is_event, markdown_text in rows[start:start + TRANSCRIPT_ROWS_PER_PAGE]:
+        if is_event: st.caption(markdown_text)
+        else: st.markdown(markdown_text)
+
+def display_interview_details(interview_key: str, interview_data: Dict[str, Any]):
+    persona_dict_struct = interview_data.get('selected_persona_dict', {})
+    if persona_dict_struct:
+        with st.popover("View Full Persona JSON"): st.json(persona_dict_struct)
+        st.markdown("---")
+    st.markdown("**Transcript:**")
+    if interview_data.get("transcript"):
+        display_transcript_window(interview_key, interview_data["transcript"], f"transcript_page_{interview_key}")
+    st.markdown("**Summary from this round (AI Generated):**")
+    st.text_area(f"summary_round_struct_{interview_key}", value=interview_data.get("summary", ""), height=200, disabled=True, key=f"summary_disp_struct_{interview_key}", label_visibility="collapsed")
+
+@st.fragment # Paging and toggling an interview rerun only the browser, not the page
+def display_results_browser(result_handles: List[ArtifactHandle], key_prefix: str = "results"):
+    """One page of interview headers (from the handles); a result is only loaded and rendered when toggled open."""
+    num_pages = max(1, math.ceil(len(result_handles) / RESULTS_PAGE_SIZE))
+    page = 1
+    if num_pages > 1: # Defaults to the last page so the newest interview is visible
+        page = st.number_input(f"Results page (1-{num_pages}):", min_value=1, max_value=num_pages, value=num_pages, key=f"{key_prefix}_page_{st.session_state.run_id}_{num_pages}")
+    first_index = (page - 1) * RESULTS_PAGE_SIZE
+    for i, handle in enumerate(result_handles[first_index:first_index + RESULTS_PAGE_SIZE], start=first_index):
+        role_title = handle.meta.get("role_title", "")
+        interview_key = handle.meta.get("interview_id") or handle.digest[:16] # Unique across sessions: keys the shared transcript cache
+        toggle_title = f"Interview #{i+1} (Persona: {handle.meta.get('selected_persona_name', 'N/A')}{f' - {role_title}' if role_title else ''})"
+        if st.toggle(toggle_title, value=(i == len(result_handles) - 1), key=f"show_interview_{interview_key}"):
+            interview_data = load_artifact(handle)
+            with st.container(border=True):
+                if interview_data is None: st.warning("The stored results of this interview are no longer available.")
+                else: display_interview_details(interview_key, interview_data)
 
 # --- Default Detailed Values ---
 DEFAULT_NEWSPAPER_TOPIC = "Die Zukunft der Tageszeitung in Deutschland bis 2047"
@@ -275,13 +743,17 @@ with st.sidebar:
 
     st.markdown("---")
     st.radio("Exploratory Interview Mode:", options=["AI Persona Simulation", "Human as Interviewee (Text Input)"], key="interview_mode")
+    if st.session_state.interview_mode == "AI Persona Simulation":
+        st.number_input("Exploratory Interviews (run in parallel):", min_value=1, max_value=6, step=1, key="exploratory_fanout_k",
+                        help="More than one: diverse personas are interviewed concurrently and their proposed Systemebenen are merged by frequency and similarity.")
     
     if st.session_state.interview_mode == "Human as Interviewee (Text Input)":
         st.checkbox("Enable Voice Output (Interviewer AI speaks)", key="enable_voice_output")
         if st.session_state.enable_voice_output:
+            ensure_voice_output_ready()
             # TTS Provider Selection
             tts_options = ["Google TTS (free)"]
-            if st.session_state.get("openai_async_client"): tts_options.append("OpenAI TTS")
+            if st.session_state.get("openai_client"): tts_options.append("OpenAI TTS")
             # if st.session_state.get("elevenlabs_client"): tts_options.append("ElevenLabs")
 
             current_tts_provider = st.session_state.get("tts_provider_selection", tts_options[0])
@@ -291,43 +763,59 @@ with st.sidebar:
             
             st.selectbox("TTS Voice Provider:", options=tts_options, index=current_tts_idx, key="tts_provider_selection")
 
-            if st.session_state.tts_provider_selection == "OpenAI TTS" and st.session_state.get("openai_async_client"):
+            if st.session_state.tts_provider_selection == "OpenAI TTS" and st.session_state.get("openai_client"):
                 openai_voice_options = ["alloy", "ash", "echo", "fable", "nova", "onyx", "shimmer"]
                 st.selectbox("OpenAI TTS Voice:",options=openai_voice_options,key="openai_tts_voice_selection")
             # elif st.session_state.tts_provider_selection == "ElevenLabs":
             #     st.text_input("ElevenLabs Voice ID:", key="elevenlabs_voice_id_input")
         
-        if st.session_state.get("microphone"):
-            st.checkbox("Enable Voice Input (Record your answer)", key="enable_voice_input")
-            if st.session_state.enable_voice_input:
-                stt_options = ["Google Web Speech"]
-                if st.session_state.get("openai_client"): # Check for the standard OpenAI client
-                    stt_options.append("OpenAI STT (Whisper based)")
-                # Add ElevenLabs STT option if wanted in future
-                # if st.session_state.get("elevenlabs_client_for_stt"):
-                #     stt_options.append("ElevenLabs STT")
-
-                current_stt_provider = st.session_state.get("stt_provider", stt_options[0])
-                if current_stt_provider not in stt_options: current_stt_provider = stt_options[0]
-                try: current_stt_idx = stt_options.index(current_stt_provider)
-                except ValueError: current_stt_idx = 0; 
-                
-                st.selectbox(
-                    "STT Provider:", 
-                    options=stt_options, 
-                    index=current_stt_idx,
-                    key="stt_provider" 
-                )
-                if st.session_state.stt_provider == "OpenAI STT":
-                    st.caption("Using OpenAI for Speech-to-Text.")
-                # --- END STT PROVIDER SELECTION ---
-        else:
+        st.checkbox("Enable Voice Input (Record your answer)", key="enable_voice_input")
+        if st.session_state.enable_voice_input: ensure_voice_input_ready()
+        if st.session_state.enable_voice_input and st.session_state.get("microphone"):
+            stt_options = ["Google Web Speech"]
+            if st.session_state.get("openai_client"): # Check for the standard OpenAI client
+                stt_options.append("OpenAI STT (Whisper based)")
+            # Add ElevenLabs STT option if wanted in future
+            # if st.session_state.get("elevenlabs_client_for_stt"):
+            #     stt_options.append("ElevenLabs STT")
+
+            current_stt_provider = st.session_state.get("stt_provider", stt_options[0])
+            if current_stt_provider not in stt_options: current_stt_provider = stt_options[0]
+            try: current_stt_idx = stt_options.index(current_stt_provider)
+            except ValueError: current_stt_idx = 0; 
+            
+            st.selectbox(
+                "STT Provider:", 
+                options=stt_options, 
+                index=current_stt_idx,
+                key="stt_provider" 
+            )
+            if st.session_state.stt_provider == "OpenAI STT":
+                st.caption("Using OpenAI for Speech-to-Text.")
+            # --- END STT PROVIDER SELECTION ---
+        elif st.session_state.enable_voice_input:
             st.caption("🎤 Voice input disabled (Mic issue).")
-            st.session_state.enable_voice_input = False
             
     st.markdown("---")
+    st.checkbox("Reuse personas from persona library", key="use_persona_library", help="Look up matching personas from earlier studies before generating new ones.")
+    st.checkbox("Use factors from earlier studies", key="use_prior_studies", help="Add the most relevant factors of earlier catalogs (local index) to the structure formalization and the interview guide.")
+    st.radio("Catalog Synthesis:", options=["Incremental (merge per interview)", "Full re-synthesis"], key="catalog_synthesis_mode",
+             help="Incremental mode only merges interviews that are not yet in the catalog; full re-synthesis rebuilds it from all summaries.")
+    st.checkbox("Summarize in background while the next interview runs", key="pipeline_summaries")
     st.slider("Max Interview Turns (per interview):", min_value=1, max_value=10, key="max_turns_per_interview_gui")
     st.number_input("Target # of Structured Interviews:", min_value=1, max_value=10, step=1, key="num_structured_interviews_target")
+    st.number_input("Personas per Panel (focus group):", min_value=1, max_value=MAX_PANEL_SIZE, step=1, key="structured_panel_size",
+                    help="More than 1: the parallel run interviews the personas in panels. One responder call per turn answers for the whole panel; each persona still gets its own transcript and summary.")
+    st.selectbox("AI Interview Simulation:", options=list(SIMULATION_MODE_LABELS), format_func=SIMULATION_MODE_LABELS.get, key="simulation_mode",
+                 on_change=apply_simulation_mode,
+                 help="Single-shot: one call writes the whole AI persona interview (optionally with its summary) instead of alternating "
+                      "interviewer and persona calls. Much faster for large screening runs, less adaptive. Panels always run turn by turn.")
+    st.number_input("Study Budget (USD, 0 = no limit):", min_value=0.0, step=0.05, format="%.2f", key="study_budget_usd", on_change=change_study_budget,
+                    help="Above 80% of the budget agents fall back to the cheapest model and interviews end early; calls that would exceed it are skipped.")
+    display_preflight_estimate(st.session_state.study_context if st.session_state.study_context.get("OverallStudyTopic") else
+                               {"OverallStudyTopic": topic, "TargetYear": int(target_year), "GeographicalScope": geo_scope,
+                                "KeyObjectives_Wofuer": objectives, "PersonaRequirementsGuidance": persona_reqs,
+                                "PredefinedPersonas": PREDEFINED_PERSONAS_NEWSPAPER_TOPIC, "SimulationMode": st.session_state.simulation_mode})
 
     if st.button("Set Study & Start New Run", key="update_settings_btn"):
         st.session_state.run_id += 1 
@@ -337,21 +825,27 @@ with st.sidebar:
             "PredefinedPersonas": PREDEFINED_PERSONAS_NEWSPAPER_TOPIC, 
             "InterviewGuideExploratoryPrompt": "Conduct an open-ended, exploratory interview on the OverallStudyTopic...",
             "SummarizerGuidanceExploratory": "This is an initial exploratory interview for the StudyTopic. Analyze the transcript to identify 4-6 MAJOR THEMATIC CATEGORIES...",
-            "InterviewGuideStructure_DEFINED": None, "DesiredOutputCatalogStructureGuidance_DEFINED": None 
+            "InterviewGuideStructure_DEFINED": None, "DesiredOutputCatalogStructureGuidance_DEFINED": None,
+            "UsePersonaLibrary": st.session_state.use_persona_library, "UsePriorStudies": st.session_state.use_prior_studies, "StudyId": uuid.uuid4().hex[:12],
+            "SimulationMode": st.session_state.simulation_mode
         }
-        keys_to_reset_to_empty_list = ['exploratory_transcript', 'structured_interview_results_list', 'personas_used_in_study']
+        keys_to_reset_to_empty_list = ['exploratory_transcript', 'exploratory_fanout_results', 'structured_interview_results_list', 'personas_used_in_study']
         keys_to_reset_to_empty_string = ['selected_persona_name_expl', 'exploratory_summary_proposed_structure', 
                                          'user_confirmed_edited_exploratory_summary', 'current_interviewer_question', 'human_answer_input', 
                                          'human_expert_name_title_input', 'human_expert_role_input', 'human_expert_expertise_input',
                                          'human_expert_perspective_input', 'ai_formalized_interview_guide', 'ai_formalized_catalog_guide', 
-                                         'user_edited_interview_guide', 'user_edited_catalog_guide', 'final_catalog_output']
+                                         'user_edited_interview_guide', 'user_edited_catalog_guide']
         for key_to_reset in keys_to_reset_to_empty_list: st.session_state[key_to_reset] = []
         for key_to_reset in keys_to_reset_to_empty_string: st.session_state[key_to_reset] = ""
         st.session_state.selected_persona_expl_dict = {}; st.session_state.exploratory_interview_turn_count = 0
         st.session_state.editing_formalized_guides = False; st.session_state.tokens_input = 0
         st.session_state.tokens_output = 0; st.session_state.error_message = None
+        st.session_state.token_usage_by_model = {}; st.session_state.token_cost_usd = 0.0
+        st.session_state.catalog_state = new_catalog_state(); st.session_state.study_pipeline = StudyPipeline(); st.session_state.speculative_formalization = None; st.session_state.delphi_result = None; st.session_state.cross_impact_result = None; st.session_state.study_export_zip = None
+        st.session_state.final_catalog_output = None; st.session_state.catalog_extraction_failed_for = None
         st.session_state.current_phase = "initial_setup" 
         st.session_state.question_just_spoken = False
+        apply_study_budget()
         st.success("Study settings updated. Ready for new run."); st.rerun()
 
 # --- Main Area ---
@@ -377,17 +871,23 @@ if st.session_state.current_phase == "initial_setup":
             st.text_area("Your Key Expertise Areas:", height=100, key="human_expert_expertise_input")
             st.text_area("Your general perspective:", height=100, key="human_expert_perspective_input")
         st.markdown("---") 
-    if st.button("Run Exploratory Interview Round", key=f"start_expl_btn_{st.session_state.run_id}"):
-        reset_session_tokens_for_engine(); st.session_state.exploratory_transcript = []
-        st.session_state.exploratory_summary_proposed_structure = ""; st.session_state.error_message = None
-        st.session_state.exploratory_interview_turn_count = 0; st.session_state.current_interviewer_question = ""
-        st.session_state.selected_persona_expl_dict = {}; st.session_state.selected_persona_name_expl = "N/A"
-        st.session_state.personas_used_in_study = []
-        if st.session_state.interview_mode == "AI Persona Simulation": st.session_state.current_phase = "exploratory_running_ai"; st.rerun() 
-        elif st.session_state.interview_mode == "Human as Interviewee (Text Input)":
-            name_to_use = st.session_state.human_expert_name_title_input if st.session_state.human_expert_name_title_input else "Human Expert (You)"
-            st.session_state.selected_persona_name_expl = name_to_use
-            st.session_state.current_phase = "exploratory_human_awaits_question"; st.rerun()
+    if st.session_state.error_message: st.error(f"Error: {st.session_state.error_message}")
+    st.button("Run Exploratory Interview Round", key=f"start_expl_btn_{st.session_state.run_id}", on_click=start_exploratory_round)
+
+if st.session_state.current_phase == "exploratory_running_ai" and st.session_state.exploratory_fanout_k > 1:
+    with st.spinner(f"Running {st.session_state.exploratory_fanout_k} AI exploratory interviews in parallel and merging their proposals..."):
+        fanout = run_exploratory_fanout(st.session_state.study_context.copy(), st.session_state.exploratory_fanout_k, st.session_state.max_turns_per_interview_gui)
+    for res in fanout["results"]:
+        if res.get("transcript"): store_interview_result("exploratory_fanout_results", res)
+    st.session_state.exploratory_summary_proposed_structure = fanout["summary"]
+    st.session_state.user_confirmed_edited_exploratory_summary = fanout["summary"]
+    st.session_state.selected_persona_name_expl = ", ".join(handle.meta["selected_persona_name"] for handle in st.session_state.exploratory_fanout_results)
+    st.session_state.personas_used_in_study.extend(handle.meta["selected_persona_dict"] for handle in st.session_state.exploratory_fanout_results if handle.meta["selected_persona_dict"])
+    sync_token_usage_from_engine()
+    st.session_state.error_message = fanout["error_message"]
+    if st.session_state.error_message: st.error(f"Error: {st.session_state.error_message}"); st.session_state.current_phase = "initial_setup"
+    else: st.session_state.current_phase = "exploratory_done"; st.success(f"{len(st.session_state.exploratory_fanout_results)} AI exploratory interviews complete!")
+    st.rerun()
 
 if st.session_state.current_phase == "exploratory_running_ai":
     with st.spinner("Running AI exploratory interview and summarization..."):
@@ -398,95 +898,15 @@ if st.session_state.current_phase == "exploratory_running_ai":
     st.session_state.selected_persona_name_expl = results.get("selected_persona_name", "N/A")
     st.session_state.selected_persona_expl_dict = results.get("selected_persona_dict", {})
     if results.get("selected_persona_dict"): st.session_state.personas_used_in_study.append(results.get("selected_persona_dict"))
-    st.session_state.tokens_input = session_input_tokens; st.session_state.tokens_output = session_output_tokens
+    sync_token_usage_from_engine()
     st.session_state.error_message = results.get("error_message")
     if st.session_state.error_message: st.error(f"Error: {st.session_state.error_message}"); st.session_state.current_phase = "initial_setup"
     else: st.session_state.current_phase = "exploratory_done"; st.success("AI Exploratory round complete!")
     st.rerun() 
 
 
-if st.session_state.current_phase == "exploratory_human_awaits_question":
-    st.subheader(f"Exploratory Interview (Expert: {st.session_state.selected_persona_name_expl})")
-    st.markdown(f"Turn {st.session_state.exploratory_interview_turn_count + 1} of {st.session_state.max_turns_per_interview_gui}")
-    if st.session_state.exploratory_interview_turn_count < st.session_state.max_turns_per_interview_gui:
-        if not st.session_state.current_interviewer_question: 
-            with st.spinner("Interviewer AI is formulating a question..."):
-                human_profile_text_for_prompt = "Human Expert Profile:\n"
-                if st.session_state.human_expert_name_title_input: human_profile_text_for_prompt += f"- Name/Title: {st.session_state.human_expert_name_title_input}\n"
-                if st.session_state.human_expert_role_input: human_profile_text_for_prompt += f"- Role: {st.session_state.human_expert_role_input}\n"
-                if st.session_state.human_expert_expertise_input: human_profile_text_for_prompt += f"- Stated Expertise: {st.session_state.human_expert_expertise_input}\n"
-                if st.session_state.human_expert_perspective_input: human_profile_text_for_prompt += f"- Stated Perspective: {st.session_state.human_expert_perspective_input}\n"
-                if human_profile_text_for_prompt == "Human Expert Profile:\n": human_profile_text_for_prompt = "Human expert has not provided a specific profile.\n"
-                interviewer_prompt = (
-                    f"OverallStudyTopic: {st.session_state.study_context['OverallStudyTopic']}\nTargetYear: {st.session_state.study_context['TargetYear']}\n"
-                    f"ConversationHistory: {json.dumps(st.session_state.exploratory_transcript, indent=2, ensure_ascii=False)}\n"
-                    f"You are conducting an 'exploratory_interview' with a human expert. {human_profile_text_for_prompt}"
-                    f"Your general guidance is: \"{st.session_state.study_context.get('InterviewGuideExploratoryPrompt','')}\"\n"
-                    f"Based on the history and profile, what is your next question? Output ONLY the question."
-                )
-                interviewer_response_obj = _run_agent_internal(InterviewerAgent, interviewer_prompt) 
-                st.session_state.tokens_input = session_input_tokens; st.session_state.tokens_output = session_output_tokens
-                if interviewer_response_obj and interviewer_response_obj.final_output:
-                    st.session_state.current_interviewer_question = interviewer_response_obj.final_output.strip()
-                    st.session_state.current_phase = "human_providing_answer_exploratory" 
-                else: st.error("Interviewer AI failed to generate question."); st.session_state.current_phase = "initial_setup"
-                st.rerun() 
-    else: st.info("Max turns reached. Processing transcript..."); st.session_state.current_phase = "exploratory_processing_human_transcript"; st.rerun()
-
-if st.session_state.current_phase == "human_providing_answer_exploratory":
-    st.subheader(f"Exploratory Interview (Expert: {st.session_state.selected_persona_name_expl})")
-    st.markdown(f"Turn {st.session_state.exploratory_interview_turn_count + 1} of {st.session_state.max_turns_per_interview_gui}")
-
-    # Only proceed if there's an actual question to answer
-    if st.session_state.current_interviewer_question:
-        st.markdown(f"**Interviewer AI asks:**")
-        st.info(st.session_state.current_interviewer_question) # Display the question text
-        
-        # Speak only if voice output is enabled AND this specific question hasn't been spoken yet
-        if st.session_state.get("enable_voice_output", False) and not st.session_state.get("question_just_spoken", False):
-            speak_text_controller(st.session_state.current_interviewer_question)
-            st.session_state.question_just_spoken = True
-
-        st.markdown("---") # Visual separator before answer area
-
-        # --- STT Button and Text Area for human answer ---
-        if st.session_state.get("enable_voice_input", False) and st.session_state.get("microphone"):
-            if st.button("🎤 Record Answer", key=f"record_btn_{st.session_state.run_id}_{st.session_state.exploratory_interview_turn_count}"):
-                with st.spinner("Listening for your answer..."):
-                    transcribed_text = ""
-                    if st.session_state.stt_provider == "OpenAI STT (Whisper based)" and st.session_state.get("openai_client"):
-                        transcribed_text = recognize_speech_from_mic_openai()
-                    else: # Default to Google
-                        if st.session_state.stt_provider != "Google Web Speech":
-                             st.warning(f"STT Provider '{st.session_state.stt_provider}' selected but not ready, falling back to Google.")
-                        transcribed_text = recognize_speech_from_mic_sr()
-                if transcribed_text:
-                    st.session_state.human_answer_input = transcribed_text # Update the session state for the text_area
-                    st.rerun() # Rerun to populate the text_area with transcribed text
-        
-        # Text area for answer is always present in this phase if there's a question
-        st.text_area("Your Answer (type, or record then edit):", height=150, key="human_answer_input")
-        
-        # Submit button with on_click callback
-        if st.button("Submit My Answer", 
-                     key=f"submit_human_ans_btn_{st.session_state.run_id}_{st.session_state.exploratory_interview_turn_count}",
-                     on_click=process_human_answer_and_advance): 
-            # This block executes after the on_click callback (if one was triggered).
-            # The callback is responsible for changing the phase.
-            # If human_answer_input was empty, callback might not have changed phase.
-            if not st.session_state.get("human_answer_input","").strip() and st.session_state.current_phase == "human_providing_answer_exploratory":
-                 st.warning("Please provide an answer before submitting.")
-            # If the callback DID process an answer and changed the phase, Streamlit's rerun (triggered by state change)
-            # will take care of moving to the next UI state. No explicit rerun here is needed.
-            
-    else: 
-        st.warning("Waiting for Interviewer AI's question... Attempting to fetch/re-fetch.")
-        if st.button("Retry Fetching Question", key=f"retry_fetch_q_in_provide_answer_{st.session_state.run_id}"):
-            st.session_state.current_interviewer_question = "" 
-            st.session_state.question_just_spoken = False # Allow TTS for new question
-            st.session_state.current_phase = "exploratory_human_awaits_question"
-            st.rerun()
-
+if st.session_state.current_phase in HUMAN_INTERVIEW_TURN_PHASES:
+    human_interview_turn_fragment()
 
 if st.session_state.current_phase == "exploratory_processing_human_transcript":
     if st.session_state.exploratory_transcript:
@@ -499,19 +919,15 @@ if st.session_state.current_phase == "exploratory_processing_human_transcript":
                 f"This was an EXPLORATORY interview. Instruct SummarizerAgent to perform an 'exploratory_summary' using 'SummarizerGuidanceExploratory'. Output ONLY this instruction."
             )
             manager_response_obj = _run_agent_internal(ManagerAgent, prompt_for_manager_s5)
-            st.session_state.tokens_input = session_input_tokens; st.session_state.tokens_output = session_output_tokens
+            sync_token_usage_from_engine()
             if manager_response_obj and manager_response_obj.final_output:
                 instruction_for_summarizer = manager_response_obj.final_output
-                full_prompt_for_summarizer_human = (
-                    f"{instruction_for_summarizer}\n\n"
-                    f"OverallStudyTopic: {st.session_state.study_context.get('OverallStudyTopic')}\nTargetYear: {st.session_state.study_context.get('TargetYear')}\n"
-                    f"Guidance: {st.session_state.study_context.get('SummarizerGuidanceExploratory')}\n\n"
-                    f"Interview Transcript to Summarize:\n```json\n{json.dumps(st.session_state.exploratory_transcript, indent=2, ensure_ascii=False)}\n```\nPlease provide summary."
-                )
-                summarizer_response_obj = _run_agent_internal(SummarizerAgent, full_prompt_for_summarizer_human)
-                st.session_state.tokens_input = session_input_tokens; st.session_state.tokens_output = session_output_tokens
-                if summarizer_response_obj and summarizer_response_obj.final_output:
-                    st.session_state.exploratory_summary_proposed_structure = summarizer_response_obj.final_output
+                # Long human-led interviews are summarized in parallel chunks (see SUMMARY_CHUNK_TURNS in the engine)
+                proposed_structure = summarize_interview_transcript(instruction_for_summarizer, st.session_state.study_context,
+                                                                    st.session_state.exploratory_transcript, True)
+                sync_token_usage_from_engine()
+                if proposed_structure:
+                    st.session_state.exploratory_summary_proposed_structure = proposed_structure
                     st.session_state.user_confirmed_edited_exploratory_summary = st.session_state.exploratory_summary_proposed_structure
                     st.session_state.current_phase = "exploratory_done"; st.success("Summary from your interview ready!")
                 else: st.error("Summarizer AI failed."); st.session_state.current_phase = "initial_setup"
@@ -534,22 +950,29 @@ if st.session_state.current_phase in ["exploratory_done", "structure_formalizing
                         if st.session_state.human_expert_expertise_input: st.markdown(f"**Expertise:** {st.session_state.human_expert_expertise_input}")
                         if st.session_state.human_expert_perspective_input: st.markdown(f"**Perspective:** {st.session_state.human_expert_perspective_input}")
             with st.expander("View Full Exploratory Transcript", expanded=False):
-                for i, qa in enumerate(st.session_state.exploratory_transcript):
-                    if "event" in qa: st.caption(f"Event: {qa['event']}")
-                    else: st.markdown(f"**Q{i+1}:** {qa['question']}\n\n**A{i+1}:** {qa['answer']}")
+                display_transcript_window(transcript_cache_key("exploratory", st.session_state.exploratory_transcript),
+                                          st.session_state.exploratory_transcript, f"expl_transcript_page_{st.session_state.run_id}")
+            st.markdown("---")
+        elif st.session_state.exploratory_fanout_results:
+            st.subheader(f"Exploratory Interviews ({len(st.session_state.exploratory_fanout_results)} personas, merged proposal below)")
+            display_results_browser(st.session_state.exploratory_fanout_results, key_prefix="exploratory")
             st.markdown("---")
     if st.session_state.current_phase == "exploratory_done" or st.session_state.current_phase == "structure_formalizing": 
         if st.session_state.exploratory_summary_proposed_structure:
+            if st.session_state.current_phase == "exploratory_done": ensure_speculative_formalization()
             st.subheader("AI-Proposed Thematic Structure (Review & Edit)")
             st.session_state.user_confirmed_edited_exploratory_summary = st.text_area(
                 "Edit the AI's proposed structure/summary below...", value=st.session_state.exploratory_summary_proposed_structure, 
                 height=300, key=f"user_confirmed_edited_exploratory_summary_key_{st.session_state.run_id}")
-            if st.button("Confirm Edited Summary & AI Formalize Guides", key=f"confirm_expl_summary_btn_{st.session_state.run_id}"):
-                st.session_state.current_phase = "structure_formalizing"; st.rerun()
+            st.button("Confirm Edited Summary & AI Formalize Guides", key=f"confirm_expl_summary_btn_{st.session_state.run_id}",
+                      on_click=go_to_phase, args=("structure_formalizing",))
     if st.session_state.current_phase == "structure_formalizing":
         with st.spinner("AI is formalizing the guides based on your confirmed summary..."):
-            formalized_guides = formalize_structure_from_exploratory_summary(st.session_state.study_context, st.session_state.user_confirmed_edited_exploratory_summary)
-            st.session_state.tokens_input = session_input_tokens; st.session_state.tokens_output = session_output_tokens
+            speculation = st.session_state.speculative_formalization
+            if speculation is not None: formalized_guides = speculation.resolve(st.session_state.study_context, st.session_state.user_confirmed_edited_exploratory_summary)
+            else: formalized_guides = formalize_structure_from_exploratory_summary(st.session_state.study_context, st.session_state.user_confirmed_edited_exploratory_summary)
+            st.session_state.speculative_formalization = None
+            sync_token_usage_from_engine()
         if formalized_guides and formalized_guides.get("InterviewGuideStructure_DEFINED") and formalized_guides.get("DesiredOutputCatalogStructureGuidance_DEFINED"):
             st.session_state.ai_formalized_interview_guide = formalized_guides["InterviewGuideStructure_DEFINED"]
             st.session_state.ai_formalized_catalog_guide = formalized_guides["DesiredOutputCatalogStructureGuidance_DEFINED"]
@@ -565,40 +988,36 @@ if st.session_state.current_phase in ["exploratory_done", "structure_formalizing
         st.session_state.user_edited_catalog_guide = st.text_area("Catalog Output Guidance (Edit if needed):", value=st.session_state.user_edited_catalog_guide, height=150, key=f"user_edit_catalog_guide_key_{st.session_state.run_id}", disabled=is_disabled_for_editing)
         col1, col2, col3 = st.columns([0.35, 0.35, 0.3])
         with col1:
-            if is_disabled_for_editing:
-                if st.button("Edit Guides ✒️", use_container_width=True): st.session_state.editing_formalized_guides = True; st.rerun()
-            else:
-                if st.button("✅ Save Edited Guides", type="primary", use_container_width=True):
-                    st.session_state.study_context["InterviewGuideStructure_DEFINED"] = st.session_state.user_edited_interview_guide
-                    st.session_state.study_context["DesiredOutputCatalogStructureGuidance_DEFINED"] = st.session_state.user_edited_catalog_guide
-                    st.session_state.ai_formalized_interview_guide = st.session_state.user_edited_interview_guide 
-                    st.session_state.ai_formalized_catalog_guide = st.session_state.user_edited_catalog_guide
-                    st.session_state.editing_formalized_guides = False; st.session_state.current_phase = "structure_confirmed_for_structured_rounds"; st.success("Guides Saved!"); st.rerun()
+            if is_disabled_for_editing: st.button("Edit Guides ✒️", use_container_width=True, on_click=go_to_phase, args=("structure_review_edit",), kwargs={"editing_formalized_guides": True})
+            else: st.button("✅ Save Edited Guides", type="primary", use_container_width=True, on_click=apply_edited_guides, args=(True,))
         with col2:
-            if not is_disabled_for_editing:
-                if st.button("❌ Cancel Edits", use_container_width=True):
-                    st.session_state.user_edited_interview_guide = st.session_state.ai_formalized_interview_guide 
-                    st.session_state.user_edited_catalog_guide = st.session_state.ai_formalized_catalog_guide
-                    st.session_state.editing_formalized_guides = False; st.rerun()
+            if not is_disabled_for_editing: st.button("❌ Cancel Edits", use_container_width=True, on_click=cancel_guide_edits)
         with col3:
-             if is_disabled_for_editing:
-                if st.button("➡️ Proceed w/ Current Guides", use_container_width=True):
-                    st.session_state.study_context["InterviewGuideStructure_DEFINED"] = st.session_state.user_edited_interview_guide 
-                    st.session_state.study_context["DesiredOutputCatalogStructureGuidance_DEFINED"] = st.session_state.user_edited_catalog_guide
-                    st.session_state.editing_formalized_guides = False
-                    st.session_state.current_phase = "structure_confirmed_for_structured_rounds"; st.rerun()
+             if is_disabled_for_editing: st.button("➡️ Proceed w/ Current Guides", use_container_width=True, on_click=apply_edited_guides, args=(False,))
 
 # PHASE 2: Structured Interview Round(s)
 if st.session_state.current_phase == "structure_confirmed_for_structured_rounds":
     st.markdown("---"); st.header("Phase 2: Structured Interview Round(s)")
     st.markdown("**Finalized Interview Guide (to be used):**"); st.text_area("Finalized Interview Guide Display:", value=st.session_state.study_context.get("InterviewGuideStructure_DEFINED","Not defined."), height=75, disabled=True, key=f"final_guide_disp_{st.session_state.run_id}")
     st.markdown("**Finalized Catalog Guidance (to be used):**"); st.text_area("Finalized Catalog Guidance Display:", value=st.session_state.study_context.get("DesiredOutputCatalogStructureGuidance_DEFINED","Not defined."), height=75, disabled=True, key=f"final_catalog_guide_disp_{st.session_state.run_id}")
-    num_done = len(st.session_state.structured_interview_results_list)
+    st.download_button("Download Study Context (for offline batch mode)", data=json.dumps(st.session_state.study_context, indent=2, ensure_ascii=False),
+                       file_name=f"study_context_{st.session_state.study_context.get('StudyId', 'study')}.json", mime="application/json",
+                       help="Run the structured interviews offline at ~50% cost: python delphibot_batch.py --study-context <file>")
+    collect_background_summaries()
+    num_pending = st.session_state.study_pipeline.pending_count()
+    num_done = len(st.session_state.structured_interview_results_list) + num_pending
     num_target = st.session_state.num_structured_interviews_target
     st.write(f"**Structured Interviews Completed: {num_done} / {num_target}**")
+    if num_pending:
+        st.caption(f"⏳ {num_pending} summary/summaries running in the background.")
+        if st.button("🔄 Refresh", key=f"refresh_pipeline_btn_{st.session_state.run_id}"): st.rerun()
     if num_done < num_target:
-        if st.button(f"Run Structured Interview #{num_done + 1} (AI Persona)", key=f"run_struct_int_btn_{st.session_state.run_id}_{num_done}"):
-            st.session_state.current_phase = "structured_interview_running"; st.rerun()
+        st.button(f"Run Structured Interview #{num_done + 1} (AI Persona)", key=f"run_struct_int_btn_{st.session_state.run_id}_{num_done}",
+                  on_click=go_to_phase, args=("structured_interview_running",))
+        if num_target - num_done > 1 and not num_pending:
+            parallel_label = (f"as Panels of up to {st.session_state.structured_panel_size}" if st.session_state.structured_panel_size > 1 else "in Parallel")
+            st.button(f"Run Remaining {num_target - num_done} Interviews {parallel_label} (Diverse AI Persona Pool)", key=f"run_struct_parallel_btn_{st.session_state.run_id}_{num_done}",
+                      on_click=go_to_phase, args=("structured_interviews_parallel_running",))
     elif num_target > 0 : 
         st.success(f"All {num_target} targeted structured interview round(s) complete!"); st.session_state.current_phase = "structured_interviews_done"; st.rerun()
     else: 
@@ -606,7 +1025,7 @@ if st.session_state.current_phase == "structure_confirmed_for_structured_rounds"
 
 # PHASE 2.5: Running a Structured Interview
 if st.session_state.current_phase == "structured_interview_running":
-    num_done_before_this_run = len(st.session_state.structured_interview_results_list)
+    num_done_before_this_run = len(st.session_state.structured_interview_results_list) + st.session_state.study_pipeline.pending_count()
     with st.spinner(f"Running structured interview round #{num_done_before_this_run + 1}..."):
         current_run_study_context = st.session_state.study_context.copy()
         current_run_study_context["roles_interviewed_so_far"] = [p.get("role_title", p.get("Role", "UnknownRole")) for p in st.session_state.personas_used_in_study if isinstance(p,dict)]
@@ -619,52 +1038,98 @@ if st.session_state.current_phase == "structured_interview_running":
         # <--- ENDE TEST-PRINT
 
         if not current_run_study_context.get("InterviewGuideStructure_DEFINED"): st.error("Critical Error: Interview Guide Structure is missing!"); st.stop()
-        results_structured = perform_study_phase(current_run_study_context, False, st.session_state.max_turns_per_interview_gui)
-        st.session_state.tokens_input = session_input_tokens; st.session_state.tokens_output = session_output_tokens
-        if results_structured.get("error_message"): st.error(f"Error: {results_structured['error_message']}")
-        else: 
-            st.session_state.structured_interview_results_list.append(results_structured)
-            if results_structured.get("selected_persona_dict"): st.session_state.personas_used_in_study.append(results_structured.get("selected_persona_dict"))
-            st.success(f"Structured interview round #{len(st.session_state.structured_interview_results_list)} complete!")
-        if len(st.session_state.structured_interview_results_list) < st.session_state.num_structured_interviews_target:
+        if st.session_state.pipeline_summaries:
+            # Only the interview runs in the foreground; its summary (and catalog delta) overlaps with the next interview
+            results_structured = conduct_interview_stage(current_run_study_context, False, st.session_state.max_turns_per_interview_gui)
+            sync_token_usage_from_engine()
+            if results_structured.get("error_message"): st.error(f"Error: {results_structured['error_message']}")
+            else:
+                if results_structured.get("selected_persona_dict"): st.session_state.personas_used_in_study.append(results_structured.get("selected_persona_dict"))
+                incremental_catalog_state = st.session_state.catalog_state if st.session_state.catalog_synthesis_mode == "Incremental (merge per interview)" else None
+                st.session_state.study_pipeline.submit_summary(results_structured, current_run_study_context, False, incremental_catalog_state)
+                st.success(f"Structured interview round #{num_done_before_this_run + 1} complete! Summarizing in the background.")
+        else:
+            results_structured = perform_study_phase(current_run_study_context, False, st.session_state.max_turns_per_interview_gui)
+            sync_token_usage_from_engine()
+            if results_structured.get("error_message"): st.error(f"Error: {results_structured['error_message']}")
+            else: 
+                store_interview_result("structured_interview_results_list", results_structured)
+                if results_structured.get("selected_persona_dict"): st.session_state.personas_used_in_study.append(results_structured.get("selected_persona_dict"))
+                merge_result_into_incremental_catalog(results_structured); sync_token_usage_from_engine()
+                st.success(f"Structured interview round #{len(st.session_state.structured_interview_results_list)} complete!")
+        if len(st.session_state.structured_interview_results_list) + st.session_state.study_pipeline.pending_count() < st.session_state.num_structured_interviews_target:
             st.session_state.current_phase = "structure_confirmed_for_structured_rounds" 
         else: st.session_state.current_phase = "structured_interviews_done"
         st.rerun()
 
-# Display results of ALL structured interviews
+# PHASE 2.5 (parallel): Persona pool + concurrent structured interviews
+if st.session_state.current_phase == "structured_interviews_parallel_running":
+    num_remaining = st.session_state.num_structured_interviews_target - len(st.session_state.structured_interview_results_list)
+    with st.spinner(f"Building a diverse persona pool and running {num_remaining} structured interviews in parallel..."):
+        current_run_study_context = st.session_state.study_context.copy()
+        current_run_study_context["roles_interviewed_so_far"] = [p.get("role_title", p.get("Role", "UnknownRole")) for p in st.session_state.personas_used_in_study if isinstance(p,dict)]
+        if not current_run_study_context.get("InterviewGuideStructure_DEFINED"): st.error("Critical Error: Interview Guide Structure is missing!"); st.stop()
+        pool_personas = build_persona_pool(current_run_study_context, num_remaining, already_used=st.session_state.personas_used_in_study)
+        if st.session_state.structured_panel_size > 1:
+            parallel_results = run_panel_interviews(current_run_study_context, pool_personas, False, st.session_state.max_turns_per_interview_gui,
+                                                    st.session_state.structured_panel_size)
+        else: parallel_results = run_structured_interviews_concurrently(current_run_study_context, pool_personas, st.session_state.max_turns_per_interview_gui)
+        sync_token_usage_from_engine()
+    if not pool_personas: st.error("Error: PersonaManagerAgent failed to provide a persona pool.")
+    for results_structured in parallel_results:
+        if results_structured.get("error_message"): st.error(f"Error: {results_structured['error_message']}"); continue
+        store_interview_result("structured_interview_results_list", results_structured)
+        if results_structured.get("selected_persona_dict"): st.session_state.personas_used_in_study.append(results_structured.get("selected_persona_dict"))
+        merge_result_into_incremental_catalog(results_structured)
+    sync_token_usage_from_engine()
+    if len(st.session_state.structured_interview_results_list) < st.session_state.num_structured_interviews_target:
+        st.session_state.current_phase = "structure_confirmed_for_structured_rounds"
+    else: st.session_state.current_phase = "structured_interviews_done"
+    st.rerun()
+
+# Display results of ALL structured interviews (paginated; only toggled-open interviews are rendered)
 if st.session_state.structured_interview_results_list and st.session_state.current_phase in ["structure_confirmed_for_structured_rounds", "structured_interviews_done", "catalog_generating", "catalog_done"]:
     st.subheader(f"Results from Structured Interview Round(s):")
-    for i, interview_data in enumerate(st.session_state.structured_interview_results_list):
-        persona_name_struct = interview_data.get('selected_persona_name', 'N/A')
-        persona_dict_struct = interview_data.get('selected_persona_dict', {})
-        role_title = persona_dict_struct.get('role_title', persona_dict_struct.get('Role',''))
-        expander_title = f"Interview #{i+1} (Persona: {persona_name_struct}{f' - {role_title}' if role_title else ''})"
-        with st.expander(expander_title, expanded=(i == len(st.session_state.structured_interview_results_list) -1) ):
-            if persona_dict_struct:
-                with st.popover("View Full Persona JSON"): st.json(persona_dict_struct)
-                st.markdown("---")
-            st.markdown("**Transcript:**"); 
-            if interview_data.get("transcript"):
-                for qa_idx, qa in enumerate(interview_data["transcript"]):
-                    if "event" in qa: st.caption(f"Event: {qa['event']}")
-                    else: st.markdown(f"**Q{qa_idx+1}:** {qa['question']}\n\n**A{qa_idx+1}:** {qa['answer']}")
-            st.markdown("**Summary from this round (AI Generated):**"); 
-            st.text_area(f"summary_round_struct_{i+1}", value=interview_data.get("summary", ""), height=200, disabled=True, key=f"summary_disp_struct_{st.session_state.run_id}_{i}")
+    display_results_browser(st.session_state.structured_interview_results_list)
     st.markdown("---")
 
 # PHASE 3: Final Catalog Generation
+if st.session_state.current_phase == "structured_interviews_done" and st.session_state.study_pipeline.pending_count():
+    with st.spinner("Waiting for background summaries..."):
+        collect_background_summaries(wait=True)
+    if len(st.session_state.structured_interview_results_list) < st.session_state.num_structured_interviews_target:
+        st.session_state.current_phase = "structure_confirmed_for_structured_rounds" # A background summary failed; allow a rerun
+    st.rerun()
+
 if st.session_state.current_phase == "structured_interviews_done":
     if st.session_state.structured_interview_results_list or st.session_state.exploratory_summary_proposed_structure : 
         st.header("Phase 3: Final Catalog Generation")
-        if st.button("Generate Final Faktorenkatalog", key=f"gen_catalog_btn_{st.session_state.run_id}"):
-            st.session_state.current_phase = "catalog_generating"; st.rerun()
+        st.button("Generate Final Faktorenkatalog", key=f"gen_catalog_btn_{st.session_state.run_id}", on_click=go_to_phase, args=("catalog_generating",))
+
+if st.session_state.current_phase == "catalog_generating" and st.session_state.catalog_synthesis_mode == "Incremental (merge per interview)":
+    with st.spinner("Merging new interview summaries into the Faktorenkatalog..."):
+        if not st.session_state.structured_interview_results_list:
+            st.error("No structured interview summaries available for the incremental catalog."); st.session_state.current_phase = "structured_interviews_done"; st.rerun()
+        merge_failures = 0
+        for res in stored_results("structured_interview_results_list"):
+            if not (res.get("summary") and res.get("summary").strip()): continue
+            if not st.session_state.study_pipeline.merge_into_catalog(st.session_state.catalog_state, st.session_state.study_context, res["summary"],
+                                                                      res.get("interview_id", res.get("selected_persona_name", "")), res.get("selected_persona_name", "")):
+                merge_failures += 1
+        sync_token_usage_from_engine()
+        if merge_failures: st.warning(f"{merge_failures} interview summary/summaries could not be merged and will be retried next time.")
+        if st.session_state.catalog_state["systemebenen"]:
+            st.session_state.final_catalog_output = store_artifact(render_catalog_markdown(st.session_state.catalog_state, st.session_state.study_context))
+            st.session_state.current_phase = "catalog_done"
+        else: st.error("Failed to generate final Faktorenkatalog."); st.session_state.current_phase = "structured_interviews_done"
+        st.rerun()
 
 if st.session_state.current_phase == "catalog_generating":
     with st.spinner("Aggregating summaries and generating final Faktorenkatalog..."):
         valid_summaries = []
         if st.session_state.structured_interview_results_list:
              valid_summaries = [ f"Summary from interview with {res.get('selected_persona_name', 'Unknown Expert')}:\n{res.get('summary', '')}" 
-                for res in st.session_state.structured_interview_results_list if res.get("summary") and res.get("summary").strip()]
+                for res in stored_results("structured_interview_results_list") if res.get("summary") and res.get("summary").strip()]
         
         final_exploratory_summary_to_use = st.session_state.user_confirmed_edited_exploratory_summary if st.session_state.user_confirmed_edited_exploratory_summary else st.session_state.exploratory_summary_proposed_structure
 
@@ -681,34 +1146,36 @@ if st.session_state.current_phase == "catalog_generating":
                 st.session_state.current_phase = "structure_review_edit"; st.rerun()
             else:
                 final_catalog = generate_final_catalog_from_summaries(st.session_state.study_context, aggregated_summaries_text)
-                st.session_state.tokens_input = session_input_tokens; st.session_state.tokens_output = session_output_tokens
+                sync_token_usage_from_engine()
                 if final_catalog:
-                    st.session_state.final_catalog_output = final_catalog
+                    st.session_state.final_catalog_output = store_artifact(final_catalog)
                     st.session_state.current_phase = "catalog_done"; st.success("Final Faktorenkatalog generated!")
                 else: st.error("Failed to generate final Faktorenkatalog."); st.session_state.current_phase = "structured_interviews_done"
                 st.rerun() 
 
 if st.session_state.current_phase == "catalog_done":
+    if st.session_state.final_catalog_output and st.session_state.prior_study_indexed_catalog != st.session_state.final_catalog_output:
+        index_study_for_retrieval(); append_usage_history(st.session_state.study_usage.call_records())
+        st.session_state.prior_study_indexed_catalog = st.session_state.final_catalog_output
     if st.session_state.final_catalog_output:
+        final_catalog_text = final_catalog_markdown()
         st.subheader("Final Generated Faktorenkatalog"); st.markdown("---")
-        st.markdown(st.session_state.final_catalog_output) 
+        st.markdown(final_catalog_text) 
         st.download_button(
             label="Download Faktorenkatalog (.md)",
-            data=st.session_state.final_catalog_output,
+            data=final_catalog_text,
             file_name=f"Faktorenkatalog_{st.session_state.study_context.get('OverallStudyTopic','Study').replace(' ','_')}.md",
             mime="text/markdown")
     else: st.warning("Final catalog was not generated or is empty.")
-    if st.button("Start New Study (Resets Everything)", key=f"final_reset_btn_{st.session_state.run_id}"):
-        st.session_state.clear(); st.session_state.run_id = 0; st.session_state.current_phase = "initial_setup"
-        st.session_state.study_context = {}; st.session_state.interview_mode = "AI Persona Simulation"
-        st.session_state.max_turns_per_interview_gui = MAX_INTERVIEW_TURNS_DEFAULT
-        st.session_state.num_structured_interviews_target = 1; st.session_state.metrics_expanded = True
-        st.session_state.human_expert_name_title_input = ""
-        st.session_state.human_expert_role_input = ""
-        st.session_state.human_expert_expertise_input = ""
-        st.session_state.human_expert_perspective_input = ""
-        st.session_state.user_edited_interview_guide = ""
-        st.session_state.user_edited_catalog_guide = ""
-        st.session_state.exploratory_summary_proposed_structure ="" 
-        st.session_state.human_answer_input = ""
-        st.rerun()
\ No newline at end of file
+    if st.session_state.final_catalog_output:
+        if st.session_state.catalog_extraction_failed_for == st.session_state.final_catalog_output:
+            st.error("The factors could not be extracted from this catalog; Delphi rating, cross-impact analysis and the factor export need them.")
+            st.button("Retry Factor Extraction", key=f"retry_extraction_btn_{st.session_state.run_id}", on_click=go_to_phase,
+                      args=(st.session_state.current_phase,), kwargs={"catalog_extraction_failed_for": None})
+        st.markdown("---"); display_delphi_rating_rounds()
+        st.markdown("---"); display_cross_impact_analysis()
+        st.markdown("---"); display_study_export(); st.markdown("---")
+    if st.session_state.catalog_synthesis_mode == "Incremental (merge per interview)":
+        st.button("➕ Add Structured Interview & Update Catalog", key=f"add_interview_btn_{st.session_state.run_id}", on_click=add_structured_interview_to_catalog,
+                  disabled=st.session_state.num_structured_interviews_target >= 10)
+    st.button("Start New Study (Resets Everything)", key=f"final_reset_btn_{st.session_state.run_id}", on_click=reset_study)
@@ -0,0 +1,101 @@
+# benchmark_session_memory.py
+# Server memory per study phase (tracemalloc) for several browser tabs running a long study: study artifacts kept in
+# st.session_state (old behaviour) vs. handles in session state and the blobs in the on-disk artifact store.
+# Synthetic, per-session unique study data of realistic size is used, so no API calls are made.
+#
+#   python benchmark_session_memory.py                      # 10 tabs, 20 interviews of 16 turns each
+#   python benchmark_session_memory.py --sessions 30 --cache-mb 16
+
+from typing import Any, Dict, List
+import argparse
+import gc
+import io
+import json
+import random
+import tempfile
+import tracemalloc
+import zipfile
+
+from delphibot_artifacts import ArtifactStore
+
+PHASES = ["exploratory", "structured_interviews", "catalog", "export", "browse_results"]
+ANSWER_WORDS = 220 # ~1.5 KB per answer, typical for gpt-4.1-mini persona answers
+SUMMARY_WORDS = 600
+CATALOG_WORDS_PER_INTERVIEW = 450
+
+_VOCABULARY = ("Zeitung Leser Abonnement Digitalisierung Plattform Werbung Regulierung Journalismus Vertrauen Lokalredaktion "
+               "Zustellung Druckkosten Paywall Algorithmus Generation Medienkompetenz Verlag Förderung Desinformation Archiv").split()
+
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(_VOCABULARY) + str(rng.randint(0, 999)) for _ in range(words))
+
+def _interview_result(rng: random.Random, session: int, number: int, turns: int) -> Dict[str, Any]:
+    persona = {"name": f"Expert {session}-{number}", "role_title": "Verlagsleiter", "expertise": _text(rng, 40), "perspective": _text(rng, 40)}
+    transcript = [{"question": _text(rng, 40), "answer": _text(rng, ANSWER_WORDS)} for _ in range(turns)]
+    return {"interview_id": f"s{session}-i{number}", "selected_persona_name": persona["name"], "selected_persona_dict": persona,
+            "transcript": transcript, "summary": _text(rng, SUMMARY_WORDS), "error_message": None}
+
+def _export_zip(results: List[Dict[str, Any]], catalog: str) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        zip_file.writestr("interviews.jsonl", "\n".join(json.dumps(result, ensure_ascii=False) for result in results))
+        zip_file.writestr("catalog.md", catalog)
+    return buffer.getvalue()
+
+def _traced_mb() -> float:
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0] / (1024 * 1024)
+
+
+def run_benchmark(num_sessions: int, num_interviews: int, turns: int, cache_mb: float, use_store: bool) -> Dict[str, float]:
+    """Runs all phases for every session; returns the traced memory (MB above baseline) after each phase."""
+    store = ArtifactStore(tempfile.mkdtemp(prefix="delphibot-artifacts-"), int(cache_mb * 1024 * 1024)) if use_store else None
+    keep = (lambda value, **meta: store.put(value, **meta)) if use_store else (lambda value, **meta: value)
+    sessions: List[Dict[str, Any]] = [{"exploratory_fanout_results": [], "structured_interview_results_list": []} for _ in range(num_sessions)]
+    rngs = [random.Random(session) for session in range(num_sessions)]
+    tracemalloc.start()
+    baseline = _traced_mb()
+    measurements: Dict[str, float] = {}
+    for phase in PHASES:
+        for session, (state, rng) in enumerate(zip(sessions, rngs)):
+            if phase == "exploratory":
+                for number in range(3):
+                    result = _interview_result(rng, session, 100 + number, turns)
+                    state["exploratory_fanout_results"].append(keep(result, selected_persona_name=result["selected_persona_name"]))
+            elif phase == "structured_interviews":
+                for number in range(num_interviews):
+                    result = _interview_result(rng, session, number, turns)
+                    state["structured_interview_results_list"].append(keep(result, selected_persona_name=result["selected_persona_name"]))
+            elif phase == "catalog":
+                state["final_catalog_output"] = keep(_text(rng, CATALOG_WORDS_PER_INTERVIEW * num_interviews))
+            elif phase == "export":
+                results = [store.get(h) for h in state["structured_interview_results_list"]] if use_store else state["structured_interview_results_list"]
+                catalog = store.get(state["final_catalog_output"]) if use_store else state["final_catalog_output"]
+                state["study_export_zip"] = keep(_export_zip(results, catalog)); del results, catalog
+            elif phase == "browse_results": # Every tab opens its newest interview
+                newest = state["structured_interview_results_list"][-1]
+                if use_store: store.get(newest)
+        measurements[phase] = round(_traced_mb() - baseline, 2)
+    tracemalloc.stop()
+    if use_store: measurements["cache"] = store.stats()
+    return measurements
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure server memory per study phase with and without the artifact store.")
+    parser.add_argument("--sessions", type=int, default=10, help="Concurrent browser tabs")
+    parser.add_argument("--interviews", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=16)
+    parser.add_argument("--cache-mb", type=float, default=4.0, help="Artifact cache budget")
+    args = parser.parse_args()
+
+    in_session = run_benchmark(args.sessions, args.interviews, args.turns, args.cache_mb, use_store=False)
+    with_store = run_benchmark(args.sessions, args.interviews, args.turns, args.cache_mb, use_store=True)
+    print(f"\n--- Session Memory ({args.sessions} tabs, {args.interviews} interviews x {args.turns} turns; traced MB after each phase) ---")
+    print(f"{'phase':<24}{'session_state':>15}{'artifact store':>16}")
+    for phase in PHASES:
+        print(f"{phase:<24}{in_session[phase]:>15.2f}{with_store[phase]:>16.2f}")
+    cache = with_store["cache"]
+    print(f"\nArtifact cache: {cache['cached_items']} blobs, {cache['cached_bytes'] / (1024 * 1024):.2f} of {cache['budget_bytes'] / (1024 * 1024):.0f} MB, "
+          f"{cache['hits']} hits / {cache['misses']} misses, {cache['evictions']} evictions")
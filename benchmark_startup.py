@@ -0,0 +1,77 @@
+# benchmark_startup.py
+# Cold-start benchmark: import time of the app's modules and of the (lazily loaded) voice stack, plus the time
+# to the first rendered page. Every measurement runs in a fresh interpreter so nothing is cached between runs.
+#
+#   python benchmark_startup.py            # print results
+#   python benchmark_startup.py --record   # also append them to startup_benchmarks.jsonl to track them over time
+
+from typing import Dict, Optional
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+HISTORY_FILE = os.path.join(ROOT_DIR, "startup_benchmarks.jsonl")
+DEFAULT_REPEATS = 3
+
+# Imported by app.py on every page view (engine + feature modules; delphi and cross_impact pull in numpy, retrieval sqlite3)
+# vs. only when voice input/output is enabled
+EAGER_MODULES = [
+    "delphibot_engine", "delphibot_catalog", "delphibot_delphi", "delphibot_cross_impact", "delphibot_export", "delphibot_retrieval",
+    "delphibot_estimator", "delphibot_pipeline", "delphibot_speculation", "delphibot_persona_pool", "delphibot_exploration",
+    "delphibot_artifacts", "delphibot_tts",
+]
+LAZY_VOICE_MODULES = ["gtts", "speech_recognition"]
+
+_IMPORT_SNIPPET = "import time, importlib; t = time.perf_counter(); importlib.import_module({module!r}); print(time.perf_counter() - t)"
+_FIRST_RENDER_SNIPPET = (
+    "import time; t = time.perf_counter()\n"
+    "from streamlit.testing.v1 import AppTest\n"
+    "at = AppTest.from_file('app.py', default_timeout=120).run()\n"
+    "print(time.perf_counter() - t)"
+)
+
+
+def _time_in_fresh_interpreter(snippet: str) -> Optional[float]:
+    completed = subprocess.run([sys.executable, "-c", snippet], cwd=ROOT_DIR, capture_output=True, text=True)
+    if completed.returncode != 0:
+        print(f"  (failed: {completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else completed.returncode})")
+        return None
+    return float(completed.stdout.strip().splitlines()[-1])
+
+def _median_seconds(snippet: str, repeats: int) -> Optional[float]:
+    timings = [t for t in (_time_in_fresh_interpreter(snippet) for _ in range(repeats)) if t is not None]
+    return round(statistics.median(timings), 4) if timings else None
+
+def run_benchmarks(repeats: int = DEFAULT_REPEATS) -> Dict[str, Optional[float]]:
+    results: Dict[str, Optional[float]] = {}
+    for module in EAGER_MODULES + LAZY_VOICE_MODULES:
+        print(f"import {module} ...")
+        results[f"import:{module}"] = _median_seconds(_IMPORT_SNIPPET.format(module=module), repeats)
+    print("first render of app.py ...")
+    results["first_render:app"] = _median_seconds(_FIRST_RENDER_SNIPPET, repeats)
+    return results
+
+def _git_revision() -> str:
+    try: return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True).stdout.strip()
+    except OSError: return ""
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure import time and first-render latency of the Delphi-Bot app.")
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS)
+    parser.add_argument("--record", action="store_true", help=f"Append the results to {os.path.basename(HISTORY_FILE)}")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.repeats)
+    print("\n--- Startup Benchmark (median seconds) ---")
+    for name, seconds in results.items():
+        print(f"{name:<40} {'n/a' if seconds is None else f'{seconds:.4f}'}")
+    if args.record:
+        with open(HISTORY_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "revision": _git_revision(), "results": results}) + "\n")
+        print(f"Recorded in {HISTORY_FILE}")
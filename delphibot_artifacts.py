@@ -0,0 +1,145 @@
+# delphibot_artifacts.py
+# On-disk store for large study artifacts (interview results with transcripts, the final catalog, export zips).
+# st.session_state keeps only small ArtifactHandles; the blobs are content-addressed, zlib-compressed files that are
+# loaded lazily through ONE process-wide LRU cache with a memory budget, so server RAM no longer grows with users x study size.
+
+from typing import Any, Dict, Optional, Tuple
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+import zlib
+
+ARTIFACT_DIR_ENV_VAR = "DELPHIBOT_ARTIFACT_DIR"
+ARTIFACT_CACHE_MB_ENV_VAR = "DELPHIBOT_ARTIFACT_CACHE_MB"
+DEFAULT_ARTIFACT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "artifacts")
+DEFAULT_CACHE_BUDGET_MB = 64 # Shared by all sessions of the server process
+ARTIFACT_MAX_AGE_DAYS = 14 # Blobs not written or read for this long are pruned when the store is opened
+COMPRESSION_LEVEL = 6
+
+
+class ArtifactHandle:
+    """Lightweight reference to a stored artifact. 'meta' holds the few fields needed to list it without loading it."""
+    __slots__ = ("digest", "kind", "size", "meta")
+
+    def __init__(self, digest: str, kind: str, size: int, meta: Optional[Dict[str, Any]] = None):
+        self.digest = digest; self.kind = kind; self.size = size; self.meta = meta or {}
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, ArtifactHandle) and other.digest == self.digest
+
+    def __hash__(self) -> int:
+        return hash(self.digest)
+
+    def __repr__(self) -> str:
+        return f"ArtifactHandle({self.kind}, {self.digest[:12]}, {self.size} bytes)"
+
+
+def _serialize(value: Any) -> Tuple[str, bytes]:
+    if isinstance(value, bytes): return "bytes", value
+    if isinstance(value, str): return "text", value.encode("utf-8")
+    return "json", json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def _deserialize(kind: str, data: bytes) -> Any:
+    if kind == "bytes": return data
+    if kind == "text": return data.decode("utf-8")
+    return json.loads(data)
+
+
+class ArtifactStore:
+    """
+    Content-addressed blobs under root_dir (identical artifacts are stored once). Loaded blobs are cached as raw bytes
+    and decoded per access, so callers always get their own copy; the cache evicts least recently used blobs above budget.
+    """
+
+    def __init__(self, root_dir: str = DEFAULT_ARTIFACT_DIR, cache_budget_bytes: int = DEFAULT_CACHE_BUDGET_MB * 1024 * 1024):
+        self.root_dir = root_dir
+        self.cache_budget_bytes = cache_budget_bytes
+        os.makedirs(root_dir, exist_ok=True)
+        self._cache: "OrderedDict[str, bytes]" = OrderedDict()
+        self._cached_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0; self.misses = 0; self.evictions = 0
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.root_dir, digest[:2], f"{digest}.z")
+
+    def _remember(self, digest: str, data: bytes) -> None:
+        if len(data) > self.cache_budget_bytes: return # Would evict everything else; read it from disk each time instead
+        with self._lock:
+            if digest in self._cache: self._cache.move_to_end(digest); return
+            self._cache[digest] = data; self._cached_bytes += len(data)
+            while self._cached_bytes > self.cache_budget_bytes:
+                _, evicted = self._cache.popitem(last=False)
+                self._cached_bytes -= len(evicted); self.evictions += 1
+
+    def put(self, value: Any, **meta: Any) -> ArtifactHandle:
+        """Stores a str, bytes or JSON-serializable value; returns its handle."""
+        kind, data = _serialize(value)
+        digest = hashlib.sha256(kind.encode("utf-8") + b"\0" + data).hexdigest()
+        path = self._path(digest)
+        if os.path.exists(path): os.utime(path) # Keeps a shared blob from being pruned
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+            with open(temp_path, "wb") as f: f.write(zlib.compress(data, COMPRESSION_LEVEL))
+            os.replace(temp_path, path) # Atomic: concurrent writers of the same blob write identical content
+        self._remember(digest, data) # Freshly stored artifacts are usually displayed right away
+        return ArtifactHandle(digest, kind, len(data), meta)
+
+    def get(self, handle: Optional[ArtifactHandle], default: Any = None) -> Any:
+        if handle is None: return default
+        with self._lock:
+            data = self._cache.get(handle.digest)
+            if data is not None: self._cache.move_to_end(handle.digest); self.hits += 1
+            else: self.misses += 1
+        if data is None:
+            try:
+                with open(self._path(handle.digest), "rb") as f: data = zlib.decompress(f.read())
+            except (OSError, zlib.error) as e:
+                print(f"!ENGINE ERROR: Could not load artifact {handle.digest[:12]}: {e}"); return default
+            self._remember(handle.digest, data)
+        return _deserialize(handle.kind, data)
+
+    def prune(self, max_age_days: float = ARTIFACT_MAX_AGE_DAYS) -> int:
+        """Deletes blobs not stored or loaded for max_age_days (sessions referring to them are long gone)."""
+        cutoff = time.time() - max_age_days * 24 * 60 * 60
+        removed = 0
+        for directory, _, file_names in os.walk(self.root_dir):
+            for file_name in file_names:
+                path = os.path.join(directory, file_name)
+                try:
+                    if max(os.path.getmtime(path), os.path.getatime(path)) < cutoff: os.remove(path); removed += 1
+                except OSError: continue
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"cached_items": len(self._cache), "cached_bytes": self._cached_bytes, "budget_bytes": self.cache_budget_bytes,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+_artifact_store: Optional[ArtifactStore] = None
+_artifact_store_lock = threading.Lock()
+
+def get_artifact_store() -> ArtifactStore:
+    """Process-wide store at $DELPHIBOT_ARTIFACT_DIR (default: ./artifacts), cache budget $DELPHIBOT_ARTIFACT_CACHE_MB."""
+    global _artifact_store
+    with _artifact_store_lock:
+        if _artifact_store is None:
+            root_dir = os.environ.get(ARTIFACT_DIR_ENV_VAR) or DEFAULT_ARTIFACT_DIR
+            try: budget_mb = float(os.environ.get(ARTIFACT_CACHE_MB_ENV_VAR) or DEFAULT_CACHE_BUDGET_MB)
+            except ValueError: budget_mb = DEFAULT_CACHE_BUDGET_MB
+            _artifact_store = ArtifactStore(root_dir, int(budget_mb * 1024 * 1024))
+            removed = _artifact_store.prune()
+            if removed: print(f"ENGINE: Pruned {removed} artifact(s) older than {ARTIFACT_MAX_AGE_DAYS} days from {root_dir}.")
+        return _artifact_store
+
+def store_artifact(value: Any, **meta: Any) -> ArtifactHandle:
+    return get_artifact_store().put(value, **meta)
+
+def load_artifact(handle: Optional[ArtifactHandle], default: Any = None) -> Any:
+    return get_artifact_store().get(handle, default)
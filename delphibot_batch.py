@@ -0,0 +1,323 @@
+# delphibot_batch.py
+# Batch API mode for non-interactive studies: the SummarizerAgent and CatalogWriterAgent calls have no
+# latency requirement, so they are collected into one OpenAI Batch API JSONL job (billed at ~50%).
+# Runs from the command line (python delphibot_batch.py --help); the study budget applies to every batch request.
+
+from typing import Any, Callable, Dict, List, Optional
+from types import SimpleNamespace
+import argparse
+import io
+import json
+import time
+import uuid
+
+from agents import Agent
+from delphibot_engine import (
+    SummarizerAgent,
+    CatalogWriterAgent,
+    MODEL_NAME,
+    BATCH_USAGE_SUFFIX,
+    MAX_INTERVIEW_TURNS_DEFAULT,
+    PREDEFINED_PERSONAS_NEWSPAPER_TOPIC,
+    count_tokens,
+    current_study_usage,
+    formalize_structure_from_exploratory_summary,
+    get_session_usage,
+    perform_study_phase,
+    set_study_budget,
+    _build_final_catalog_writer_prompt,
+    _record_usage,
+)
+from delphibot_providers import resolve_provider
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_COMPLETION_WINDOW = "24h"
+BATCH_POLL_INTERVAL_SECONDS = 30
+BATCH_TIMEOUT_SECONDS = 24 * 60 * 60
+BATCH_TERMINAL_STATES = {"completed", "failed", "expired", "cancelled"}
+
+
+# --- Batch Job ---
+class BatchJob:
+    """Collects agent prompts into one Batch API job and maps the outputs back by custom_id."""
+
+    def __init__(self):
+        self.requests: List[Dict[str, Any]] = []
+        self._models_by_custom_id: Dict[str, str] = {}
+        self._agent_names_by_custom_id: Dict[str, str] = {}
+
+    def add(self, custom_id: str, agent: Agent, prompt_text: str) -> None:
+        model_name = str(agent.model or MODEL_NAME)
+        if resolve_provider(model_name)[0] is not None: # The Batch API only serves hosted OpenAI models
+            print(f"ENGINE WARNING: {agent.name} runs on self-hosted '{model_name}'; its batch request uses {MODEL_NAME}.")
+            model_name = MODEL_NAME
+        self.requests.append({
+            "custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT,
+            "body": {
+                "model": model_name,
+                "messages": [
+                    {"role": "system", "content": agent.instructions},
+                    {"role": "user", "content": prompt_text},
+                ],
+            },
+        })
+        self._models_by_custom_id[custom_id] = model_name; self._agent_names_by_custom_id[custom_id] = agent.name
+
+    def apply_budget(self) -> None:
+        """
+        Routes every request through the study budget before upload, like _run_agent_internal does for synchronous calls:
+        requests may be degraded to the fallback model or dropped (their output stays None). Earlier requests of this
+        job count as spent, since none of them is recorded before the batch completes.
+        """
+        usage = current_study_usage()
+        if usage.budget is None: return
+        admitted: List[Dict[str, Any]] = []
+        pending_cost_usd = 0.0
+        for request in self.requests:
+            custom_id, body = request["custom_id"], request["body"]
+            agent_name, model_name = self._agent_names_by_custom_id[custom_id], body["model"]
+            input_tokens = sum(count_tokens(message["content"], model_name) for message in body["messages"])
+            routed_model_name = usage.route_call(agent_name, model_name + BATCH_USAGE_SUFFIX, input_tokens, pending_cost_usd)
+            if routed_model_name is None:
+                print(f"!ENGINE ERROR: Study budget exhausted, batch request '{custom_id}' ({agent_name}) dropped (Input Tokens: {input_tokens})."); continue
+            if routed_model_name.endswith(BATCH_USAGE_SUFFIX): routed_model_name = routed_model_name[:-len(BATCH_USAGE_SUFFIX)]
+            if routed_model_name != model_name:
+                print(f"ENGINE WARNING: Study budget nearly used up, batch request '{custom_id}' degraded from {model_name} to {routed_model_name}.")
+                body["model"] = routed_model_name; self._models_by_custom_id[custom_id] = routed_model_name
+            pending_cost_usd += usage.budget.projected_cost_usd(agent_name, routed_model_name + BATCH_USAGE_SUFFIX, input_tokens)
+            admitted.append(request)
+        self.requests = admitted
+
+    def to_jsonl(self) -> bytes:
+        return "".join(json.dumps(request, ensure_ascii=False) + "\n" for request in self.requests).encode("utf-8")
+
+    def submit_and_wait(
+        self,
+        client: Any = None,
+        poll_interval_s: float = BATCH_POLL_INTERVAL_SECONDS,
+        timeout_s: float = BATCH_TIMEOUT_SECONDS
+    ) -> Dict[str, Optional[str]]:
+        """Uploads the JSONL, creates the batch, polls until it finishes and returns {custom_id: output_text}."""
+        outputs: Dict[str, Optional[str]] = {request["custom_id"]: None for request in self.requests}
+        self.apply_budget()
+        if not self.requests: return outputs
+        client = client or _default_batch_client()
+
+        input_file = client.files.create(file=("delphibot_batch.jsonl", io.BytesIO(self.to_jsonl())), purpose="batch")
+        batch = client.batches.create(input_file_id=input_file.id, endpoint=BATCH_ENDPOINT, completion_window=BATCH_COMPLETION_WINDOW)
+        print(f"ENGINE: Batch {batch.id} submitted ({len(self.requests)} requests).")
+
+        started_at = time.monotonic()
+        while batch.status not in BATCH_TERMINAL_STATES:
+            if time.monotonic() - started_at > timeout_s:
+                print(f"!ENGINE ERROR: Batch {batch.id} did not finish within {timeout_s}s (status: {batch.status})."); return outputs
+            time.sleep(poll_interval_s)
+            batch = client.batches.retrieve(batch.id)
+            print(f"ENGINE: Batch {batch.id} status: {batch.status}")
+
+        if batch.status != "completed" or not batch.output_file_id:
+            print(f"!ENGINE ERROR: Batch {batch.id} ended with status '{batch.status}'."); return outputs
+
+        for line in client.files.content(batch.output_file_id).text.splitlines():
+            if not line.strip(): continue
+            record = json.loads(line)
+            custom_id = record.get("custom_id")
+            response = record.get("response") or {}
+            if record.get("error") or response.get("status_code") != 200:
+                print(f"!ENGINE ERROR: Batch request '{custom_id}' failed: {record.get('error') or response.get('status_code')}"); continue
+            body = response.get("body") or {}
+            choices = body.get("choices") or [{}]
+            outputs[custom_id] = (choices[0].get("message") or {}).get("content") or None
+            usage = body.get("usage") or {}
+            model_name = self._models_by_custom_id.get(custom_id, body.get("model", MODEL_NAME))
+            _record_usage(model_name + BATCH_USAGE_SUFFIX, usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0),
+                          self._agent_names_by_custom_id.get(custom_id, ""))
+        return outputs
+
+
+def _default_batch_client() -> Any:
+    from openai import OpenAI
+    return OpenAI()
+
+
+# --- Engine Mode: deferred summaries & synthesis via Batch ---
+def complete_pending_summaries_via_batch(
+    phase_results_list: List[Dict[str, Any]],
+    client: Any = None,
+    poll_interval_s: float = BATCH_POLL_INTERVAL_SECONDS
+) -> List[Dict[str, Any]]:
+    """Runs the 'pending_summary_prompt' of each phase result (see perform_study_phase(defer_summary=True)) in one batch."""
+    job = BatchJob()
+    pending_by_custom_id: Dict[str, Dict[str, Any]] = {}
+    for i, phase_results in enumerate(phase_results_list):
+        if not phase_results.get("pending_summary_prompt"): continue
+        custom_id = f"summary-{i}"
+        job.add(custom_id, SummarizerAgent, phase_results["pending_summary_prompt"])
+        pending_by_custom_id[custom_id] = phase_results
+    if not pending_by_custom_id: return phase_results_list
+
+    outputs = job.submit_and_wait(client, poll_interval_s=poll_interval_s)
+    for custom_id, phase_results in pending_by_custom_id.items():
+        if outputs.get(custom_id):
+            phase_results["summary"] = outputs[custom_id]
+            del phase_results["pending_summary_prompt"]
+        elif not phase_results.get("error_message"):
+            phase_results["error_message"] = "SummarizerAgent batch request failed to provide summary."
+    return phase_results_list
+
+def generate_final_catalog_via_batch(
+    study_context: Dict,
+    aggregated_summaries: str,
+    client: Any = None,
+    poll_interval_s: float = BATCH_POLL_INTERVAL_SECONDS
+) -> Optional[str]:
+    full_prompt_for_catalogwriter = _build_final_catalog_writer_prompt(study_context, aggregated_summaries)
+    if not full_prompt_for_catalogwriter: return None
+    job = BatchJob()
+    job.add("final-catalog", CatalogWriterAgent, full_prompt_for_catalogwriter)
+    final_catalog = job.submit_and_wait(client, poll_interval_s=poll_interval_s).get("final-catalog")
+    if not final_catalog: print("!ENGINE ERROR: CatalogWriterAgent batch request failed final output.")
+    return final_catalog
+
+def run_structured_study_in_batch_mode(
+    study_context: Dict,
+    num_structured_interviews: int,
+    max_interview_turns: int = MAX_INTERVIEW_TURNS_DEFAULT,
+    client: Any = None,
+    poll_interval_s: float = BATCH_POLL_INTERVAL_SECONDS
+) -> Dict[str, Any]:
+    """
+    Offline structured phase: interviews run synchronously, all summaries go into one batch,
+    then the catalog synthesis goes into a second batch.
+    """
+    study_context = study_context.copy()
+    study_context["roles_interviewed_so_far"] = list(study_context.get("roles_interviewed_so_far", []))
+    results_list: List[Dict[str, Any]] = []
+    for i in range(num_structured_interviews):
+        print(f"\nENGINE: === Batch mode: structured interview {i + 1}/{num_structured_interviews} ===")
+        phase_results = perform_study_phase(study_context, False, max_interview_turns, defer_summary=True)
+        results_list.append(phase_results)
+        persona = phase_results.get("selected_persona_dict") or {}
+        study_context["roles_interviewed_so_far"].append(persona.get("role_title", persona.get("Role", "UnknownRole")))
+
+    complete_pending_summaries_via_batch(results_list, client, poll_interval_s)
+    valid_summaries = [f"Summary from interview with {res.get('selected_persona_name', 'Unknown Expert')}:\n{res['summary']}"
+                       for res in results_list if res.get("summary", "").strip()]
+    final_catalog = None
+    if valid_summaries:
+        aggregated_summaries_text = "\n\n---\nNEXT INTERVIEW SUMMARY:\n---\n\n".join(valid_summaries)
+        final_catalog = generate_final_catalog_via_batch(study_context, aggregated_summaries_text, client, poll_interval_s)
+    return {"structured_interview_results_list": results_list, "final_catalog": final_catalog}
+
+
+# --- Local stand-in for the Batch API (for tests and offline development) ---
+class LocalBatchClient:
+    """
+    Implements the subset of the OpenAI client used above (files.create/content, batches.create/retrieve)
+    in memory. 'responder' maps a chat completion request body to the answer text.
+    Batches report 'in_progress' for 'polls_until_complete' retrievals before completing.
+    """
+
+    def __init__(self, responder: Optional[Callable[[Dict[str, Any]], str]] = None, polls_until_complete: int = 1):
+        self.responder = responder or (lambda body: f"[local batch response for {body['model']}]")
+        self.polls_until_complete = polls_until_complete
+        self._files: Dict[str, bytes] = {}
+        self._batches: Dict[str, SimpleNamespace] = {}
+        self.files = SimpleNamespace(create=self._create_file, content=self._file_content)
+        self.batches = SimpleNamespace(create=self._create_batch, retrieve=self._retrieve_batch)
+
+    def _create_file(self, file: Any, purpose: str) -> SimpleNamespace:
+        file_obj = file[1] if isinstance(file, tuple) else file
+        file_id = f"file-local-{uuid.uuid4().hex[:12]}"
+        self._files[file_id] = file_obj.read()
+        return SimpleNamespace(id=file_id, purpose=purpose)
+
+    def _file_content(self, file_id: str) -> SimpleNamespace:
+        return SimpleNamespace(text=self._files[file_id].decode("utf-8"))
+
+    def _create_batch(self, input_file_id: str, endpoint: str, completion_window: str) -> SimpleNamespace:
+        batch = SimpleNamespace(id=f"batch-local-{uuid.uuid4().hex[:12]}", status="validating", input_file_id=input_file_id,
+                                output_file_id=None, endpoint=endpoint, completion_window=completion_window, _polls=0)
+        self._batches[batch.id] = batch
+        return batch
+
+    def _retrieve_batch(self, batch_id: str) -> SimpleNamespace:
+        batch = self._batches[batch_id]
+        batch._polls += 1
+        if batch.status not in BATCH_TERMINAL_STATES:
+            if batch._polls < self.polls_until_complete: batch.status = "in_progress"
+            else: self._complete_batch(batch)
+        return batch
+
+    def _complete_batch(self, batch: SimpleNamespace) -> None:
+        output_lines = []
+        for line in self._files[batch.input_file_id].decode("utf-8").splitlines():
+            if not line.strip(): continue
+            request = json.loads(line)
+            answer = self.responder(request["body"])
+            prompt_chars = sum(len(message["content"]) for message in request["body"]["messages"])
+            output_lines.append(json.dumps({
+                "id": f"batch-req-{uuid.uuid4().hex[:8]}", "custom_id": request["custom_id"], "error": None,
+                "response": {"status_code": 200, "body": {
+                    "model": request["body"]["model"],
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}}],
+                    "usage": {"prompt_tokens": prompt_chars // 4, "completion_tokens": len(answer) // 4},
+                }},
+            }, ensure_ascii=False))
+        output_file_id = f"file-local-{uuid.uuid4().hex[:12]}"
+        self._files[output_file_id] = ("\n".join(output_lines) + "\n").encode("utf-8")
+        batch.output_file_id = output_file_id; batch.status = "completed"
+
+
+# --- Command Line ---
+def _study_context_from_args(args: argparse.Namespace) -> Optional[Dict[str, Any]]:
+    """The given study context, or a new one whose structure is formalized from one synchronous exploratory interview."""
+    if args.study_context:
+        with open(args.study_context, "r", encoding="utf-8") as f: study_context = json.load(f)
+        if study_context.get("InterviewGuideStructure_DEFINED") and study_context.get("DesiredOutputCatalogStructureGuidance_DEFINED"): return study_context
+    else:
+        study_context = {
+            "OverallStudyTopic": args.topic, "TargetYear": args.target_year, "GeographicalScope": args.scope,
+            "KeyObjectives_Wofuer": args.objectives, "PersonaRequirementsGuidance": args.persona_requirements,
+            "PredefinedPersonas": PREDEFINED_PERSONAS_NEWSPAPER_TOPIC,
+            "InterviewGuideExploratoryPrompt": "Conduct an open-ended, exploratory interview on the OverallStudyTopic...",
+            "SummarizerGuidanceExploratory": "This is an initial exploratory interview for the StudyTopic. Analyze the transcript to identify 4-6 MAJOR THEMATIC CATEGORIES...",
+            "InterviewGuideStructure_DEFINED": None, "DesiredOutputCatalogStructureGuidance_DEFINED": None,
+            "StudyId": uuid.uuid4().hex[:12],
+        }
+    print("\n========== Exploratory interview & structure formalization (synchronous) ==========")
+    exploratory_results = perform_study_phase(study_context, True, args.turns)
+    if exploratory_results.get("error_message") or not exploratory_results.get("summary"):
+        print(f"!ENGINE ERROR: Exploratory interview failed: {exploratory_results.get('error_message')}"); return None
+    formalized_guides = formalize_structure_from_exploratory_summary(study_context, exploratory_results["summary"])
+    if not formalized_guides: return None
+    persona = exploratory_results.get("selected_persona_dict") or {}
+    return {**study_context, **formalized_guides, "roles_interviewed_so_far": [persona.get("role_title", persona.get("Role", "UnknownRole"))]}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline structured study: summaries and catalog synthesis through the OpenAI Batch API.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--study-context", help="JSON study context; without the two *_DEFINED guides an exploratory interview runs first")
+    source.add_argument("--topic", help="Overall study topic of a new study")
+    parser.add_argument("--target-year", type=int, default=2040)
+    parser.add_argument("--scope", default="Deutschland")
+    parser.add_argument("--objectives", default="Identifizierung und Strukturierung der Schlüsselfaktoren")
+    parser.add_argument("--persona-requirements", default="Experten-Personas mit vielfältigem Hintergrund zum Studienthema")
+    parser.add_argument("--interviews", type=int, default=3, help="Structured interviews")
+    parser.add_argument("--turns", type=int, default=MAX_INTERVIEW_TURNS_DEFAULT, help="Max turns per interview")
+    parser.add_argument("--budget", type=float, default=0.0, help="Study budget in USD (0 = no limit); also applies to the batch requests")
+    parser.add_argument("--poll-interval", type=float, default=BATCH_POLL_INTERVAL_SECONDS)
+    parser.add_argument("--output", default="Faktorenkatalog_batch.md")
+    args = parser.parse_args()
+
+    set_study_budget(args.budget or None)
+    cli_study_context = _study_context_from_args(args)
+    if cli_study_context is None: raise SystemExit("!ENGINE ERROR: No formalized study structure; batch study not started.")
+    batch_results = run_structured_study_in_batch_mode(cli_study_context, args.interviews, args.turns, poll_interval_s=args.poll_interval)
+    if batch_results["final_catalog"]:
+        with open(args.output, "w", encoding="utf-8") as f: f.write(batch_results["final_catalog"])
+        print(f"\nENGINE: Final catalog written to {args.output}.")
+    else: print("\n!ENGINE ERROR: No final catalog was generated.")
+    session_usage = get_session_usage()
+    print(f"Total: {session_usage['input_tokens']} input / {session_usage['output_tokens']} output tokens, ${session_usage['cost_usd']:.4f}")
+    if session_usage["budget"]: print(f"Budget: {session_usage['budget']}")
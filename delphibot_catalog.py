@@ -0,0 +1,166 @@
+# delphibot_catalog.py
+# Incremental Faktorenkatalog: the catalog is kept as structured state (Systemebene -> Faktorname -> details).
+# Each new interview summary is merged as a delta; only factors it touches go through an LLM merge, and the
+# markdown is rendered locally. Synthesis cost grows with the new material, not with the study size.
+
+from typing import Any, Dict, List, Optional
+import json
+
+from agents import Agent
+from delphibot_engine import (
+    ALL_AGENTS,
+    AGENT_MODEL_POLICY,
+    SMALL_MODEL_NAME,
+    _run_agent_internal,
+    model_for_agent,
+    parse_json_with_repair,
+)
+
+FACTOR_DETAIL_KEYS = ("definition", "dimensions", "trends")
+
+AGENT_MODEL_POLICY.setdefault("CatalogDeltaAgent", SMALL_MODEL_NAME)
+CatalogDeltaAgent = Agent(
+    name="CatalogDeltaAgent",
+    instructions="""
+    You maintain a structured Faktorenkatalog. You work in one of two modes:
+    - 'extract_delta': You receive ONE new structured interview summary, the catalog structure guidance and the OUTLINE of the
+      current catalog (Systemebenen and their Faktorname only). Extract every influence factor from the new summary.
+      Assign each to one of the Systemebenen from the guidance/outline. If a factor is the same as (or very similar to) an existing
+      Faktorname in that Systemebene, use EXACTLY the existing name; otherwise give a concise new name.
+      For each factor give 'definition', 'dimensions' and 'trends' as stated in the NEW summary only.
+    - 'merge_factors': You receive existing catalog entries and new material for the same factors. Synthesize each into ONE
+      entry (comprehensive definition, union of dimensions, trends noting consensus and variations). Do not drop existing content.
+    Output ONLY the requested JSON.
+    """,
+    model=model_for_agent("CatalogDeltaAgent")
+)
+ALL_AGENTS.append(CatalogDeltaAgent)
+
+DELTA_SCHEMA_HINT = ('{"factors": [{"systemebene": str, "faktorname": str, "definition": str, "dimensions": str, "trends": str}, ...]}')
+MERGE_SCHEMA_HINT = ('{"merged": [{"systemebene": str, "faktorname": str, "definition": str, "dimensions": str, "trends": str}, ...]}')
+
+
+# --- Catalog State ---
+def new_catalog_state() -> Dict[str, Any]:
+    return {"systemebenen": {}, "merged_interview_ids": []}
+
+def catalog_outline(catalog_state: Dict[str, Any]) -> Dict[str, List[str]]:
+    return {level: list(factors.keys()) for level, factors in catalog_state["systemebenen"].items()}
+
+def list_catalog_factors(catalog_state: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Flat factor list ({'systemebene', 'faktorname', ...details}) in catalog order."""
+    return [{"systemebene": level, "faktorname": name, **details}
+            for level, factors in catalog_state["systemebenen"].items() for name, details in factors.items()]
+
+def _find_level(catalog_state: Dict[str, Any], level_name: str) -> str:
+    for existing_level in catalog_state["systemebenen"]:
+        if existing_level.strip().lower() == level_name.strip().lower(): return existing_level
+    return level_name.strip()
+
+def _find_factor(factors: Dict[str, Any], factor_name: str) -> Optional[str]:
+    for existing_name in factors:
+        if existing_name.strip().lower() == factor_name.strip().lower(): return existing_name
+    return None
+
+def _as_text(value: Any) -> str:
+    if isinstance(value, list): return "; ".join(str(v) for v in value if v)
+    return str(value or "").strip()
+
+def _validate_factor_list(key: str):
+    def validator(payload: Dict[str, Any]) -> List[str]:
+        entries = payload.get(key)
+        if not isinstance(entries, list): return [f"missing list '{key}'"]
+        bad = [i for i, e in enumerate(entries)
+               if not (isinstance(e, dict) and all(isinstance(e.get(field), str) and e[field].strip() for field in ("systemebene", "faktorname")))]
+        return [f"entries {bad} need non-empty string 'systemebene' and 'faktorname'"] if bad else []
+    return validator
+
+
+# --- Delta Merge ---
+def merge_summary_into_catalog(
+    catalog_state: Dict[str, Any],
+    study_context: Dict,
+    summary: str,
+    interview_id: str,
+    source_label: str = ""
+) -> bool:
+    """Merges ONE interview summary into catalog_state (in place). Returns False if the delta could not be extracted."""
+    if interview_id in catalog_state["merged_interview_ids"]: return True
+    guidance = study_context.get("DesiredOutputCatalogStructureGuidance_DEFINED") or "Structure by the Systemebenen in the outline."
+
+    print(f"\nENGINE: --- CatalogDeltaAgent: Task -> Extract Delta from Interview {interview_id} ---")
+    delta_prompt = (
+        f"Mode: extract_delta\n"
+        f"OverallStudyTopic: {study_context.get('OverallStudyTopic')}\nTargetYear: {study_context.get('TargetYear')}\n"
+        f"CatalogStructureGuidance: {guidance}\n"
+        f"CurrentCatalogOutline: {json.dumps(catalog_outline(catalog_state), ensure_ascii=False)}\n\n"
+        f"NewInterviewSummary:\n```text\n{summary}\n```\n\n"
+        f"Output ONLY a JSON object: {DELTA_SCHEMA_HINT}"
+    )
+    delta_response_obj = _run_agent_internal(CatalogDeltaAgent, delta_prompt)
+    delta = parse_json_with_repair(delta_response_obj.final_output if delta_response_obj else None,
+                                   _validate_factor_list("factors"), DELTA_SCHEMA_HINT)
+    if delta is None:
+        print(f"!ENGINE ERROR: Could not extract catalog delta for interview {interview_id}."); return False
+
+    # New factors are inserted directly; factors that already exist are collected for ONE targeted merge call.
+    to_merge: List[Dict[str, Any]] = []
+    for entry in delta["factors"]:
+        level = _find_level(catalog_state, entry["systemebene"])
+        factors = catalog_state["systemebenen"].setdefault(level, {})
+        existing_name = _find_factor(factors, entry["faktorname"])
+        new_details = {key: _as_text(entry.get(key)) for key in FACTOR_DETAIL_KEYS}
+        if existing_name is None:
+            factors[entry["faktorname"].strip()] = {**new_details, "sources": [source_label] if source_label else [], "interview_ids": [interview_id]}
+        else:
+            to_merge.append({"systemebene": level, "faktorname": existing_name,
+                             "existing": {key: factors[existing_name].get(key, "") for key in FACTOR_DETAIL_KEYS}, "new": new_details})
+
+    if to_merge:
+        print(f"ENGINE: --- CatalogDeltaAgent: Task -> Merge {len(to_merge)} affected factors ---")
+        merge_prompt = (
+            f"Mode: merge_factors\nTargetYear: {study_context.get('TargetYear')}\n"
+            f"FactorsToMerge:\n{json.dumps(to_merge, indent=1, ensure_ascii=False)}\n\n"
+            f"Output ONLY a JSON object: {MERGE_SCHEMA_HINT}"
+        )
+        merge_response_obj = _run_agent_internal(CatalogDeltaAgent, merge_prompt)
+        merged = parse_json_with_repair(merge_response_obj.final_output if merge_response_obj else None,
+                                        _validate_factor_list("merged"), MERGE_SCHEMA_HINT)
+        merged_by_key = {(m["systemebene"].strip().lower(), m["faktorname"].strip().lower()): m for m in (merged or {}).get("merged", [])}
+        for item in to_merge:
+            factor = catalog_state["systemebenen"][item["systemebene"]][item["faktorname"]]
+            merged_entry = merged_by_key.get((item["systemebene"].lower(), item["faktorname"].lower()))
+            for key in FACTOR_DETAIL_KEYS:
+                if merged_entry and _as_text(merged_entry.get(key)): factor[key] = _as_text(merged_entry.get(key))
+                elif item["new"][key] and item["new"][key] not in factor.get(key, ""): # Merge failed: keep both versions
+                    factor[key] = f"{factor.get(key, '')}\n{item['new'][key]}".strip()
+            if source_label and source_label not in factor["sources"]: factor["sources"].append(source_label)
+            if interview_id not in factor.setdefault("interview_ids", []): factor["interview_ids"].append(interview_id)
+
+    catalog_state["merged_interview_ids"].append(interview_id)
+    print(f"ENGINE: Interview {interview_id} merged into catalog ({len(delta['factors'])} factors, {len(to_merge)} merged).")
+    return True
+
+
+def catalog_state_from_markdown(study_context: Dict, catalog_markdown: str) -> Optional[Dict[str, Any]]:
+    """Structured state for a catalog that only exists as markdown (full re-synthesis mode); one delta extraction. None if it failed."""
+    catalog_state = new_catalog_state()
+    if not merge_summary_into_catalog(catalog_state, study_context, catalog_markdown, "final-catalog") or not catalog_state["systemebenen"]:
+        print("!ENGINE ERROR: No factors could be extracted from the catalog markdown."); return None
+    return catalog_state
+
+
+# --- Local Rendering ---
+def render_catalog_markdown(catalog_state: Dict[str, Any], study_context: Dict) -> str:
+    target_year = study_context.get("TargetYear", "")
+    lines = [f"# Faktorenkatalog: {study_context.get('OverallStudyTopic', '')}", ""]
+    for level, factors in catalog_state["systemebenen"].items():
+        if not factors: continue
+        lines += [f"## {level}", ""]
+        for factor_name, details in factors.items():
+            lines += [f"### {factor_name}", ""]
+            if details.get("definition"): lines += [f"**Definition/Verständnis:** {details['definition']}", ""]
+            if details.get("dimensions"): lines += [f"**Dimensionen:** {details['dimensions']}", ""]
+            if details.get("trends"): lines += [f"**Trends bis {target_year}:** {details['trends']}", ""]
+            if details.get("sources"): lines += [f"*Genannt von: {', '.join(details['sources'])}*", ""]
+    return "\n".join(lines).strip() + "\n"
@@ -0,0 +1,173 @@
+# delphibot_cross_impact.py
+# Cross-impact analysis over the Faktorenkatalog: impacts are elicited row by row (ONE call per source factor against
+# all targets, i.e. n instead of n^2 calls) into a dense NumPy matrix. Active/passive sums, influence rankings and
+# consistent scenario bundles (cross-impact balance) are computed locally and vectorized.
+
+from typing import Any, Dict, List
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from agents import Agent
+from delphibot_engine import (
+    ALL_AGENTS,
+    AGENT_MODEL_POLICY,
+    SMALL_MODEL_NAME,
+    _run_agent_internal,
+    model_for_agent,
+    parse_json_with_repair,
+    submit_in_context,
+)
+
+IMPACT_SCALE_MAX = 3 # Impacts range from -3 (strongly weakens) to +3 (strongly strengthens)
+MAX_PARALLEL_IMPACT_ROWS = 4
+INDIRECT_INFLUENCE_STEPS = 3 # Matrix power for indirect (MICMAC-style) influence
+SCENARIO_KEY_FACTORS_MAX = 12 # Scenarios are enumerated over 2^k states of the k most connected factors
+SCENARIO_BUNDLES_MAX = 5
+SCENARIO_MIN_HAMMING_DISTANCE = 2 # Bundles must differ in at least this many key factors
+FACTOR_DEFINITION_MAX_CHARS = 160
+
+AGENT_MODEL_POLICY.setdefault("CrossImpactAgent", SMALL_MODEL_NAME)
+CrossImpactAgent = Agent(
+    name="CrossImpactAgent",
+    instructions=f"""
+    You are a scenario planning analyst building a cross-impact matrix for a Faktorenkatalog.
+    You receive ONE 'SourceFactor' and a list of 'TargetFactors' (ID, Systemebene, Faktorname, short definition).
+    For EACH target factor judge: if the source factor develops strongly (its described trend materializes) up to the
+    TargetYear, how does that affect the target factor? Use an integer from -{IMPACT_SCALE_MAX} (strongly weakens) over
+    0 (no direct impact) to +{IMPACT_SCALE_MAX} (strongly strengthens). Only judge DIRECT impacts. Most pairs are 0.
+    Output ONLY the requested JSON; you may omit targets with impact 0.
+    """,
+    model=model_for_agent("CrossImpactAgent")
+)
+ALL_AGENTS.append(CrossImpactAgent)
+
+IMPACTS_SCHEMA_HINT = '{"impacts": {"<target factor ID>": <integer -3..3>, ...}}'
+
+
+# --- Row-wise Elicitation ---
+def _factor_id(index: int) -> str:
+    return f"F{index + 1}"
+
+def _factor_line(index: int, factor: Dict[str, Any]) -> str:
+    definition = str(factor.get("definition", ""))[:FACTOR_DEFINITION_MAX_CHARS]
+    return f"{_factor_id(index)} | {factor.get('systemebene', '')} | {factor.get('faktorname', '')} | {definition}"
+
+def _validate_impacts(payload: Dict[str, Any]) -> List[str]:
+    return [] if isinstance(payload.get("impacts"), dict) else ["missing object 'impacts'"]
+
+def elicit_impact_row(study_context: Dict, factors: List[Dict[str, Any]], source_index: int) -> np.ndarray:
+    """ONE CrossImpactAgent call: impacts of factors[source_index] on all other factors. NaN row if the call failed."""
+    target_lines = [_factor_line(i, factor) for i, factor in enumerate(factors) if i != source_index]
+    impact_prompt = (
+        f"OverallStudyTopic: {study_context.get('OverallStudyTopic')}\nTargetYear: {study_context.get('TargetYear')}\n\n"
+        f"SourceFactor: {_factor_line(source_index, factors[source_index])}\n\n"
+        f"TargetFactors (ID | Systemebene | Faktorname | Definition):\n" + "\n".join(target_lines) +
+        f"\n\nOutput ONLY a JSON object: {IMPACTS_SCHEMA_HINT}"
+    )
+    print(f"\nENGINE: --- CrossImpactAgent: Task -> Impacts of {_factor_id(source_index)} on {len(target_lines)} factors ---")
+    response_obj = _run_agent_internal(CrossImpactAgent, impact_prompt)
+    parsed = parse_json_with_repair(response_obj.final_output if response_obj else None, _validate_impacts, IMPACTS_SCHEMA_HINT)
+    row = np.zeros(len(factors))
+    if parsed is None:
+        print(f"!ENGINE ERROR: No usable impacts for {_factor_id(source_index)}."); return np.full(len(factors), np.nan)
+    ids = {_factor_id(i): i for i in range(len(factors))}
+    for target_id, value in parsed["impacts"].items():
+        target_index = ids.get(str(target_id).strip())
+        if target_index is None or target_index == source_index: continue
+        try: row[target_index] = float(np.clip(round(float(value)), -IMPACT_SCALE_MAX, IMPACT_SCALE_MAX))
+        except (TypeError, ValueError): continue
+    return row
+
+def build_cross_impact_matrix(
+    study_context: Dict,
+    factors: List[Dict[str, Any]],
+    max_workers: int = MAX_PARALLEL_IMPACT_ROWS
+) -> np.ndarray:
+    """Dense n x n matrix, M[i, j] = impact of factor i on factor j. Rows whose call failed are NaN."""
+    if not factors: return np.zeros((0, 0))
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(factors)), thread_name_prefix="delphibot-cross-impact") as executor:
+        futures = [submit_in_context(executor, elicit_impact_row, study_context, factors, i) for i in range(len(factors))]
+        return np.stack([future.result() for future in futures])
+
+
+# --- Local Analysis ---
+def influence_analysis(matrix: np.ndarray) -> Dict[str, np.ndarray]:
+    """Active/passive sums, Vester criticality and activity ratio, plus indirect influence via matrix powers."""
+    strength = np.abs(np.nan_to_num(matrix))
+    active_sum = strength.sum(axis=1) # How strongly a factor influences the system
+    passive_sum = strength.sum(axis=0) # How strongly it is influenced
+    criticality = active_sum * passive_sum
+    activity_ratio = active_sum / np.maximum(passive_sum, 1e-9)
+    # Indirect influence: row sums of the normalized matrix to the k-th power (influence over paths of length k)
+    normalized = strength / max(strength.sum(axis=1).max(initial=0.0), 1e-9)
+    indirect_influence = np.linalg.matrix_power(normalized, INDIRECT_INFLUENCE_STEPS).sum(axis=1) if len(strength) else np.zeros(0)
+    median_active, median_passive = (np.median(active_sum), np.median(passive_sum)) if len(strength) else (0.0, 0.0)
+    roles = np.where(active_sum >= median_active,
+                     np.where(passive_sum >= median_passive, "critical", "active"),
+                     np.where(passive_sum >= median_passive, "reactive", "buffering"))
+    return {"active_sum": active_sum, "passive_sum": passive_sum, "criticality": criticality, "activity_ratio": activity_ratio,
+            "indirect_influence": indirect_influence, "roles": roles}
+
+def consistent_scenario_bundles(
+    matrix: np.ndarray,
+    max_key_factors: int = SCENARIO_KEY_FACTORS_MAX,
+    max_bundles: int = SCENARIO_BUNDLES_MAX
+) -> Dict[str, Any]:
+    """
+    Cross-impact balance over the most connected factors: each key factor is either strong (+1) or weak (-1).
+    A scenario s is consistent if every factor's state agrees with the impact balance it receives (s_j * (s @ M)_j >= 0).
+    This score is the same for s and its mirror -s, so the most connected key factor is pinned to strong: the 2^(k-1)
+    remaining scenarios are scored at once and the most consistent, mutually different ones are returned as bundles
+    (each also stands for its mirror image).
+    """
+    strength = np.abs(np.nan_to_num(matrix))
+    key_count = min(max_key_factors, len(strength))
+    if key_count == 0: return {"key_factor_indices": [], "bundles": []}
+    key_indices = np.argsort(-(strength.sum(axis=0) + strength.sum(axis=1)), kind="stable")[:key_count]
+    sub_matrix = np.nan_to_num(matrix)[np.ix_(key_indices, key_indices)].astype(int) # Impacts are integers
+
+    states = ((np.arange(2 ** key_count)[:, None] >> np.arange(key_count)) & 1) * 2 - 1 # scenario x key factor, in {-1, +1}
+    states = states[states[:, 0] == 1] # One of each mirror pair: they would otherwise fill the bundles as "all strong" / "all weak" twins
+    agreement = states * (states @ sub_matrix) # >= 0 where the factor's state is supported by the impact balance
+    consistency = agreement.min(axis=1)
+    total_impact = agreement.sum(axis=1)
+    order = np.lexsort((-total_impact, -consistency)) # Best consistency first, then highest total impact score
+
+    bundles: List[Dict[str, Any]] = []
+    for scenario in order:
+        if consistency[scenario] < 0 and bundles: break # Only fall back to an inconsistent scenario if nothing is consistent
+        if any(np.count_nonzero(states[scenario] != states[b["scenario_index"]]) < SCENARIO_MIN_HAMMING_DISTANCE for b in bundles): continue
+        bundles.append({"scenario_index": int(scenario), "states": states[scenario].tolist(),
+                        "consistency": float(consistency[scenario]), "total_impact_score": float(total_impact[scenario])})
+        if len(bundles) >= max_bundles: break
+    return {"key_factor_indices": key_indices.tolist(), "bundles": bundles}
+
+def run_cross_impact_analysis(study_context: Dict, factors: List[Dict[str, Any]], max_workers: int = MAX_PARALLEL_IMPACT_ROWS) -> Dict[str, Any]:
+    """'factors' is the flat list from list_catalog_factors(). n row-wise calls, everything else is local."""
+    matrix = build_cross_impact_matrix(study_context, factors, max_workers)
+    failed_rows = np.isnan(matrix).all(axis=1) if matrix.size else np.zeros(0, dtype=bool)
+    if failed_rows.any(): print(f"!ENGINE WARNING: {int(failed_rows.sum())} cross-impact row(s) failed and count as 0.")
+    return {"factors": factors, "matrix": matrix, "failed_rows": failed_rows.tolist(),
+            **influence_analysis(matrix), "scenarios": consistent_scenario_bundles(matrix)}
+
+def influence_ranking_rows(cross_impact: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """One row per factor (for tables / CSV export), sorted by active sum."""
+    rows = [{"Systemebene": factor.get("systemebene", ""), "Faktorname": factor.get("faktorname", ""),
+             "active_sum": float(cross_impact["active_sum"][i]), "passive_sum": float(cross_impact["passive_sum"][i]),
+             "criticality": float(cross_impact["criticality"][i]), "activity_ratio": round(float(cross_impact["activity_ratio"][i]), 3),
+             "indirect_influence": round(float(cross_impact["indirect_influence"][i]), 4), "role": str(cross_impact["roles"][i])}
+            for i, factor in enumerate(cross_impact["factors"])]
+    return sorted(rows, key=lambda r: (-r["active_sum"], -r["indirect_influence"]))
+
+def scenario_bundle_markdown(cross_impact: Dict[str, Any]) -> str:
+    factors, scenarios = cross_impact["factors"], cross_impact["scenarios"]
+    lines = []
+    for number, bundle in enumerate(scenarios["bundles"], start=1):
+        label = "konsistent" if bundle["consistency"] >= 0 else "nicht voll konsistent"
+        lines += [f"**Szenario {number}** ({label}, Konsistenz {bundle['consistency']:.0f}, Impact-Score {bundle['total_impact_score']:.0f})", ""]
+        lines += [f"- {'▲ stark' if state > 0 else '▼ schwach'}: {factors[index].get('faktorname', '')}"
+                  for index, state in zip(scenarios["key_factor_indices"], bundle["states"])]
+        lines.append("")
+    if scenarios["bundles"]: lines.append("_Jedes Szenario steht auch für sein Spiegelbild (alle Zustände umgekehrt), das gleich konsistent ist._")
+    return "\n".join(lines).strip()
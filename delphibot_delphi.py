@@ -0,0 +1,185 @@
+# delphibot_delphi.py
+# Delphi rating rounds over the Faktorenkatalog: every persona rates ALL open factors (relevance, likelihood) in ONE
+# call per round. Consensus statistics are computed with NumPy over the persona x factor x dimension matrix, and later
+# rounds (with aggregated group feedback) only cover the factors that have not converged yet.
+
+from typing import Any, Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+import json
+import warnings
+
+import numpy as np
+
+from agents import Agent
+from delphibot_engine import (
+    ALL_AGENTS,
+    AGENT_MODEL_POLICY,
+    SMALL_MODEL_NAME,
+    _run_agent_internal,
+    model_for_agent,
+    parse_json_with_repair,
+    submit_in_context,
+)
+
+RATING_DIMENSIONS = ("relevance", "likelihood")
+RATING_SCALE_MIN, RATING_SCALE_MAX = 1, 5
+MAX_DELPHI_ROUNDS_DEFAULT = 3
+MAX_PARALLEL_RATERS = 4
+CONSENSUS_MAX_IQR = 1.0 # Classic Delphi criterion on a 5-point scale
+CONSENSUS_MIN_AGREEMENT = 0.7 # Share of ratings within +-1 of the median
+STABILITY_MAX_SHIFT = 0.5 # Median and IQR moved less than this between rounds -> stable, no further round
+FACTOR_DEFINITION_MAX_CHARS = 200
+
+AGENT_MODEL_POLICY.setdefault("DelphiRaterAgent", SMALL_MODEL_NAME)
+DelphiRaterAgent = Agent(
+    name="DelphiRaterAgent",
+    instructions=f"""
+    You take part in a Delphi study as the expert described in 'PersonaProfile' (JSON). Stay in this role.
+    You receive a list of influence factors (ID, Systemebene, Faktorname, short definition). Rate EVERY listed factor on two
+    scales from {RATING_SCALE_MIN} (very low) to {RATING_SCALE_MAX} (very high):
+    - relevance: how strongly the factor will shape the study topic up to the TargetYear,
+    - likelihood: how likely the trend described for the factor is to materialize by the TargetYear.
+    In later rounds you also see the group median, the interquartile range (IQR) and your own previous rating per factor.
+    Reconsider your rating in light of the group feedback; keep it if you have good reasons from your expertise.
+    Output ONLY the requested JSON.
+    """,
+    model=model_for_agent("DelphiRaterAgent")
+)
+ALL_AGENTS.append(DelphiRaterAgent)
+
+RATINGS_SCHEMA_HINT = '{"ratings": {"<factor ID>": [<relevance 1-5>, <likelihood 1-5>], ...}}'
+
+
+# --- Vectorized Consensus Statistics ---
+def consensus_statistics(ratings: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    ratings: persona x factor x dimension (NaN = not rated). Returns per factor x dimension: median, q1, q3, iqr,
+    agreement (share within +-1 of the median) and n_ratings, plus 'consensus' per factor (all dimensions agree).
+    """
+    valid = ~np.isnan(ratings)
+    with warnings.catch_warnings(): # Factors nobody rated yet are all-NaN; their statistics stay NaN
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        median = np.nanmedian(ratings, axis=0)
+        q1, q3 = np.nanpercentile(ratings, [25, 75], axis=0)
+    n_ratings = valid.sum(axis=0)
+    agreement = ((np.abs(ratings - median) <= 1) & valid).sum(axis=0) / np.maximum(n_ratings, 1)
+    iqr = q3 - q1
+    consensus = ((iqr <= CONSENSUS_MAX_IQR) & (agreement >= CONSENSUS_MIN_AGREEMENT)).all(axis=-1)
+    return {"median": median, "q1": q1, "q3": q3, "iqr": iqr, "agreement": agreement, "n_ratings": n_ratings, "consensus": consensus}
+
+def _stable_factors(previous: Dict[str, np.ndarray], current: Dict[str, np.ndarray]) -> np.ndarray:
+    """Factors whose median and IQR barely moved since the previous round (no further convergence to expect)."""
+    shift = np.maximum(np.abs(current["median"] - previous["median"]), np.abs(current["iqr"] - previous["iqr"]))
+    return (shift < STABILITY_MAX_SHIFT).all(axis=-1)
+
+
+# --- Batched Rating Calls (one per persona and round) ---
+def _factor_id(index: int) -> str:
+    return f"F{index + 1}"
+
+def _validate_ratings(payload: Dict[str, Any]) -> List[str]:
+    return [] if isinstance(payload.get("ratings"), dict) and payload["ratings"] else ["missing non-empty object 'ratings'"]
+
+def rate_factors_as_persona(
+    study_context: Dict,
+    persona: Dict[str, Any],
+    factors: List[Dict[str, Any]],
+    factor_indices: np.ndarray,
+    statistics: Optional[Dict[str, np.ndarray]] = None,
+    own_previous: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """ONE DelphiRaterAgent call rating all factor_indices. Returns len(factor_indices) x dimension (NaN where unanswered)."""
+    factor_lines = []
+    for index in factor_indices:
+        factor = factors[index]
+        definition = str(factor.get("definition", ""))[:FACTOR_DEFINITION_MAX_CHARS]
+        line = f"{_factor_id(index)} | {factor.get('systemebene', '')} | {factor.get('faktorname', '')} | {definition}"
+        if statistics is not None:
+            feedback = "; ".join(
+                f"{dimension}: group median {statistics['median'][index, d]:.1f}, IQR {statistics['iqr'][index, d]:.1f}"
+                + (f", your previous {own_previous[index, d]:.0f}" if own_previous is not None and not np.isnan(own_previous[index, d]) else "")
+                for d, dimension in enumerate(RATING_DIMENSIONS))
+            line += f" || {feedback}"
+        factor_lines.append(line)
+
+    rating_prompt = (
+        f"PersonaProfile: {json.dumps(persona, ensure_ascii=False)}\n"
+        f"OverallStudyTopic: {study_context.get('OverallStudyTopic')}\nTargetYear: {study_context.get('TargetYear')}\n\n"
+        f"Factors (ID | Systemebene | Faktorname | Definition{' || Group feedback' if statistics is not None else ''}):\n"
+        + "\n".join(factor_lines) +
+        f"\n\nRate ALL {len(factor_lines)} factors. Output ONLY a JSON object: {RATINGS_SCHEMA_HINT}"
+    )
+    persona_name = persona.get("name", persona.get("role_title", "?"))
+    print(f"\nENGINE: --- DelphiRaterAgent: Task -> {persona_name} rates {len(factor_lines)} factors ---")
+    response_obj = _run_agent_internal(DelphiRaterAgent, rating_prompt)
+    parsed = parse_json_with_repair(response_obj.final_output if response_obj else None, _validate_ratings, RATINGS_SCHEMA_HINT)
+
+    ratings = np.full((len(factor_indices), len(RATING_DIMENSIONS)), np.nan)
+    if parsed is None:
+        print(f"!ENGINE ERROR: No usable ratings from {persona_name}."); return ratings
+    for row, index in enumerate(factor_indices):
+        values = parsed["ratings"].get(_factor_id(index))
+        if not isinstance(values, list) or len(values) != len(RATING_DIMENSIONS): continue
+        try: ratings[row] = np.clip(np.asarray(values, dtype=float), RATING_SCALE_MIN, RATING_SCALE_MAX)
+        except (TypeError, ValueError): continue
+    return ratings
+
+
+# --- Rounds ---
+def run_delphi_rating_rounds(
+    study_context: Dict,
+    factors: List[Dict[str, Any]],
+    personas: List[Dict[str, Any]],
+    max_rounds: int = MAX_DELPHI_ROUNDS_DEFAULT,
+    max_workers: int = MAX_PARALLEL_RATERS
+) -> Dict[str, Any]:
+    """
+    Runs rating rounds until every factor has converged (consensus or stable) or max_rounds is reached.
+    'factors' is the flat list from list_catalog_factors(). Returns the rating matrix, final statistics and per-round info.
+    """
+    num_personas, num_factors = len(personas), len(factors)
+    ratings = np.full((num_personas, num_factors, len(RATING_DIMENSIONS)), np.nan)
+    converged_in_round = np.zeros(num_factors, dtype=int) # 0 = not converged
+    open_indices = np.arange(num_factors)
+    statistics = consensus_statistics(ratings)
+    rounds: List[Dict[str, Any]] = []
+
+    for round_number in range(1, max_rounds + 1):
+        if not num_personas or not len(open_indices): break
+        print(f"\nENGINE: === Delphi rating round {round_number}: {len(open_indices)} open factors, {num_personas} personas ===")
+        feedback = statistics if rounds else None
+        with ThreadPoolExecutor(max_workers=min(max_workers, num_personas), thread_name_prefix="delphibot-rating") as executor:
+            futures = [submit_in_context(executor, rate_factors_as_persona, study_context, persona, factors, open_indices,
+                                         feedback, ratings[p] if feedback is not None else None)
+                       for p, persona in enumerate(personas)]
+            round_ratings = np.stack([future.result() for future in futures]) # persona x open factor x dimension
+        # Revised ratings replace the previous ones; unanswered factors keep the persona's earlier rating
+        previous_open = ratings[:, open_indices]
+        ratings[:, open_indices] = np.where(np.isnan(round_ratings), previous_open, round_ratings)
+
+        new_statistics = consensus_statistics(ratings)
+        converged = new_statistics["consensus"][open_indices]
+        if feedback is not None: converged |= _stable_factors(feedback, new_statistics)[open_indices]
+        converged_in_round[open_indices[converged]] = round_number
+        rounds.append({"round": round_number, "rated_factors": len(open_indices), "converged": int(converged.sum())})
+        statistics = new_statistics
+        open_indices = open_indices[~converged]
+        print(f"ENGINE: Round {round_number}: {int(converged.sum())} factors converged, {len(open_indices)} still open.")
+
+    return {"factors": factors, "ratings": ratings, "statistics": statistics, "converged_in_round": converged_in_round,
+            "rounds": rounds, "persona_names": [p.get("name", p.get("role_title", "?")) for p in personas]}
+
+def delphi_result_rows(delphi_result: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """One row per factor (for tables / CSV export), sorted by median relevance."""
+    statistics = delphi_result["statistics"]
+    rows = []
+    for index, factor in enumerate(delphi_result["factors"]):
+        row = {"Systemebene": factor.get("systemebene", ""), "Faktorname": factor.get("faktorname", "")}
+        for d, dimension in enumerate(RATING_DIMENSIONS):
+            row[f"{dimension}_median"] = float(statistics["median"][index, d])
+            row[f"{dimension}_iqr"] = float(statistics["iqr"][index, d])
+        row["agreement"] = float(statistics["agreement"][index].min())
+        row["consensus"] = bool(statistics["consensus"][index])
+        row["converged_in_round"] = int(delphi_result["converged_in_round"][index]) or None
+        rows.append(row)
+    return sorted(rows, key=lambda r: -np.nan_to_num(r["relevance_median"], nan=-1.0))
@@ -1,26 +1,111 @@
 # delphibot_engine.py
 
 from agents import Agent, Runner
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 import json
 import tiktoken
 import asyncio
+import contextvars
+import functools
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+
+from delphibot_persona_library import get_persona_library
+from delphibot_providers import provider_pricing, register_providers_from_policy, resolve_provider
+from delphibot_retrieval import prior_factors_for_prompt
 
 
 
 # --- Configuration & Pricing ---
 MAX_INTERVIEW_TURNS_DEFAULT = 3 # Default, can be overridden
-MODEL_NAME = "gpt-4.1-mini-2025-04-14"
-INPUT_PRICE_PER_MILLION_TOKENS = 0.40
-OUTPUT_PRICE_PER_MILLION_TOKENS = 1.60
+MODEL_NAME = "gpt-4.1-mini-2025-04-14" # Default model (fallback for agents without a policy entry)
+SMALL_MODEL_NAME = "gpt-4.1-nano-2025-04-14"
+LARGE_MODEL_NAME = "gpt-4.1-2025-04-14"
+
+# Prices in USD per 1M tokens, per model. Can be extended/overridden via the model policy file.
+MODEL_PRICING_PER_MILLION_TOKENS: Dict[str, Dict[str, float]] = {
+    SMALL_MODEL_NAME: {"input": 0.10, "output": 0.40},
+    MODEL_NAME: {"input": 0.40, "output": 1.60},
+    LARGE_MODEL_NAME: {"input": 2.00, "output": 8.00},
+}
+# Kept for callers that still price everything at the default model
+INPUT_PRICE_PER_MILLION_TOKENS = MODEL_PRICING_PER_MILLION_TOKENS[MODEL_NAME]["input"]
+OUTPUT_PRICE_PER_MILLION_TOKENS = MODEL_PRICING_PER_MILLION_TOKENS[MODEL_NAME]["output"]
+
+# Model routing per agent: cheap, high-volume calls (persona JSON, manager instructions) go to the
+# small model, the catalog synthesis goes to the large one.
+AGENT_MODEL_POLICY: Dict[str, str] = {
+    "ManagerAgent": SMALL_MODEL_NAME,
+    "PersonaManagerAgent": SMALL_MODEL_NAME,
+    "InterviewerAgent": MODEL_NAME,
+    "PersonaResponderAgent": MODEL_NAME,
+    "PanelResponderAgent": MODEL_NAME,
+    "SummarizerAgent": MODEL_NAME,
+    "CatalogWriterAgent": LARGE_MODEL_NAME,
+    "JsonRepairAgent": SMALL_MODEL_NAME,
+    "HistoryDigestAgent": SMALL_MODEL_NAME,
+    "SimulatedInterviewAgent": MODEL_NAME,
+}
+MODEL_POLICY_ENV_VAR = "DELPHIBOT_MODEL_POLICY"
+DEFAULT_MODEL_POLICY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_policy.json")
+
+def load_model_policy(policy_path: Optional[str] = None) -> bool:
+    """
+    Merges a JSON policy file into AGENT_MODEL_POLICY and MODEL_PRICING_PER_MILLION_TOKENS and registers its providers.
+    Format: {"agents": {"<AgentName>": "<model>" or "<provider>:<model>"}, "pricing": {"<model>": {"input": 0.4, "output": 1.6}},
+             "providers": {"<provider>": {"base_url": "http://127.0.0.1:8080/v1", "max_concurrency": 4}}} (see delphibot_providers)
+    """
+    path = policy_path or os.environ.get(MODEL_POLICY_ENV_VAR) or DEFAULT_MODEL_POLICY_PATH
+    if not os.path.isfile(path): return False
+    try:
+        with open(path, "r", encoding="utf-8") as f: policy = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"!ENGINE WARNING: Could not read model policy '{path}': {e}"); return False
+    for model, prices in (policy.get("pricing") or {}).items():
+        if isinstance(prices, dict) and "input" in prices and "output" in prices:
+            MODEL_PRICING_PER_MILLION_TOKENS[model] = {"input": float(prices["input"]), "output": float(prices["output"])}
+        else: print(f"!ENGINE WARNING: Ignoring pricing entry for '{model}' (needs 'input' and 'output').")
+    register_providers_from_policy(policy.get("providers") or {})
+    for agent_name, model in (policy.get("agents") or {}).items():
+        if isinstance(model, str) and model: AGENT_MODEL_POLICY[agent_name] = model
+    print(f"ENGINE: Model policy loaded from '{path}'.")
+    return True
+
+# Batch API calls are billed at a discount; their usage is tracked under "<model> (batch)".
+BATCH_PRICE_FACTOR = 0.5
+BATCH_USAGE_SUFFIX = " (batch)"
+
+def model_for_agent(agent_name: str) -> str:
+    return AGENT_MODEL_POLICY.get(agent_name, MODEL_NAME)
+
+load_model_policy()
 
 # --- Helper Function for Token Counting ---
+@functools.lru_cache(maxsize=None) # Encoders are immutable and shared by all studies
+def _encoding_for_model(model_name: str) -> Any:
+    try: return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
 def count_tokens(string: Optional[str], model_name: str = MODEL_NAME) -> int:
     if not string: return 0
-    try: encoding = tiktoken.encoding_for_model(model_name)
-    except KeyError:
-        encoding = tiktoken.get_encoding("cl100k_base")
-    return len(encoding.encode(string))
+    return len(_encoding_for_model(model_name).encode(string))
+
+def estimate_cost_usd(usage_by_model: Dict[str, Dict[str, int]]) -> float:
+    total_cost = 0.0
+    for model, usage in usage_by_model.items():
+        price_factor = 1.0
+        if model.endswith(BATCH_USAGE_SUFFIX): model = model[:-len(BATCH_USAGE_SUFFIX)]; price_factor = BATCH_PRICE_FACTOR
+        prices = MODEL_PRICING_PER_MILLION_TOKENS.get(model) or provider_pricing(model) # Self-hosted backends: zero unless priced
+        if prices is None:
+            print(f"!ENGINE WARNING: No pricing for model '{model}', using prices of {MODEL_NAME}.")
+            prices = MODEL_PRICING_PER_MILLION_TOKENS[MODEL_NAME]
+        total_cost += (usage.get("input_tokens", 0) / 1_000_000) * prices["input"] * price_factor
+        total_cost += (usage.get("output_tokens", 0) / 1_000_000) * prices["output"] * price_factor
+    return total_cost
 
 # --- AGENT DEFINITIONS ---
 ManagerAgent = Agent(
@@ -47,7 +132,7 @@ ManagerAgent = Agent(
 
     Output ONLY the direct instruction or requested JSON. Be precise.
     """,
-    model=MODEL_NAME
+    model=model_for_agent("ManagerAgent")
 )
 
 # <<< --- HEBEL 1: ANPASSUNG PERSONA MANAGER AGENT --- >>>
@@ -73,7 +158,7 @@ PersonaManagerAgent = Agent(
     Incorporate a specific, even slightly extreme, "stance" or "key belief" into the persona's profile.
     Output ONLY the persona JSON.
     """,
-    model=MODEL_NAME
+    model=model_for_agent("PersonaManagerAgent")
 )
 
 # <<< --- HEBEL 1: ANPASSUNG INTERVIEWER AGENT --- >>>
@@ -83,7 +168,7 @@ InterviewerAgent = Agent(
     You are a professional, sharp-witted Interviewer. You will receive:
     - The OverallStudyTopic and TargetYear.
     - A PersonaProfile (JSON of an AI expert OR a text block for a human).
-    - The ConversationHistory.
+    - The ConversationHistory (in long interviews, older turns are condensed into a ConversationDigest).
     - Guidance on the interview type.
 
     Your task:
@@ -92,11 +177,11 @@ InterviewerAgent = Agent(
     - If the persona is a 'tech-optimist', ask them about the potential downsides they might be ignoring. If they are a 'regulator', ask them how innovation can still thrive under their proposed rules.
     - Your goal is to extract the unique, specialized knowledge that ONLY this specific persona would have.
     - If 'interview_guide_structure' is provided: Your goal is to **aggressively populate the provided System Levels with numerous, diverse factors**. Your task is to probe the expert to identify as many distinct influence factors as possible, while asking questions relating to the experts characteristics. This **does not mean asking specific questions about one system level at a time**. Connect the system levels and ask more general questions that can be used to populate multiple system levels.  Ask follow-up questions to uncover different facets, sub-topics, and a wide variety of factors. Do not be satisfied with just one or two factors per level. Your primary objective in this phase is to generate **a large quantity and diversity of factors** for the final catalog. Try to identify at least 6-8 factors per system level.
-    - In both modes: Refer to ConversationHistory. Do the interview in German.
+    - In both modes: Refer to ConversationHistory (and ConversationDigest, if given) and do not revisit factors already covered there. Do the interview in German.
     
     Decision to Conclude: If the persona's unique perspective is fully explored or the interview is unproductive, output: INTERVIEW_COMPLETE. Otherwise, output ONLY your next question.
     """,
-    model=MODEL_NAME
+    model=model_for_agent("InterviewerAgent")
 )
 
 PersonaResponderAgent = Agent(
@@ -104,11 +189,26 @@ PersonaResponderAgent = Agent(
     instructions="""
     You are an AI embodying an expert persona. You will receive:
     - A PersonaProfile (JSON) to adopt.
-    - The ConversationHistory.
+    - The ConversationHistory (in long interviews, older turns are condensed into a ConversationDigest).
     - The CurrentQuestion from the interviewer.
-    Answer the CurrentQuestion from the perspective of the PersonaProfile, considering ConversationHistory. Be concise. Output ONLY the answer.
+    Answer the CurrentQuestion from the perspective of the PersonaProfile, considering ConversationHistory and ConversationDigest. Be concise. Output ONLY the answer.
     """,
-    model=MODEL_NAME
+    model=model_for_agent("PersonaResponderAgent")
+)
+
+PanelResponderAgent = Agent(
+    name="PanelResponderAgent",
+    instructions="""
+    You voice a panel (focus group) of AI expert personas. You will receive:
+    - PanelPersonaProfiles: a JSON object mapping a panel ID (P1, P2, ...) to the PersonaProfile of each panel member.
+    - The ConversationHistory of the panel (every question with the answer of each member; older turns of long
+      interviews are condensed into a ConversationDigest).
+    - The CurrentQuestion from the interviewer, addressed to the whole panel.
+    Answer the CurrentQuestion ONCE FOR EVERY panel member, each strictly from that member's own PersonaProfile.
+    Members may react to what others said earlier, but their answers must reflect their own role, stance and expertise;
+    do not let the panel converge on one opinion. Be concise. Output ONLY the requested JSON.
+    """,
+    model=model_for_agent("PanelResponderAgent")
 )
 
 SummarizerAgent = Agent(
@@ -124,7 +224,7 @@ SummarizerAgent = Agent(
     - **If 'defined_output_structure_guidance' is provided:** Your goal is to capture every influence factor discussed in the interview. 1. Meticulously extract **all** 'Einflussfaktoren' mentioned in the **InterviewTranscript** that are relevant to the **OverallStudyTopic**. 2. Structure these factors strictly according to the 'defined_output_structure_guidance' (which specifies the Systemebenen). It is expected that there will be many factors for each Systemebene. 3. For each Faktorname you identify from the transcript, detail its Definition/Understanding, Dimensions Discussed, and Trends for the TargetYear **as stated or implied by the interviewee in the transcript.** 4. Ensure your output is comprehensive and captures the **full breadth of factors** discussed, as the goal of this phase is to maximize the number of identified factors.
     Output a well-organized, structured text summary.
     """,
-    model=MODEL_NAME
+    model=model_for_agent("SummarizerAgent")
 )
 
 CatalogWriterAgent = Agent(
@@ -150,8 +250,54 @@ CatalogWriterAgent = Agent(
         Ensure clear headings, and well-written, concise paragraphs or bullet points for the synthesized details.
     G.  Your output should be the single, consolidated, and synthesized Faktorenkatalog. DO NOT just concatenate the input summaries.
     """,
-    model=MODEL_NAME
+    model=model_for_agent("CatalogWriterAgent")
+)
+JsonRepairAgent = Agent(
+    name="JsonRepairAgent",
+    instructions="""
+    You repair malformed or incomplete JSON. You will receive a required schema, a list of problems and a JSON fragment.
+    Fix syntax errors (quotes, commas, brackets, truncation) and add missing required keys using the information in the fragment.
+    Keep all existing content unchanged. Output ONLY the repaired JSON object.
+    """,
+    model=model_for_agent("JsonRepairAgent")
+)
+
+HistoryDigestAgent = Agent(
+    name="HistoryDigestAgent",
+    instructions="""
+    You keep a running digest of a long expert interview, so the interviewer does not need the full history.
+    You will receive the CurrentDigest (may be empty) and NewTurns (JSON) that are dropped from the verbatim history.
+    Output the UPDATED digest: one short line per influence factor or theme covered so far (the expert's view or
+    expected trend in a few words; name the panel member if answers are given per panel ID), followed by a line
+    'Open threads:' with points the expert raised but that were not explored yet. Merge new information into existing
+    lines instead of appending duplicates, and keep the whole digest under 250 words. Output ONLY the digest.
+    """,
+    model=model_for_agent("HistoryDigestAgent")
+)
+
+SimulatedInterviewAgent = Agent(
+    name="SimulatedInterviewAgent",
+    instructions="""
+    You write a complete expert interview in ONE response, playing both the interviewer and the AI expert. You will receive:
+    - The OverallStudyTopic and TargetYear.
+    - A PersonaProfile (JSON) of the expert.
+    - The guidance for this interview (exploratory, or a defined interview guide with System Levels) and the number of turns.
+    As the interviewer: use the persona's 'stance', role and key beliefs for targeted, probing and sometimes challenging
+    questions, build on the previous answers and never revisit a factor already covered. In a structured interview, draw out
+    as many distinct influence factors as possible across all System Levels. As the expert: answer every question strictly
+    from the PersonaProfile, concisely and concretely. The interview is in German. End earlier if the persona's perspective
+    is exhausted. If a summary is requested, write it from the interview you wrote, following the given summary guidance.
+    Output ONLY the requested JSON.
+    """,
+    model=model_for_agent("SimulatedInterviewAgent")
 )
+
+ALL_AGENTS: List[Agent] = [ManagerAgent, PersonaManagerAgent, InterviewerAgent, PersonaResponderAgent, PanelResponderAgent, SummarizerAgent, CatalogWriterAgent, JsonRepairAgent, HistoryDigestAgent, SimulatedInterviewAgent]
+
+def apply_model_policy(policy_path: Optional[str] = None) -> None:
+    """Reloads the policy file and re-routes the already defined agents."""
+    load_model_policy(policy_path)
+    for agent in ALL_AGENTS: agent.model = model_for_agent(agent.name)
 # --- END OF AGENT DEFINITIONS ---
 
 PREDEFINED_PERSONAS_NEWSPAPER_TOPIC = [
@@ -160,79 +306,415 @@ PREDEFINED_PERSONAS_NEWSPAPER_TOPIC = [
     { "name": "Lena Meyer", "age": 22, "role_title": "Medienstudentin", "expertise_areas": ["Mediennutzung junger Zielgruppen", "Social Media News"]}
 ]
 
-# Global session token counters
-session_input_tokens = 0
-session_output_tokens = 0
+# --- Study Budget ---
+BUDGET_DEGRADE_AT_FRACTION = 0.8 # Above this share of the limit, calls are routed to BUDGET_FALLBACK_MODEL and interviews wrap up
+BUDGET_FALLBACK_MODEL = SMALL_MODEL_NAME
+BUDGET_MIN_INTERVIEW_TURNS = 2 # A degraded interview still gets at least this many turns
+EXPECTED_OUTPUT_TOKENS_DEFAULT = 500 # Output assumed for a call's projected cost when the agent has no calibrated value
+
+def call_cost_usd(model_name: str, input_tokens: int, output_tokens: int) -> float:
+    return estimate_cost_usd({model_name: {"input_tokens": input_tokens, "output_tokens": output_tokens}})
+
+class StudyBudget:
+    """
+    Spend limit (USD) of ONE study, enforced in _run_agent_internal. Above 'degrade_at' of the limit every call goes
+    to the fallback model and interviews end early; a call whose projected cost (input + expected output) would cross
+    the limit is not run at all and the study stops gracefully (callers treat it like a failed call).
+    """
+
+    def __init__(self, max_cost_usd: float, degrade_at: float = BUDGET_DEGRADE_AT_FRACTION,
+                 expected_output_tokens: Optional[Dict[str, int]] = None):
+        self.max_cost_usd = max_cost_usd
+        self.degrade_at = degrade_at
+        self.expected_output_tokens = dict(expected_output_tokens or {})
+        self.exhausted = False
+        self.degraded_calls = 0
+        self.skipped_calls = 0
+
+    def state(self, spent_usd: float) -> str:
+        if self.exhausted or spent_usd >= self.max_cost_usd: return "exhausted"
+        return "degraded" if spent_usd >= self.degrade_at * self.max_cost_usd else "ok"
+
+    def projected_cost_usd(self, agent_name: str, model_name: str, input_tokens: int) -> float:
+        return call_cost_usd(model_name, input_tokens, self.expected_output_tokens.get(agent_name, EXPECTED_OUTPUT_TOKENS_DEFAULT))
+
+    def route(self, agent_name: str, model_name: str, input_tokens: int, spent_usd: float) -> Optional[str]:
+        """Model to run the call on, or None if it does not fit into the remaining budget. Free calls (self-hosted) always run."""
+        projected_cost = self.projected_cost_usd(agent_name, model_name, input_tokens)
+        if projected_cost == 0: return model_name
+        if self.state(spent_usd) == "degraded" and model_name != BUDGET_FALLBACK_MODEL:
+            self.degraded_calls += 1; model_name = BUDGET_FALLBACK_MODEL
+            projected_cost = self.projected_cost_usd(agent_name, model_name, input_tokens)
+        if self.exhausted or spent_usd + projected_cost > self.max_cost_usd:
+            self.exhausted = True; self.skipped_calls += 1
+            return None
+        return model_name
+
+    def reset(self) -> None:
+        self.exhausted = False; self.degraded_calls = 0; self.skipped_calls = 0
+
+    def snapshot(self, spent_usd: float) -> Dict[str, Any]:
+        return {"max_cost_usd": self.max_cost_usd, "state": self.state(spent_usd),
+                "degraded_calls": self.degraded_calls, "skipped_calls": self.skipped_calls}
+
+# --- Per-Study Token Usage ---
+# Usage is recorded into the StudyUsage bound to the current context, so concurrent app sessions never share counters.
+class StudyUsage:
+    """
+    Token usage of ONE study/session: totals plus a per-model breakdown for cost accounting, and a per-call log
+    (agent, model, tokens, latency). With a 'call_sink' the call records are streamed to it instead of kept in memory.
+    """
+
+    def __init__(self, call_sink: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self._lock = threading.Lock() # Agents may run in worker threads (parallel interviews)
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.by_model: Dict[str, Dict[str, int]] = {}
+        self.calls: List[Dict[str, Any]] = []
+        self.call_sink = call_sink
+        self.budget: Optional[StudyBudget] = None
+
+    def record(self, model_name: str, input_tokens: int, output_tokens: int, agent_name: str = "", latency_s: Optional[float] = None) -> None:
+        call_record = {"timestamp": time.time(), "agent": agent_name, "model": model_name,
+                       "input_tokens": input_tokens, "output_tokens": output_tokens, "latency_s": latency_s}
+        with self._lock:
+            self.input_tokens += input_tokens; self.output_tokens += output_tokens
+            model_usage = self.by_model.setdefault(model_name, {"input_tokens": 0, "output_tokens": 0, "calls": 0})
+            model_usage["input_tokens"] += input_tokens; model_usage["output_tokens"] += output_tokens
+            model_usage["calls"] += 1
+            if self.call_sink is None: self.calls.append(call_record)
+        if self.call_sink is not None: self.call_sink(call_record)
+
+    def set_call_sink(self, call_sink: Callable[[Dict[str, Any]], None]) -> None:
+        """Streams all call records, including the ones recorded so far, to call_sink instead of keeping them."""
+        with self._lock:
+            pending, self.calls = self.calls, []
+            self.call_sink = call_sink
+        for call_record in pending: call_sink(call_record)
+
+    def call_records(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self.calls)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.input_tokens = 0; self.output_tokens = 0
+            self.by_model.clear(); self.calls.clear()
+            if self.budget is not None: self.budget.reset()
+
+    def set_budget(self, budget: Optional[StudyBudget]) -> None:
+        with self._lock: self.budget = budget
+
+    def route_call(self, agent_name: str, model_name: str, input_tokens: int, pending_cost_usd: float = 0.0) -> Optional[str]:
+        """
+        Applies the budget (if any) to the next call: the model to use, or None to skip the call.
+        pending_cost_usd: projected cost of admitted calls not recorded yet (e.g. earlier requests of the same batch job).
+        """
+        with self._lock:
+            if self.budget is None: return model_name
+            return self.budget.route(agent_name, model_name, input_tokens, estimate_cost_usd(self.by_model) + pending_cost_usd)
+
+    def budget_state(self) -> str:
+        with self._lock:
+            return self.budget.state(estimate_cost_usd(self.by_model)) if self.budget is not None else "ok"
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current token usage and estimated cost (USD), totals and per model."""
+        with self._lock:
+            by_model = {model: dict(usage) for model, usage in self.by_model.items()}
+            input_tokens, output_tokens = self.input_tokens, self.output_tokens
+            cost_usd = estimate_cost_usd(by_model)
+            budget = self.budget.snapshot(cost_usd) if self.budget is not None else None
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens, "by_model": by_model, "cost_usd": cost_usd, "budget": budget}
+
+_default_study_usage = StudyUsage() # Used by CLI runs and callers that never bind their own study
+_current_study_usage: contextvars.ContextVar[StudyUsage] = contextvars.ContextVar("delphibot_study_usage", default=_default_study_usage)
+
+def bind_study_usage(usage: StudyUsage) -> None:
+    """Records all agent usage of the current thread/context (and of work started via submit_in_context) into 'usage'."""
+    _current_study_usage.set(usage)
+
+def current_study_usage() -> StudyUsage:
+    return _current_study_usage.get()
+
+def submit_in_context(executor: Executor, fn: Callable, *args: Any) -> Future:
+    """executor.submit that carries the caller's context (i.e. the bound StudyUsage) into the worker thread."""
+    return executor.submit(contextvars.copy_context().run, fn, *args)
 
 def reset_session_tokens_for_engine():
-    global session_input_tokens, session_output_tokens
-    session_input_tokens = 0
-    session_output_tokens = 0
+    current_study_usage().reset()
+
+def _record_usage(model_name: str, input_tokens: int, output_tokens: int, agent_name: str = "", latency_s: Optional[float] = None) -> None:
+    current_study_usage().record(model_name, input_tokens, output_tokens, agent_name, latency_s)
+
+def set_study_budget(max_cost_usd: Optional[float], degrade_at: float = BUDGET_DEGRADE_AT_FRACTION,
+                     expected_output_tokens: Optional[Dict[str, int]] = None) -> None:
+    """Budget for the current study (None removes it). degrade_at=0 routes every call to the fallback model from the start."""
+    current_study_usage().set_budget(StudyBudget(max_cost_usd, degrade_at, expected_output_tokens) if max_cost_usd else None)
+
+def get_session_usage() -> Dict[str, Any]:
+    """Snapshot of the token usage and estimated cost (USD) of the current study, totals and per model."""
+    return current_study_usage().snapshot()
 
 def _run_agent_internal(agent: Agent, prompt_text: str) -> Any | None:
-    global session_input_tokens, session_output_tokens
-    current_input_tokens = count_tokens(prompt_text); session_input_tokens += current_input_tokens
-    print(f"  ENGINE: (Running Agent: {agent.name}, Input Tokens: {current_input_tokens})")
+    model_name = str(agent.model or MODEL_NAME)
+    current_input_tokens = count_tokens(prompt_text, model_name)
+    routed_model_name = current_study_usage().route_call(agent.name, model_name, current_input_tokens)
+    if routed_model_name is None:
+        print(f"!ENGINE ERROR: Study budget exhausted, {agent.name} call skipped (Input Tokens: {current_input_tokens})."); return None
+    if routed_model_name != model_name:
+        print(f"ENGINE WARNING: Study budget nearly used up, {agent.name} degraded from {model_name} to {routed_model_name}.")
+        agent = agent.clone(model=routed_model_name); model_name = routed_model_name
+    print(f"  ENGINE: (Running Agent: {agent.name} on {model_name}, Input Tokens: {current_input_tokens})")
     result = None
-    try:
-        # Simplified event loop handling for Streamlit compatibility
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        result = Runner.run_sync(agent, prompt_text)
-    except Exception as e:
-        print(f"!ENGINE ERROR during agent run: {e}")
-    finally:
-        loop.close()
+    started_at = time.perf_counter()
+    provider, provider_model_name = resolve_provider(model_name)
+    if provider is not None: # Self-hosted backend: pooled client on the provider's own event loop, concurrency-limited
+        try: result = provider.run(agent, provider_model_name, prompt_text)
+        except Exception as e: print(f"!ENGINE ERROR during agent run on provider '{provider.name}': {e}")
+    else:
+        try:
+            # Simplified event loop handling for Streamlit compatibility
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            result = Runner.run_sync(agent, prompt_text)
+        except Exception as e:
+            print(f"!ENGINE ERROR during agent run: {e}")
+        finally:
+            loop.close()
 
     output_text = result.final_output if result and result.final_output else ""
-    current_output_tokens = count_tokens(output_text); session_output_tokens += current_output_tokens
+    current_output_tokens = count_tokens(output_text, model_name)
+    _record_usage(model_name, current_input_tokens, current_output_tokens, agent.name, time.perf_counter() - started_at)
     print(f"  ENGINE: (Agent: {agent.name} completed, Output Tokens: {current_output_tokens})")
     return result
 
+def _scan_json_objects(text: str):
+    """
+    Single pass over 'text' yielding (start, end, is_complete) for each top-level {...} span.
+    Braces inside JSON strings are ignored; an unclosed trailing object is yielded with is_complete=False.
+    """
+    depth = 0; start = -1; in_string = False; escaped = False
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped: escaped = False
+            elif ch == "\\": escaped = True
+            elif ch == '"': in_string = False
+        elif ch == '"':
+            if depth > 0: in_string = True
+        elif ch == "{":
+            if depth == 0: start = i
+            depth += 1
+        elif ch == "}" and depth > 0:
+            depth -= 1
+            if depth == 0: yield start, i + 1, True
+    if depth > 0: yield start, len(text), False
+
+def _extract_json_with_fragment(response_str: Optional[str]) -> Tuple[Optional[Dict[str, Any]], str]:
+    """Returns (first parseable JSON object, "") or (None, malformed fragment to repair)."""
+    if not response_str: return None, ""
+    malformed_fragment = ""
+    for start, end, is_complete in _scan_json_objects(response_str):
+        candidate = response_str[start:end]
+        if is_complete:
+            try: parsed = json.loads(candidate)
+            except json.JSONDecodeError: parsed = None
+            if isinstance(parsed, dict): return parsed, ""
+        if not malformed_fragment: malformed_fragment = candidate
+    return None, malformed_fragment
+
 def extract_json_from_response(response_str: Optional[str]) -> Optional[Dict[str, Any]]:
     if not response_str: return None
-    core_json_str = ""
-    stripped_response = response_str.strip()
-    if stripped_response.startswith("{") and stripped_response.endswith("}"): core_json_str = stripped_response
-    else:
-        if stripped_response.startswith("```json"): json_block_start = stripped_response.find("```json") + len("```json"); json_block_end = stripped_response.rfind("```"); core_json_str = stripped_response[json_block_start:json_block_end].strip() if json_block_start < json_block_end and stripped_response[json_block_start:json_block_end].strip().startswith("{") and stripped_response[json_block_start:json_block_end].strip().endswith("}") else ""
-        elif stripped_response.startswith("```"): json_block_start = stripped_response.find("```") + len("```"); json_block_end = stripped_response.rfind("```"); core_json_str = stripped_response[json_block_start:json_block_end].strip() if json_block_start < json_block_end and stripped_response[json_block_start:json_block_end].strip().startswith("{") and stripped_response[json_block_start:json_block_end].strip().endswith("}") else ""
-        if not core_json_str: start_index = stripped_response.find("{"); end_index = stripped_response.rfind("}") + 1; core_json_str = stripped_response[start_index:end_index] if start_index != -1 and end_index > start_index else ""
-    if not core_json_str: print(f"!ENGINE WARNING: No valid JSON object found in string: '{response_str}'"); return None
-    try: return json.loads(core_json_str)
-    except json.JSONDecodeError as e: print(f"!ENGINE ERROR: JSON parsing failed. {e.msg}. Raw: '{core_json_str}' from '{response_str}'"); return None
+    parsed, malformed_fragment = _extract_json_with_fragment(response_str)
+    if parsed is None:
+        if malformed_fragment: print(f"!ENGINE ERROR: JSON parsing failed. Raw: '{malformed_fragment}' from '{response_str}'")
+        else: print(f"!ENGINE WARNING: No valid JSON object found in string: '{response_str}'")
+    return parsed
+
+# --- JSON Schema Validation & Repair ---
+PERSONA_SCHEMA_HINT = ('{"name": str, "age": int (optional), "role_title": str, "expertise_areas": [str], '
+                       '"stance": str (optional), ...further descriptive keys allowed}')
+FORMALIZED_GUIDES_SCHEMA_HINT = '{"InterviewGuideStructure_DEFINED": str, "DesiredOutputCatalogStructureGuidance_DEFINED": str}'
+
+def validate_persona_dict(persona: Dict[str, Any]) -> List[str]:
+    errors = []
+    if not any(isinstance(persona.get(k), str) and persona.get(k).strip() for k in ("name", "Name")):
+        errors.append("missing non-empty string 'name'")
+    if not any(isinstance(persona.get(k), str) and persona.get(k).strip() for k in ("role_title", "Role", "role")):
+        errors.append("missing non-empty string 'role_title'")
+    expertise = persona.get("expertise_areas")
+    if expertise is not None and not (isinstance(expertise, str) or (isinstance(expertise, list) and all(isinstance(e, str) for e in expertise))):
+        errors.append("'expertise_areas' must be a list of strings")
+    return errors
+
+def validate_formalized_guides(guides: Dict[str, Any]) -> List[str]:
+    return [f"missing non-empty string '{key}'" for key in ("InterviewGuideStructure_DEFINED", "DesiredOutputCatalogStructureGuidance_DEFINED")
+            if not (isinstance(guides.get(key), str) and guides.get(key).strip())]
+
+def parse_json_with_repair(
+    response_str: Optional[str],
+    validator: Callable[[Dict[str, Any]], List[str]],
+    schema_hint: str
+) -> Optional[Dict[str, Any]]:
+    """
+    Extracts and validates a JSON object. On failure, only the malformed fragment (not the original prompt)
+    is sent to the cheap JsonRepairAgent once.
+    """
+    parsed, malformed_fragment = _extract_json_with_fragment(response_str)
+    errors = validator(parsed) if parsed is not None else ["not valid JSON"]
+    if not errors: return parsed
+
+    fragment_to_repair = json.dumps(parsed, ensure_ascii=False) if parsed is not None else (malformed_fragment or (response_str or "").strip())
+    if not fragment_to_repair:
+        print(f"!ENGINE WARNING: No JSON object found to repair in string: '{response_str}'"); return None
+    print(f"ENGINE: JSON invalid ({'; '.join(errors)}). Requesting repair of the fragment.")
+    repair_prompt = (
+        f"Required schema: {schema_hint}\n"
+        f"Problems: {'; '.join(errors)}\n"
+        f"Fragment:\n{fragment_to_repair}\n\n"
+        f"Output ONLY the repaired JSON object."
+    )
+    repair_response_obj = _run_agent_internal(JsonRepairAgent, repair_prompt)
+    repaired, _ = _extract_json_with_fragment(repair_response_obj.final_output if repair_response_obj else None)
+    if repaired is None or validator(repaired):
+        print(f"!ENGINE ERROR: JSON repair failed. Raw: '{repair_response_obj.final_output if repair_response_obj else ''}'"); return None
+    print("ENGINE: JSON repaired successfully.")
+    return repaired
+
+# --- Interview Memory (last turns verbatim, older turns in a running digest) ---
+MEMORY_VERBATIM_TURNS = 4 # The most recent turns are always sent word for word
+MEMORY_FOLD_EVERY_TURNS = 3 # Older turns are folded into the digest in batches of this size (one HistoryDigestAgent call)
+DIGEST_MAX_CHARS = 2500 # Hard cap; the local fallback drops its oldest lines beyond it
+DIGEST_LINE_QUESTION_CHARS, DIGEST_LINE_ANSWER_CHARS = 120, 220
+MAX_PARALLEL_DIGESTS = 4
+
+_digest_executor = ThreadPoolExecutor(max_workers=MAX_PARALLEL_DIGESTS, thread_name_prefix="delphibot-digest") # Threads start on first use
+
+def _local_digest(current_digest: str, turns: List[Dict[str, Any]]) -> str:
+    """Extraction without a model call (used if the digest call fails or the budget skips it): one line per turn."""
+    lines = current_digest.splitlines() if current_digest else []
+    for turn in turns:
+        if "event" in turn: continue
+        answers = turn.get("answers") or {"": turn.get("answer", "")}
+        question = " ".join(str(turn.get("question", "")).split())[:DIGEST_LINE_QUESTION_CHARS]
+        for member, answer in answers.items():
+            lines.append(f"- {f'{member}: ' if member else ''}{question} -> {' '.join(str(answer).split())[:DIGEST_LINE_ANSWER_CHARS]}")
+    while lines and len("\n".join(lines)) > DIGEST_MAX_CHARS: lines.pop(0)
+    return "\n".join(lines)
+
+def fold_turns_into_digest(current_digest: str, turns: List[Dict[str, Any]]) -> str:
+    """Updated digest with 'turns' folded in: one HistoryDigestAgent call, local extraction as fallback."""
+    digest_prompt = (
+        f"CurrentDigest:\n{current_digest or '(empty)'}\n\n"
+        f"NewTurns:\n{json.dumps(turns, ensure_ascii=False)}\n\n"
+        f"Output ONLY the updated digest."
+    )
+    print(f"\nENGINE: --- HistoryDigestAgent: Task -> Fold {len(turns)} turns into the interview digest ---")
+    response_obj = _run_agent_internal(HistoryDigestAgent, digest_prompt)
+    if response_obj and response_obj.final_output and response_obj.final_output.strip():
+        return response_obj.final_output.strip()[:DIGEST_MAX_CHARS]
+    print("ENGINE WARNING: Interview digest call failed, falling back to local extraction.")
+    return _local_digest(current_digest, turns)
+
+class InterviewMemory:
+    """
+    Bounded interview history for the interviewer/responder prompts: the last MEMORY_VERBATIM_TURNS turns verbatim, all
+    older turns as a digest. Folding runs in the background (observe() after every turn), so no turn waits for it; until
+    a fold is done, its turns simply stay verbatim. The transcript itself is never changed (summaries use all of it).
+    """
+
+    def __init__(self, verbatim_turns: int = MEMORY_VERBATIM_TURNS, fold_every: int = MEMORY_FOLD_EVERY_TURNS):
+        self.verbatim_turns = verbatim_turns
+        self.fold_every = fold_every
+        self.digest = ""
+        self.folded_turns = 0 # Turns (from the start of the transcript) covered by the digest
+        self._pending: Optional[Future] = None
+
+    def _collect(self) -> None:
+        if self._pending is not None and self._pending.done():
+            try: self.digest, self.folded_turns = self._pending.result()
+            except Exception as e: print(f"!ENGINE ERROR: Folding the interview digest failed: {e}")
+            self._pending = None
+
+    def observe(self, transcript: List[Dict[str, Any]]) -> None:
+        """Starts folding once fold_every turns have left the verbatim window (at most one fold at a time)."""
+        self._collect()
+        fold_until = len(transcript) - self.verbatim_turns
+        if self._pending is None and fold_until - self.folded_turns >= self.fold_every:
+            self._pending = submit_in_context(_digest_executor, self._fold, self.digest, list(transcript[self.folded_turns:fold_until]), fold_until)
+
+    @staticmethod
+    def _fold(current_digest: str, turns: List[Dict[str, Any]], fold_until: int) -> Tuple[str, int]:
+        return fold_turns_into_digest(current_digest, turns), fold_until
+
+    def render(self, transcript: List[Dict[str, Any]], indent: Optional[int] = 2) -> str:
+        """The ConversationHistory segment of a prompt (preceded by the ConversationDigest once turns are folded)."""
+        self._collect()
+        recent = json.dumps(transcript[self.folded_turns:], indent=indent, ensure_ascii=False)
+        if not self.digest: return f"ConversationHistory: {recent}"
+        return (f"ConversationDigest (turns 1-{self.folded_turns}, condensed):\n{self.digest}\n"
+                f"ConversationHistory (from turn {self.folded_turns + 1}): {recent}")
+
 
 # --- ENGINE FUNCTIONS ---
 
-def _conduct_single_interview(
+def _instruct_interviewer(
     study_context_for_interview: Dict,
-    selected_persona_dict: Dict,
-    is_exploratory: bool,
-    max_turns: int
-) -> List[Dict[str, str]]:
-    local_interview_transcript: List[Dict[str, str]] = []
+    persona_segment: str,
+    persona_item: str,
+    is_exploratory: bool
+) -> Optional[str]:
+    """ManagerAgent call that formulates the InterviewerAgent's start instruction (shared by single and panel interviews)."""
     print(f"\nENGINE: --- ManagerAgent: Task -> Formulate Interview Start Instruction ---")
     interview_type_guidance_key = 'InterviewGuideExploratoryPrompt' if is_exploratory else 'InterviewGuideStructure_DEFINED'
     interview_type_description = "EXPLORATORY" if is_exploratory else "STRUCTURED (using defined guide)"
+    prior_factors = prior_factors_for_prompt(study_context_for_interview, " ".join(str(study_context_for_interview.get(key) or "") for key in (
+        "OverallStudyTopic", "KeyObjectives_Wofuer", interview_type_guidance_key)))
+    prior_factors_segment = (
+        f"5. These factors are already known from earlier studies on related topics. The interviewer should only briefly check "
+        f"whether they still hold for this persona and spend the turns on what is new or different:\n{prior_factors}\n" if prior_factors else "")
     prompt_for_manager_interview_start = (
         f"Current Study Context ({interview_type_description} Phase):\n{json.dumps(study_context_for_interview, indent=2, ensure_ascii=False)}\n"
-        f"Selected Persona:\n{json.dumps(selected_persona_dict, indent=2, ensure_ascii=False)}\n\n"
+        f"{persona_segment}\n\n"
         f"Instruct InterviewerAgent to start the interview. Provide it with:\n"
         f"1. OverallStudyTopic: '{study_context_for_interview['OverallStudyTopic']}'\n"
         f"2. TargetYear: {study_context_for_interview['TargetYear']}\n"
-        f"3. The selected PersonaProfile.\n"
+        f"3. {persona_item}\n"
         f"4. The guidance from StudyContext's '{interview_type_guidance_key}' for this {interview_type_description.lower()} interview.\n"
+        f"{prior_factors_segment}"
         f"Output ONLY the complete instruction for InterviewerAgent."
     )
     manager_response_obj = _run_agent_internal(ManagerAgent, prompt_for_manager_interview_start)
     if not (manager_response_obj and manager_response_obj.final_output):
         print(f"!ENGINE ERROR: ManagerAgent failed to instruct Interviewer for {interview_type_description} interview.")
-        return local_interview_transcript
-    instruction_for_interviewer = manager_response_obj.final_output
-    print(f"ENGINE: Manager's instruction for Interviewer ({interview_type_description}):\n{instruction_for_interviewer}")
+        return None
+    print(f"ENGINE: Manager's instruction for Interviewer ({interview_type_description}):\n{manager_response_obj.final_output}")
+    return manager_response_obj.final_output
+
+def _interview_ended_by_budget(turn: int, transcript: List[Dict[str, Any]]) -> bool:
+    if turn >= BUDGET_MIN_INTERVIEW_TURNS and current_study_usage().budget_state() != "ok":
+        print(f"ENGINE WARNING: Study budget nearly used up, interview ends after {turn} turns.")
+        transcript.append({"event": f"INTERVIEW_SHORTENED_BY_BUDGET_AT_TURN_{turn+1}"}); return True
+    return False
+
+def _conduct_single_interview(
+    study_context_for_interview: Dict,
+    selected_persona_dict: Dict,
+    is_exploratory: bool,
+    max_turns: int
+) -> List[Dict[str, str]]:
+    local_interview_transcript: List[Dict[str, str]] = []
+    interview_type_description = "EXPLORATORY" if is_exploratory else "STRUCTURED (using defined guide)"
+    instruction_for_interviewer = _instruct_interviewer(
+        study_context_for_interview, f"Selected Persona:\n{json.dumps(selected_persona_dict, indent=2, ensure_ascii=False)}",
+        "The selected PersonaProfile.", is_exploratory)
+    if instruction_for_interviewer is None: return local_interview_transcript
 
+    memory = InterviewMemory()
     current_question = ""
     for turn in range(max_turns):
+        if _interview_ended_by_budget(turn, local_interview_transcript): break
+        memory.observe(local_interview_transcript)
         print(f"\nENGINE: --- {interview_type_description} Interview - Turn {turn + 1}/{max_turns} ---")
         prompt_for_interviewer_agent: str
         if turn == 0: prompt_for_interviewer_agent = instruction_for_interviewer
@@ -243,7 +725,7 @@ def _conduct_single_interview(
             prompt_for_interviewer_agent = (
                 f"OverallStudyTopic: {study_context_for_interview['OverallStudyTopic']}\nTargetYear: {study_context_for_interview['TargetYear']}\n"
                 f"PersonaProfile: {json.dumps(selected_persona_dict, ensure_ascii=False)}\n"
-                f"ConversationHistory: {json.dumps(local_interview_transcript, indent=2, ensure_ascii=False)}\n"
+                f"{memory.render(local_interview_transcript)}\n"
                 f"You are conducting an {interview_type_description.lower()} interview, following {guide_ref_str}. Ask your next question or output INTERVIEW_COMPLETE."
             )
         interviewer_response_obj = _run_agent_internal(InterviewerAgent, prompt_for_interviewer_agent)
@@ -255,7 +737,7 @@ def _conduct_single_interview(
         
         prompt_for_responder_agent = (
             f"PersonaProfile: {json.dumps(selected_persona_dict, ensure_ascii=False)}\n"
-            f"ConversationHistory: {json.dumps(local_interview_transcript, indent=2, ensure_ascii=False)}\n"
+            f"{memory.render(local_interview_transcript)}\n"
             f"CurrentQuestion: '{current_question}'\n\nAnswer as persona. Output ONLY the answer."
         )
         responder_response_obj = _run_agent_internal(PersonaResponderAgent, prompt_for_responder_agent)
@@ -267,15 +749,273 @@ def _conduct_single_interview(
     return local_interview_transcript
 
 
+# --- Panel Interviews (focus group: one PanelResponderAgent call answers for all panel members) ---
+PANEL_SIZE_DEFAULT = 3
+MAX_PANEL_SIZE = 5 # All answers of a turn share one call's output, so larger panels mostly lengthen the answers
+PANEL_ANSWERS_SCHEMA_HINT = '{"answers": {"<panel ID>": "<answer of this member>", ...}}'
+
+def _panel_id(index: int) -> str:
+    return f"P{index + 1}"
+
+def _validate_panel_answers(payload: Dict[str, Any]) -> List[str]:
+    return [] if isinstance(payload.get("answers"), dict) and payload["answers"] else ["missing non-empty object 'answers'"]
+
+def split_panel_transcript(panel_transcript: List[Dict[str, Any]], num_members: int) -> List[List[Dict[str, str]]]:
+    """Per-member transcripts ({question, answer} turns) from a panel transcript; events are kept in every transcript."""
+    transcripts: List[List[Dict[str, str]]] = [[] for _ in range(num_members)]
+    for entry in panel_transcript:
+        for index, transcript in enumerate(transcripts):
+            if "event" in entry: transcript.append(dict(entry))
+            elif entry["answers"].get(_panel_id(index)): transcript.append({"question": entry["question"], "answer": entry["answers"][_panel_id(index)]})
+    return transcripts
+
+def _conduct_panel_interview(
+    study_context_for_interview: Dict,
+    panel_personas: List[Dict],
+    is_exploratory: bool,
+    max_turns: int
+) -> List[Dict[str, Any]]:
+    """
+    Focus group variant of _conduct_single_interview: every question goes to the whole panel and ONE PanelResponderAgent
+    call returns the answers of all members. Returns the panel transcript ({question, answers: {panel ID: answer}} turns).
+    """
+    panel_transcript: List[Dict[str, Any]] = []
+    interview_type_description = "EXPLORATORY" if is_exploratory else "STRUCTURED (using defined guide)"
+    panel_profiles = {_panel_id(i): persona for i, persona in enumerate(panel_personas)}
+    instruction_for_interviewer = _instruct_interviewer(
+        study_context_for_interview,
+        f"Selected Panel (focus group, questions go to ALL members at once, members are referred to by panel ID):\n{json.dumps(panel_profiles, indent=2, ensure_ascii=False)}",
+        "The PersonaProfiles of the panel. Questions should draw out the differences between the members' perspectives.", is_exploratory)
+    if instruction_for_interviewer is None: return panel_transcript
+
+    memory = InterviewMemory()
+    for turn in range(max_turns):
+        if _interview_ended_by_budget(turn, panel_transcript): break
+        memory.observe(panel_transcript)
+        print(f"\nENGINE: --- {interview_type_description} Panel Interview ({len(panel_personas)} personas) - Turn {turn + 1}/{max_turns} ---")
+        # Compact JSON: the panel history carries one answer per member and turn
+        history_segment = memory.render(panel_transcript, indent=None)
+        if turn == 0: prompt_for_interviewer_agent = instruction_for_interviewer
+        else:
+            guide_ref_str = (f"exploratory guidance: '{study_context_for_interview.get('InterviewGuideExploratoryPrompt', '')}'"
+                           if is_exploratory
+                           else f"defined guide: '{study_context_for_interview.get('InterviewGuideStructure_DEFINED', '')}'")
+            prompt_for_interviewer_agent = (
+                f"OverallStudyTopic: {study_context_for_interview['OverallStudyTopic']}\nTargetYear: {study_context_for_interview['TargetYear']}\n"
+                f"PanelPersonaProfiles: {json.dumps(panel_profiles, ensure_ascii=False)}\n"
+                f"{history_segment}\n"
+                f"You are moderating an {interview_type_description.lower()} focus group interview, following {guide_ref_str}. "
+                f"Your question goes to all panel members. Ask your next question or output INTERVIEW_COMPLETE."
+            )
+        interviewer_response_obj = _run_agent_internal(InterviewerAgent, prompt_for_interviewer_agent)
+        if not (interviewer_response_obj and interviewer_response_obj.final_output): print(f"!ENGINE ERROR: InterviewerAgent failed panel turn {turn + 1}."); break
+        current_question = interviewer_response_obj.final_output.strip()
+        print(f"ENGINE: InterviewerAgent's Panel Question {turn + 1}:\n{current_question}")
+        if "INTERVIEW_COMPLETE" in current_question.upper():
+            print("ENGINE: InterviewerAgent signaled panel interview completion."); panel_transcript.append({"event": f"INTERVIEW_CONCLUDED_BY_INTERVIEWER_AT_TURN_{turn+1}", "signal": current_question}); break
+
+        prompt_for_panel_responder = (
+            f"PanelPersonaProfiles: {json.dumps(panel_profiles, ensure_ascii=False)}\n"
+            f"{history_segment}\n"
+            f"CurrentQuestion: '{current_question}'\n\n"
+            f"Answer for ALL {len(panel_profiles)} panel members ({', '.join(panel_profiles)}). Output ONLY a JSON object: {PANEL_ANSWERS_SCHEMA_HINT}"
+        )
+        responder_response_obj = _run_agent_internal(PanelResponderAgent, prompt_for_panel_responder)
+        parsed = parse_json_with_repair(responder_response_obj.final_output if responder_response_obj else None, _validate_panel_answers, PANEL_ANSWERS_SCHEMA_HINT)
+        answers = {panel_id: str(parsed["answers"][panel_id]).strip() for panel_id in panel_profiles
+                   if parsed and str(parsed["answers"].get(panel_id) or "").strip()}
+        if not answers: print(f"!ENGINE ERROR: PanelResponderAgent failed panel turn {turn + 1}."); break
+        if len(answers) < len(panel_profiles): print(f"ENGINE WARNING: No answer from {sorted(set(panel_profiles) - set(answers))} in panel turn {turn + 1}.")
+        print(f"ENGINE: PanelResponderAgent's Answers {turn + 1}: {len(answers)} of {len(panel_profiles)} members")
+        panel_transcript.append({"question": current_question, "answers": answers})
+    print(f"\nENGINE: --- {interview_type_description} Panel Interview Loop Finished. Transcript ({len(panel_transcript)} turns). ---")
+    return panel_transcript
+
+
+# --- Single-Shot Simulation (one SimulatedInterviewAgent call writes the whole interview) ---
+SIMULATION_MODE_TURN_BY_TURN = "turn_by_turn" # Interviewer and responder alternate, 2 calls per turn (default)
+SIMULATION_MODE_SINGLE_SHOT = "single_shot" # One call writes all turns; summarized as usual
+SIMULATION_MODE_SINGLE_SHOT_WITH_SUMMARY = "single_shot_with_summary" # One call writes all turns and the summary
+SIMULATION_MODES = (SIMULATION_MODE_TURN_BY_TURN, SIMULATION_MODE_SINGLE_SHOT, SIMULATION_MODE_SINGLE_SHOT_WITH_SUMMARY)
+SIMULATED_INTERVIEW_SCHEMA_HINT = '{"transcript": [{"question": "<interviewer question>", "answer": "<expert answer>"}, ...]}'
+SIMULATED_INTERVIEW_WITH_SUMMARY_SCHEMA_HINT = '{"transcript": [{"question": "...", "answer": "..."}, ...], "summary": "<summary text>"}'
+
+def simulation_mode(study_context: Dict) -> str:
+    """The study's 'SimulationMode' (AI persona interviews only; panels and human interviews always run turn by turn)."""
+    mode = study_context.get("SimulationMode") or SIMULATION_MODE_TURN_BY_TURN
+    return mode if mode in SIMULATION_MODES else SIMULATION_MODE_TURN_BY_TURN
+
+def _validate_simulated_interview(payload: Dict[str, Any]) -> List[str]:
+    transcript = payload.get("transcript")
+    if not isinstance(transcript, list) or not transcript: return ["missing non-empty list 'transcript'"]
+    if not all(isinstance(turn, dict) and str(turn.get("question") or "").strip() and str(turn.get("answer") or "").strip() for turn in transcript):
+        return ["every transcript turn needs a non-empty 'question' and 'answer'"]
+    return []
+
+def _simulate_interview_in_one_call(
+    study_context_for_interview: Dict,
+    selected_persona_dict: Dict,
+    is_exploratory: bool,
+    max_turns: int,
+    with_summary: bool
+) -> Tuple[List[Dict[str, str]], str]:
+    """
+    Compressed alternative to _conduct_single_interview for large screening runs: ONE call instead of 2 per turn plus the
+    interviewer instruction. Returns (transcript, summary); the summary is "" unless requested and delivered.
+    """
+    interview_type_description = "EXPLORATORY" if is_exploratory else "STRUCTURED (using defined guide)"
+    if current_study_usage().budget_state() != "ok":
+        print(f"ENGINE WARNING: Study budget nearly used up, simulated interview limited to {BUDGET_MIN_INTERVIEW_TURNS} turns.")
+        max_turns = min(max_turns, BUDGET_MIN_INTERVIEW_TURNS)
+    guide_key = 'InterviewGuideExploratoryPrompt' if is_exploratory else 'InterviewGuideStructure_DEFINED'
+    prior_factors = prior_factors_for_prompt(study_context_for_interview, " ".join(str(study_context_for_interview.get(key) or "") for key in (
+        "OverallStudyTopic", "KeyObjectives_Wofuer", guide_key)))
+    summary_guidance_key = 'SummarizerGuidanceExploratory' if is_exploratory else 'DesiredOutputCatalogStructureGuidance_DEFINED'
+    summary_segment = (
+        f"After the interview, write the summary of it (key 'summary') following this guidance:\n"
+        f"{study_context_for_interview.get(summary_guidance_key, 'No specific structural guidance provided.')}\n\n" if with_summary else "")
+    schema_hint = SIMULATED_INTERVIEW_WITH_SUMMARY_SCHEMA_HINT if with_summary else SIMULATED_INTERVIEW_SCHEMA_HINT
+    simulation_prompt = (
+        f"OverallStudyTopic: {study_context_for_interview['OverallStudyTopic']}\nTargetYear: {study_context_for_interview['TargetYear']}\n"
+        f"KeyObjectives: {study_context_for_interview.get('KeyObjectives_Wofuer', '')}\n"
+        f"PersonaProfile: {json.dumps(selected_persona_dict, ensure_ascii=False)}\n\n"
+        f"Interview type: {interview_type_description}. Guidance (from StudyContext's '{guide_key}'):\n{study_context_for_interview.get(guide_key, '')}\n\n"
+        + (f"Factors already known from earlier studies (only check briefly whether they hold for this persona):\n{prior_factors}\n\n" if prior_factors else "")
+        + f"Write the complete interview with at most {max_turns} turns (one interviewer question and one expert answer per turn).\n"
+        f"{summary_segment}"
+        f"Output ONLY a JSON object: {schema_hint}"
+    )
+    print(f"\nENGINE: --- SimulatedInterviewAgent: Task -> Write {interview_type_description} Interview ({max_turns} turns{', with summary' if with_summary else ''}) in one call ---")
+    response_obj = _run_agent_internal(SimulatedInterviewAgent, simulation_prompt)
+    parsed = parse_json_with_repair(response_obj.final_output if response_obj else None, _validate_simulated_interview, schema_hint)
+    if parsed is None:
+        print("!ENGINE ERROR: SimulatedInterviewAgent did not deliver a usable transcript."); return [], ""
+    transcript = [{"question": str(turn["question"]).strip(), "answer": str(turn["answer"]).strip()} for turn in parsed["transcript"][:max_turns]]
+    summary = str(parsed.get("summary") or "").strip() if with_summary else ""
+    if with_summary and not summary: print("ENGINE WARNING: Simulated interview came without a summary; it is summarized separately.")
+    print(f"ENGINE: --- Simulated {interview_type_description} Interview Finished. Transcript ({len(transcript)} turns). ---")
+    return transcript, summary
+
+
+# --- Transcript Summarization (chunked & parallel for long transcripts) ---
+SUMMARY_CHUNK_TURNS = 6 # Turns per chunk; shorter transcripts are summarized in a single call
+SUMMARY_CHUNK_OVERLAP_TURNS = 1 # Turns shared by neighbouring chunks so factors at a boundary keep their context
+MAX_PARALLEL_SUMMARY_CHUNKS = 4
+
+def _build_summarizer_prompt(
+    base_instruction: str,
+    study_context: Dict,
+    summarizer_guidance_key: str,
+    transcript: List[Dict[str, str]],
+    part_note: str = ""
+) -> str:
+    return (
+        f"{base_instruction}\n\n" 
+        f"OverallStudyTopic: {study_context.get('OverallStudyTopic')}\n"
+        f"TargetYear: {study_context.get('TargetYear')}\n"
+        f"Guidance on structure/output (from StudyContext's '{summarizer_guidance_key}'):\n"
+        f"{study_context.get(summarizer_guidance_key, 'No specific structural guidance provided.')}\n\n"
+        f"{part_note}"
+        f"**Interview Transcript to Summarize:**\n" 
+        f"```json\n{json.dumps(transcript, indent=2, ensure_ascii=False)}\n```\n\n"
+        f"Please provide the required summary based on ALL the above information, especially focusing on the Interview Transcript and the provided Guidance."
+    )
+
+def split_transcript_into_windows(
+    transcript: List[Dict[str, str]],
+    chunk_turns: int = SUMMARY_CHUNK_TURNS,
+    overlap_turns: int = SUMMARY_CHUNK_OVERLAP_TURNS
+) -> List[List[Dict[str, str]]]:
+    if len(transcript) <= chunk_turns: return [transcript]
+    step = max(1, chunk_turns - overlap_turns)
+    windows = []
+    for start in range(0, len(transcript), step):
+        windows.append(transcript[start:start + chunk_turns])
+        if start + chunk_turns >= len(transcript): break
+    return windows
+
+def summarize_interview_transcript(
+    base_instruction: str,
+    study_context: Dict,
+    transcript: List[Dict[str, str]],
+    is_exploratory: bool,
+    chunk_turns: Optional[int] = None,
+    overlap_turns: int = SUMMARY_CHUNK_OVERLAP_TURNS
+) -> Optional[str]:
+    """
+    Summarizes a transcript in the usual summary format. Long transcripts are split into overlapping turn windows
+    that are summarized in parallel; the partial summaries are then merged by one more SummarizerAgent call.
+    """
+    summarizer_guidance_key = 'SummarizerGuidanceExploratory' if is_exploratory else 'DesiredOutputCatalogStructureGuidance_DEFINED'
+    mode_label = 'Exploratory' if is_exploratory else 'Structured'
+    windows = split_transcript_into_windows(transcript, chunk_turns or SUMMARY_CHUNK_TURNS, overlap_turns)
+    if len(windows) == 1:
+        print(f"\nENGINE: --- SummarizerAgent: Task -> Provide Summary ({mode_label}) ---")
+        summarizer_response_obj = _run_agent_internal(SummarizerAgent, _build_summarizer_prompt(base_instruction, study_context, summarizer_guidance_key, transcript))
+        return summarizer_response_obj.final_output if summarizer_response_obj and summarizer_response_obj.final_output else None
+
+    print(f"\nENGINE: --- SummarizerAgent: Task -> Provide Summary ({mode_label}) in {len(windows)} parallel chunks ---")
+    chunk_prompts = [
+        _build_summarizer_prompt(base_instruction, study_context, summarizer_guidance_key, window,
+                                 part_note=f"NOTE: This is part {i + 1} of {len(windows)} of a longer interview. Capture everything in this part; "
+                                           f"the parts are merged afterwards.\n\n")
+        for i, window in enumerate(windows)
+    ]
+    with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL_SUMMARY_CHUNKS, len(chunk_prompts)), thread_name_prefix="delphibot-summary") as executor:
+        futures = [submit_in_context(executor, _run_agent_internal, SummarizerAgent, prompt) for prompt in chunk_prompts]
+        chunk_results = [future.result() for future in futures]
+    partial_summaries = [r.final_output for r in chunk_results if r and r.final_output]
+    if not partial_summaries: return None
+    if len(partial_summaries) < len(chunk_prompts): print(f"!ENGINE WARNING: {len(chunk_prompts) - len(partial_summaries)} summary chunk(s) failed.")
+
+    print(f"ENGINE: --- SummarizerAgent: Task -> Merge {len(partial_summaries)} Partial Summaries ({mode_label}) ---")
+    merge_prompt = (
+        f"{base_instruction}\n\n"
+        f"OverallStudyTopic: {study_context.get('OverallStudyTopic')}\n"
+        f"TargetYear: {study_context.get('TargetYear')}\n"
+        f"Guidance on structure/output (from StudyContext's '{summarizer_guidance_key}'):\n"
+        f"{study_context.get(summarizer_guidance_key, 'No specific structural guidance provided.')}\n\n"
+        f"The interview was summarized in {len(partial_summaries)} consecutive, slightly overlapping parts. "
+        f"Merge these partial summaries into ONE summary of the whole interview in the required format. "
+        f"Combine duplicates (the same factor may appear in neighbouring parts) but keep every distinct factor and detail.\n\n"
+        + "\n\n".join(f"**Partial Summary {i + 1}:**\n{summary}" for i, summary in enumerate(partial_summaries))
+    )
+    merged_response_obj = _run_agent_internal(SummarizerAgent, merge_prompt)
+    return merged_response_obj.final_output if merged_response_obj and merged_response_obj.final_output else None
+
+
 def perform_study_phase(
     study_context: Dict,
     is_exploratory_phase: bool,
-    max_interview_turns: int = MAX_INTERVIEW_TURNS_DEFAULT
+    max_interview_turns: int = MAX_INTERVIEW_TURNS_DEFAULT,
+    defer_summary: bool = False,
+    preselected_persona: Optional[Dict[str, Any]] = None,
+    summary_chunk_turns: Optional[int] = None
 ) -> Dict[str, Any]:
     """
     Performs one phase of the study. This version uses the direct-prompting method.
+    With defer_summary=True the SummarizerAgent is not called; its full prompt is returned as
+    'pending_summary_prompt' so it can be run later (e.g. through the Batch API, see delphibot_batch).
+    With preselected_persona (e.g. from delphibot_persona_pool) the PersonaManagerAgent call is skipped.
+    summary_chunk_turns overrides SUMMARY_CHUNK_TURNS for the chunked summarization of long transcripts.
+    study_context['SimulationMode'] (see SIMULATION_MODES) can compress the interview, and optionally its summary, into one call.
     """
+    phase_results = conduct_interview_stage(study_context, is_exploratory_phase, max_interview_turns, preselected_persona)
+    if phase_results.get("error_message"):
+        phase_results.pop("error_message_interview_loop", None)
+        return phase_results
+    return summarize_interview_stage(phase_results, study_context, is_exploratory_phase, defer_summary, summary_chunk_turns)
+
+
+def conduct_interview_stage(
+    study_context: Dict,
+    is_exploratory_phase: bool,
+    max_interview_turns: int = MAX_INTERVIEW_TURNS_DEFAULT,
+    preselected_persona: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """Steps 1-3 of perform_study_phase (persona + interview). The result is passed on to summarize_interview_stage."""
     phase_results = {
+        "interview_id": uuid.uuid4().hex[:12],
         "transcript": [], 
         "summary": "", 
         "selected_persona_dict": None, 
@@ -285,42 +1025,57 @@ def perform_study_phase(
         "study_context_used": study_context.copy()
     }
     selected_persona_dict_candidate: Optional[Dict[str, Any]] = None
+    persona_library = get_persona_library() if study_context.get("UsePersonaLibrary", True) else None
 
-    # 1. PersonaManager -> Get Persona (Instruction built directly in Python)
-    print(f"\nENGINE: --- Building direct instruction for PersonaManagerAgent ---")
+    library_persona = None
+    if preselected_persona is None and persona_library is not None:
+        library_persona = persona_library.find_persona(
+            study_context.get("OverallStudyTopic", ""), study_context.get("PersonaRequirementsGuidance", ""),
+            exclude_roles=study_context.get("roles_interviewed_so_far", []))
 
-    roles_already_covered_prompt_segment = ""
-    roles_list = [
-        role for role in study_context.get("roles_interviewed_so_far", []) 
-        if role and role != "UnknownRole"
-    ]
-    if not is_exploratory_phase and roles_list:
-        roles_already_covered_prompt_segment = (
-            f"\n**IMPORTANT: This is a list of 'roles_or_expertise_already_interviewed'**\n"
-            f"Experts with the following roles/expertise areas have already been interviewed: {json.dumps(roles_list, ensure_ascii=False)}.\n"
-            f"Your task is to select or create a persona that offers a *distinctly different perspective* or a different primary area of expertise "
-            f"to maximize thematic diversity. DO NOT select a persona whose main role is already covered in the list above."
-        )
+    if preselected_persona is not None:
+        print(f"\nENGINE: --- Using preselected persona (no PersonaManagerAgent call) ---")
+        selected_persona_dict_candidate = preselected_persona
+    elif library_persona is not None:
+        print(f"\nENGINE: --- Reusing persona from persona library (no PersonaManagerAgent call) ---")
+        selected_persona_dict_candidate = library_persona
+    else:
+        # 1. PersonaManager -> Get Persona (Instruction built directly in Python)
+        print(f"\nENGINE: --- Building direct instruction for PersonaManagerAgent ---")
 
-    instruction_for_persona_manager = (
-        f"OverallStudyTopic: {study_context.get('OverallStudyTopic')}\n\n"
-        f"PersonaRequirementsGuidance: {study_context.get('PersonaRequirementsGuidance')}\n\n"
-        f"PredefinedPersonas (for you to choose from if a suitable, diverse option exists): {json.dumps(study_context.get('PredefinedPersonas', []), ensure_ascii=False)}\n"
-        f"{roles_already_covered_prompt_segment}\n\n"
-        f"Based on all the information above, provide ONE suitable expert persona. "
-        f"Output ONLY the final persona JSON object."
-    )
+        roles_already_covered_prompt_segment = ""
+        roles_list = [
+            role for role in study_context.get("roles_interviewed_so_far", []) 
+            if role and role != "UnknownRole"
+        ]
+        if not is_exploratory_phase and roles_list:
+            roles_already_covered_prompt_segment = (
+                f"\n**IMPORTANT: This is a list of 'roles_or_expertise_already_interviewed'**\n"
+                f"Experts with the following roles/expertise areas have already been interviewed: {json.dumps(roles_list, ensure_ascii=False)}.\n"
+                f"Your task is to select or create a persona that offers a *distinctly different perspective* or a different primary area of expertise "
+                f"to maximize thematic diversity. DO NOT select a persona whose main role is already covered in the list above."
+            )
 
-    # 2. PersonaManager -> Get Persona
-    print(f"\nENGINE: --- PersonaManagerAgent: Task -> Provide Persona ---")
-    persona_response_obj = _run_agent_internal(PersonaManagerAgent, instruction_for_persona_manager)
+        instruction_for_persona_manager = (
+            f"OverallStudyTopic: {study_context.get('OverallStudyTopic')}\n\n"
+            f"PersonaRequirementsGuidance: {study_context.get('PersonaRequirementsGuidance')}\n\n"
+            f"PredefinedPersonas (for you to choose from if a suitable, diverse option exists): {json.dumps(study_context.get('PredefinedPersonas', []), ensure_ascii=False)}\n"
+            f"{roles_already_covered_prompt_segment}\n\n"
+            f"Based on all the information above, provide ONE suitable expert persona. "
+            f"Output ONLY the final persona JSON object."
+        )
+
+        # 2. PersonaManager -> Get Persona
+        print(f"\nENGINE: --- PersonaManagerAgent: Task -> Provide Persona ---")
+        persona_response_obj = _run_agent_internal(PersonaManagerAgent, instruction_for_persona_manager)
     
-    if not (persona_response_obj and persona_response_obj.final_output):
-        phase_results["error_message"] = "PersonaManagerAgent failed to provide a persona."; return phase_results
+        if not (persona_response_obj and persona_response_obj.final_output):
+            phase_results["error_message"] = "PersonaManagerAgent failed to provide a persona."; return phase_results
     
-    selected_persona_dict_candidate = extract_json_from_response(persona_response_obj.final_output)
-    if not selected_persona_dict_candidate:
-        phase_results["error_message"] = f"PersonaManagerAgent JSON parsing failed. Raw: '{persona_response_obj.final_output if persona_response_obj else 'No output from PersonaManager'}'."; return phase_results
+        selected_persona_dict_candidate = parse_json_with_repair(persona_response_obj.final_output, validate_persona_dict, PERSONA_SCHEMA_HINT)
+        if not selected_persona_dict_candidate:
+            phase_results["error_message"] = f"PersonaManagerAgent JSON parsing failed. Raw: '{persona_response_obj.final_output if persona_response_obj else 'No output from PersonaManager'}'."; return phase_results
+        if persona_library is not None: persona_library.save_persona(selected_persona_dict_candidate, study_context.get("OverallStudyTopic", ""))
     
     phase_results["selected_persona_dict"] = selected_persona_dict_candidate
     phase_results["selected_persona_name"] = phase_results["selected_persona_dict"].get("Name", 
@@ -334,19 +1089,69 @@ def perform_study_phase(
         print(f"!ENGINE ERROR: {phase_results['error_message']}")
         return phase_results
 
-    interview_transcript_result = _conduct_single_interview(
-        study_context_for_interview=study_context,
-        selected_persona_dict=phase_results["selected_persona_dict"],
-        is_exploratory=is_exploratory_phase,
-        max_turns=max_interview_turns
-    )
+    mode = simulation_mode(study_context)
+    if mode == SIMULATION_MODE_TURN_BY_TURN:
+        interview_transcript_result = _conduct_single_interview(
+            study_context_for_interview=study_context,
+            selected_persona_dict=phase_results["selected_persona_dict"],
+            is_exploratory=is_exploratory_phase,
+            max_turns=max_interview_turns
+        )
+    else:
+        interview_transcript_result, phase_results["summary"] = _simulate_interview_in_one_call(
+            study_context, phase_results["selected_persona_dict"], is_exploratory_phase, max_interview_turns,
+            with_summary=mode == SIMULATION_MODE_SINGLE_SHOT_WITH_SUMMARY)
     phase_results["transcript"] = interview_transcript_result
+    phase_results["simulation_mode"] = mode
     if not phase_results["transcript"]:
         phase_results["error_message_interview_loop"] = "Interview did not produce a transcript or an error occurred in _conduct_single_interview."
-        
+    return phase_results
+
 
+def conduct_panel_interview_stage(
+    study_context: Dict,
+    panel_personas: List[Dict[str, Any]],
+    is_exploratory_phase: bool,
+    max_interview_turns: int = MAX_INTERVIEW_TURNS_DEFAULT
+) -> List[Dict[str, Any]]:
+    """
+    Panel counterpart of conduct_interview_stage for preselected personas (e.g. from delphibot_persona_pool): ONE panel
+    interview, split back into one result per persona (same keys as conduct_interview_stage, plus 'panel_id') that
+    summarize_interview_stage handles like any other interview.
+    """
+    panel_transcript = _conduct_panel_interview(study_context, panel_personas, is_exploratory_phase, max_interview_turns)
+    panel_id = uuid.uuid4().hex[:12]
+    results = []
+    for persona, transcript in zip(panel_personas, split_panel_transcript(panel_transcript, len(panel_personas))):
+        has_answers = any("answer" in entry for entry in transcript)
+        results.append({
+            "interview_id": uuid.uuid4().hex[:12],
+            "panel_id": panel_id,
+            "transcript": transcript if has_answers else [],
+            "summary": "",
+            "selected_persona_dict": persona,
+            "selected_persona_name": persona.get("Name", persona.get("name", "Unknown Persona")),
+            "error_message": None,
+            "error_message_interview_loop": None if has_answers else "Panel interview did not produce answers for this persona.",
+            "study_context_used": study_context.copy()
+        })
+    return results
+
+def summarize_interview_stage(
+    phase_results: Dict[str, Any],
+    study_context: Dict,
+    is_exploratory_phase: bool,
+    defer_summary: bool = False,
+    summary_chunk_turns: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Step 4 of perform_study_phase. Independent of later interviews, so it can run in the background (see delphibot_pipeline).
+    A summary already written by a single-shot simulation (SIMULATION_MODE_SINGLE_SHOT_WITH_SUMMARY) is kept as is.
+    """
     # 4. Summarize Interview
-    if phase_results["transcript"] and not phase_results.get("error_message_interview_loop"):
+    if phase_results.get("summary") and phase_results["transcript"] and not phase_results.get("error_message_interview_loop"):
+        print(f"ENGINE: Summary came with the simulated interview ({phase_results['selected_persona_name']}), no SummarizerAgent call.")
+    elif phase_results["transcript"] and not phase_results.get("error_message_interview_loop"):
         print(f"\nENGINE: --- ManagerAgent: Task -> Formulate Summarizer Instruction ({'Exploratory' if is_exploratory_phase else 'Structured'}) ---")
         summarizer_guidance_key = 'SummarizerGuidanceExploratory' if is_exploratory_phase else 'DesiredOutputCatalogStructureGuidance_DEFINED'
         summarizer_mode_description = "an 'exploratory_summary' to PROPOSE a structure" if is_exploratory_phase else "a 'structured_summary' adhering to the defined output structure"
@@ -369,42 +1174,40 @@ def perform_study_phase(
             base_instruction_from_manager = manager_response_obj.final_output 
             print(f"ENGINE: Manager's base instruction for Summarizer:\n{base_instruction_from_manager}")
 
-            full_prompt_for_summarizer = (
-                f"{base_instruction_from_manager}\n\n" 
-                f"OverallStudyTopic: {study_context.get('OverallStudyTopic')}\n"
-                f"TargetYear: {study_context.get('TargetYear')}\n"
-                f"Guidance on structure/output (from StudyContext's '{summarizer_guidance_key}'):\n"
-                f"{study_context.get(summarizer_guidance_key, 'No specific structural guidance provided.')}\n\n"
-                f"**Interview Transcript to Summarize:**\n" 
-                f"```json\n{json.dumps(phase_results['transcript'], indent=2, ensure_ascii=False)}\n```\n\n"
-                f"Please provide the required summary based on ALL the above information, especially focusing on the Interview Transcript and the provided Guidance."
-            )
-            
-            print(f"\nENGINE: --- SummarizerAgent: Task -> Provide Summary ({'Exploratory' if is_exploratory_phase else 'Structured'}) ---")
-            
-            summarizer_response_obj = _run_agent_internal(SummarizerAgent, full_prompt_for_summarizer) 
-            
-            if summarizer_response_obj and summarizer_response_obj.final_output:
-                phase_results["summary"] = summarizer_response_obj.final_output
-            else: 
-                phase_results["error_message"] = "SummarizerAgent failed to provide summary."
+            if defer_summary:
+                print(f"ENGINE: SummarizerAgent call deferred ({'Exploratory' if is_exploratory_phase else 'Structured'}).")
+                phase_results["pending_summary_prompt"] = _build_summarizer_prompt(
+                    base_instruction_from_manager, study_context, summarizer_guidance_key, phase_results["transcript"])
+            else:
+                summary = summarize_interview_transcript(base_instruction_from_manager, study_context, phase_results["transcript"],
+                                                         is_exploratory_phase, summary_chunk_turns)
+                if summary:
+                    phase_results["summary"] = summary
+                else: 
+                    phase_results["error_message"] = "SummarizerAgent failed to provide summary."
     elif not phase_results.get("error_message") and not phase_results.get("error_message_interview_loop"): 
          phase_results["error_message"] = "No transcript available to summarize for this round (or previous interview error)."
     
     if phase_results.get("error_message_interview_loop") and not phase_results.get("error_message"):
         phase_results["error_message"] = phase_results["error_message_interview_loop"]
-    del phase_results["error_message_interview_loop"]
+    phase_results.pop("error_message_interview_loop", None)
 
     return phase_results
 
 
 def formalize_structure_from_exploratory_summary(study_context: Dict, exploratory_summary: str) -> Optional[Dict[str,str]]:
     print(f"\nENGINE: --- ManagerAgent: Task -> Formalize Discovered Structure from Exploratory Summary ---")
+    prior_factors = prior_factors_for_prompt(study_context, f"{study_context['OverallStudyTopic']} {exploratory_summary}")
+    prior_factors_segment = (
+        f"Relevant factors from earlier studies on related topics (top matches from the local study index, not from this interview):\n"
+        f"{prior_factors}\nUse them to sharpen and complete the Systemebenen where they fit this study; ignore those that do not.\n\n"
+        if prior_factors else "")
     prompt_for_manager_formalize = (
         f"The following 'Exploratory Summary' was generated for the Study Topic '{study_context['OverallStudyTopic']}' "
         f"(Target Year: {study_context['TargetYear']}). It proposes several thematic categories (Systemebenen), "
         f"some with detailed factors and others noted as having no content from the initial interview:\n\n"
         f"```text\n{exploratory_summary}\n```\n\n"
+        f"{prior_factors_segment}"
         f"Your task is to analyze this proposed structure and define a focused and robust set of guides for subsequent structured interviews:\n"
         f"1.  **'InterviewGuideStructure_DEFINED':** Create a concise string that lists the **key thematic categories (Systemebenen)** that should be systematically covered. "
         f"    You might select the most content-rich categories from the proposal, or refine their names for clarity. "
@@ -419,10 +1222,8 @@ def formalize_structure_from_exploratory_summary(study_context: Dict, explorator
     )
     manager_response_obj = _run_agent_internal(ManagerAgent, prompt_for_manager_formalize)
     if manager_response_obj and manager_response_obj.final_output:
-        formalized_guides_dict = extract_json_from_response(manager_response_obj.final_output)
-        if formalized_guides_dict and \
-           formalized_guides_dict.get("InterviewGuideStructure_DEFINED") and \
-           formalized_guides_dict.get("DesiredOutputCatalogStructureGuidance_DEFINED"):
+        formalized_guides_dict = parse_json_with_repair(manager_response_obj.final_output, validate_formalized_guides, FORMALIZED_GUIDES_SCHEMA_HINT)
+        if formalized_guides_dict:
             print("ENGINE: ManagerAgent successfully formalized structure.")
             return formalized_guides_dict
         else: 
@@ -431,7 +1232,24 @@ def formalize_structure_from_exploratory_summary(study_context: Dict, explorator
         print("!ENGINE ERROR: ManagerAgent failed to formalize structure.")
     return None
 
-def generate_final_catalog_from_summaries(study_context: Dict, aggregated_summaries: str) -> Optional[str]:
+def reconcile_formalized_guides(study_context: Dict, formalized_guides: Dict[str, str], summary_diff: str) -> Optional[Dict[str, str]]:
+    """Cheap update of guides formalized from an earlier version of the exploratory summary: only the diff is sent, not the summary."""
+    print(f"\nENGINE: --- ManagerAgent: Task -> Reconcile Formalized Guides with Summary Edits ---")
+    prompt_for_manager_reconcile = (
+        f"Guides for structured interviews on '{study_context['OverallStudyTopic']}' (Target Year: {study_context['TargetYear']}) were formalized "
+        f"from an exploratory summary:\n{json.dumps(formalized_guides, indent=2, ensure_ascii=False)}\n\n"
+        f"The user has since edited the summary (unified diff, '-' removed, '+' added):\n```diff\n{summary_diff}\n```\n\n"
+        f"Update the guides ONLY where the edits require it (renamed, added or removed Systemebenen or factors); keep all other wording unchanged. "
+        f"Output ONLY a JSON object with keys 'InterviewGuideStructure_DEFINED' and 'DesiredOutputCatalogStructureGuidance_DEFINED'."
+    )
+    manager_response_obj = _run_agent_internal(ManagerAgent, prompt_for_manager_reconcile)
+    reconciled_guides = parse_json_with_repair(manager_response_obj.final_output if manager_response_obj else None,
+                                               validate_formalized_guides, FORMALIZED_GUIDES_SCHEMA_HINT)
+    if reconciled_guides: print("ENGINE: ManagerAgent reconciled the guides with the summary edits.")
+    else: print("!ENGINE ERROR: ManagerAgent failed to reconcile the guides.")
+    return reconciled_guides
+
+def _build_final_catalog_writer_prompt(study_context: Dict, aggregated_summaries: str) -> Optional[str]:
     print(f"\nENGINE: --- ManagerAgent: Task -> Formulate FINAL CatalogWriter Instruction (for Synthesis) ---")
     
     defined_catalog_structure_guidance = study_context.get('DesiredOutputCatalogStructureGuidance_DEFINED', 
@@ -452,25 +1270,30 @@ def generate_final_catalog_from_summaries(study_context: Dict, aggregated_summar
         f"Output ONLY the direct instruction for the CatalogWriterAgent."
     )
     manager_response_obj = _run_agent_internal(ManagerAgent, prompt_for_manager_final_cw)
-    if manager_response_obj and manager_response_obj.final_output:
-        instruction_for_final_catalogwriter = manager_response_obj.final_output
-        
-        full_prompt_for_catalogwriter = (
-            f"{instruction_for_final_catalogwriter}\n\n"
-            f"OverallStudyTopic: {study_context.get('OverallStudyTopic')}\n"
-            f"DesiredOutputCatalogStructureGuidance (use this for final structure and style):\n{defined_catalog_structure_guidance}\n\n"
-            f"AggregatedSummaries to process and synthesize:\n{aggregated_summaries}\n\n"
-            f"Compile the final, synthesized Faktorenkatalog based on ALL the above."
-        )
-        print(f"ENGINE: Manager's instruction + Full Context for Final CatalogWriter:\n{full_prompt_for_catalogwriter[:1000]}...") # Print snippet
-        
-        print(f"\nENGINE: --- CatalogWriterAgent: Task -> Provide Final Synthesized Catalog ---")
-        final_catalog_obj = _run_agent_internal(CatalogWriterAgent, full_prompt_for_catalogwriter)
-        if final_catalog_obj and final_catalog_obj.final_output:
-            print(f"ENGINE: CatalogWriterAgent FINAL Output generated.")
-            return final_catalog_obj.final_output
-        else: print("!ENGINE ERROR: CatalogWriterAgent failed final output.")
-    else: print("!ENGINE ERROR: ManagerAgent failed to instruct final CatalogWriter.")
+    if not (manager_response_obj and manager_response_obj.final_output):
+        print("!ENGINE ERROR: ManagerAgent failed to instruct final CatalogWriter."); return None
+    instruction_for_final_catalogwriter = manager_response_obj.final_output
+    
+    full_prompt_for_catalogwriter = (
+        f"{instruction_for_final_catalogwriter}\n\n"
+        f"OverallStudyTopic: {study_context.get('OverallStudyTopic')}\n"
+        f"DesiredOutputCatalogStructureGuidance (use this for final structure and style):\n{defined_catalog_structure_guidance}\n\n"
+        f"AggregatedSummaries to process and synthesize:\n{aggregated_summaries}\n\n"
+        f"Compile the final, synthesized Faktorenkatalog based on ALL the above."
+    )
+    print(f"ENGINE: Manager's instruction + Full Context for Final CatalogWriter:\n{full_prompt_for_catalogwriter[:1000]}...") # Print snippet
+    return full_prompt_for_catalogwriter
+
+def generate_final_catalog_from_summaries(study_context: Dict, aggregated_summaries: str) -> Optional[str]:
+    full_prompt_for_catalogwriter = _build_final_catalog_writer_prompt(study_context, aggregated_summaries)
+    if not full_prompt_for_catalogwriter: return None
+    
+    print(f"\nENGINE: --- CatalogWriterAgent: Task -> Provide Final Synthesized Catalog ---")
+    final_catalog_obj = _run_agent_internal(CatalogWriterAgent, full_prompt_for_catalogwriter)
+    if final_catalog_obj and final_catalog_obj.final_output:
+        print(f"ENGINE: CatalogWriterAgent FINAL Output generated.")
+        return final_catalog_obj.final_output
+    print("!ENGINE ERROR: CatalogWriterAgent failed final output.")
     return None
 
 
@@ -571,13 +1394,12 @@ if __name__ == "__main__":
 
     # --- Final Token Count and Cost ---
     print(f"\n--- Session Summary (Direct Run) ---")
-    print(f"Total Input Tokens: {session_input_tokens}")
-    print(f"Total Output Tokens: {session_output_tokens}")
-    cost_input = (session_input_tokens / 1_000_000) * INPUT_PRICE_PER_MILLION_TOKENS
-    cost_output = (session_output_tokens / 1_000_000) * OUTPUT_PRICE_PER_MILLION_TOKENS
-    total_cost = cost_input + cost_output
-    print(f"Estimated Cost for Input Tokens: ${cost_input:.6f}")
-    print(f"Estimated Cost for Output Tokens: ${cost_output:.6f}")
+    session_usage = get_session_usage()
+    print(f"Total Input Tokens: {session_usage['input_tokens']}")
+    print(f"Total Output Tokens: {session_usage['output_tokens']}")
+    for model, usage in session_usage["by_model"].items():
+        print(f"  {model}: {usage['calls']} calls, {usage['input_tokens']} in / {usage['output_tokens']} out, ${estimate_cost_usd({model: usage}):.6f}")
+    total_cost = session_usage["cost_usd"]
     print(f"Total Estimated Session Cost: ${total_cost:.6f}")
     usd_to_eur_rate = 0.88 
     total_cost_eur = total_cost * usd_to_eur_rate
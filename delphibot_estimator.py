@@ -0,0 +1,284 @@
+# delphibot_estimator.py
+# Pre-flight estimate of tokens, cost and wall-clock time for a study shape (structured interviews x turns) before
+# anything runs. Every engine call of the study is modeled with its growing prompt: interview prompts re-send the
+# ConversationHistory (growing until InterviewMemory folds older turns into a digest), manager prompts dump the study_context, long transcripts
+# are summarized in chunks plus a merge, and the catalog synthesis aggregates all summaries. Output sizes and latencies per agent are calibrated from the usage history of earlier studies.
+
+from typing import Any, Dict, List, Optional, Tuple
+import json
+import os
+import statistics
+
+from delphibot_engine import (
+    MAX_INTERVIEW_TURNS_DEFAULT,
+    MEMORY_FOLD_EVERY_TURNS,
+    MEMORY_VERBATIM_TURNS,
+    BUDGET_FALLBACK_MODEL,
+    SIMULATION_MODE_TURN_BY_TURN,
+    SIMULATION_MODE_SINGLE_SHOT_WITH_SUMMARY,
+    SUMMARY_CHUNK_TURNS,
+    count_tokens,
+    estimate_cost_usd,
+    model_for_agent,
+    simulation_mode,
+    split_transcript_into_windows,
+)
+from delphibot_persona_pool import MAX_PARALLEL_INTERVIEWS, split_into_panels
+from delphibot_providers import resolve_provider
+
+USAGE_HISTORY_ENV_VAR = "DELPHIBOT_USAGE_HISTORY"
+DEFAULT_USAGE_HISTORY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "usage_history.jsonl")
+USAGE_HISTORY_MAX_RECORDS = 5000 # Only the most recent calls are used for calibration
+MIN_CALIBRATION_CALLS = 3 # Per agent/model; below that the defaults are kept
+
+# Typical output tokens per agent (defaults until usage history exists)
+DEFAULT_OUTPUT_TOKENS: Dict[str, int] = {
+    "ManagerAgent": 180, "PersonaManagerAgent": 220, "InterviewerAgent": 70, "PersonaResponderAgent": 260,
+    "SummarizerAgent": 750, "CatalogWriterAgent": 2500, "CatalogDeltaAgent": 650, "JsonRepairAgent": 200,
+    "HistoryDigestAgent": 300, "PanelResponderAgent": 820, "SimulatedInterviewAgent": 1800, "DelphiRaterAgent": 400,
+    "CrossImpactAgent": 150,
+}
+DEFAULT_LATENCY = (0.8, 0.012) # seconds per call + seconds per output token, per model until calibrated
+
+# Fixed prompt parts (instruction text written in the engine functions), in tokens
+PERSONA_PROMPT_TOKENS = 350
+INTERVIEW_START_PROMPT_TOKENS = 130
+INTERVIEW_TURN_PROMPT_TOKENS = 60
+RESPONDER_PROMPT_TOKENS = 30
+TURN_JSON_OVERHEAD_TOKENS = 20 # {"question": ..., "answer": ...} with indent, per turn of ConversationHistory
+PANEL_RESPONDER_PROMPT_TOKENS = 60
+DIGEST_PROMPT_TOKENS = 40
+SIMULATION_PROMPT_TOKENS = 200 # Single-shot simulation: topic, objectives, turn/summary instructions and schema
+PANEL_ANSWER_JSON_OVERHEAD_TOKENS = 8 # "P1": "..." per member and turn (compact JSON)
+SUMMARIZER_INSTRUCTION_PROMPT_TOKENS = 170
+SUMMARIZER_PROMPT_TOKENS = 100
+FORMALIZE_PROMPT_TOKENS = 550
+FORMALIZED_GUIDES_TOKENS = 300 # Both DEFINED guides, added to the study_context after the exploratory phase
+CATALOG_INSTRUCTION_PROMPT_TOKENS = 200
+CATALOG_DELTA_PROMPT_TOKENS = 150
+OUTLINE_TOKENS_PER_INTERVIEW = 60 # CurrentCatalogOutline grows with every merged interview
+
+
+# --- Usage History & Calibration ---
+def _history_path(path: Optional[str] = None) -> str:
+    return path or os.environ.get(USAGE_HISTORY_ENV_VAR) or DEFAULT_USAGE_HISTORY_PATH
+
+def append_usage_history(call_records: List[Dict[str, Any]], path: Optional[str] = None) -> int:
+    """Appends the per-call records of a finished study (StudyUsage.call_records()) to the usage history."""
+    records = [r for r in call_records if r.get("agent") and r.get("output_tokens") is not None]
+    if not records: return 0
+    with open(_history_path(path), "a", encoding="utf-8") as f:
+        for record in records: f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    print(f"ENGINE: {len(records)} call records added to usage history.")
+    return len(records)
+
+def load_usage_history(path: Optional[str] = None, max_records: int = USAGE_HISTORY_MAX_RECORDS) -> List[Dict[str, Any]]:
+    history_path = _history_path(path)
+    if not os.path.isfile(history_path): return []
+    records = []
+    with open(history_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try: records.append(json.loads(line))
+            except json.JSONDecodeError: continue
+    return records[-max_records:]
+
+def _fit_latency(points: List[Tuple[float, float]]) -> Tuple[float, float]:
+    """Least squares latency = base + per_token * output_tokens; falls back to the default slope for degenerate data."""
+    tokens, latencies = [p[0] for p in points], [p[1] for p in points]
+    mean_tokens, mean_latency = statistics.fmean(tokens), statistics.fmean(latencies)
+    variance = sum((t - mean_tokens) ** 2 for t in tokens)
+    per_token = sum((t - mean_tokens) * (l - mean_latency) for t, l in points) / variance if variance else DEFAULT_LATENCY[1]
+    per_token = max(per_token, 0.0)
+    return max(mean_latency - per_token * mean_tokens, 0.0), per_token
+
+def calibrate(call_records: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """Median output tokens per agent and a latency model per model, from call records (default: the usage history)."""
+    if call_records is None: call_records = load_usage_history()
+    outputs_by_agent: Dict[str, List[int]] = {}
+    latency_points: Dict[str, List[Tuple[float, float]]] = {}
+    for record in call_records:
+        if record.get("output_tokens") is None: continue
+        outputs_by_agent.setdefault(record.get("agent", ""), []).append(int(record["output_tokens"]))
+        if record.get("latency_s") is not None:
+            latency_points.setdefault(record.get("model", ""), []).append((float(record["output_tokens"]), float(record["latency_s"])))
+    output_tokens = dict(DEFAULT_OUTPUT_TOKENS)
+    output_tokens.update({agent: int(statistics.median(values)) for agent, values in outputs_by_agent.items()
+                          if agent and len(values) >= MIN_CALIBRATION_CALLS})
+    latency = {model: _fit_latency(points) for model, points in latency_points.items() if model and len(points) >= MIN_CALIBRATION_CALLS}
+    return {"output_tokens": output_tokens, "latency": latency, "calibrated_from_calls": len(call_records)}
+
+
+# --- Call Plan of a Study ---
+class _CallPlan:
+    """Collects the modeled engine calls (agent, input tokens, output tokens) of one study shape."""
+
+    def __init__(self, calibration: Dict[str, Any], model_override: Optional[str] = None):
+        self.calibration = calibration
+        self.model_override = model_override
+        self.calls: List[Tuple[str, str, int, int, str]] = [] # (agent, model, input, output, stage)
+
+    def out(self, agent_name: str) -> int:
+        return self.calibration["output_tokens"].get(agent_name, DEFAULT_OUTPUT_TOKENS["ManagerAgent"])
+
+    def add(self, agent_name: str, input_tokens: float, stage: str, output_tokens: Optional[int] = None) -> int:
+        output = self.out(agent_name) if output_tokens is None else output_tokens
+        model = model_for_agent(agent_name)
+        if self.model_override and resolve_provider(model)[0] is None: model = self.model_override # Self-hosted agents stay on their (free) backend
+        self.calls.append((agent_name, model, int(input_tokens), output, stage))
+        return output
+
+    def add_interview(self, context_tokens: int, guide_tokens: int, max_turns: int, stage: str, mode: str = SIMULATION_MODE_TURN_BY_TURN) -> int:
+        """Persona, interview loop and summary of ONE interview. Returns the summary's tokens."""
+        persona = self.add("PersonaManagerAgent", PERSONA_PROMPT_TOKENS, stage)
+        if mode != SIMULATION_MODE_TURN_BY_TURN: return self.add_simulated_interview(context_tokens, guide_tokens, max_turns, persona, stage, mode)
+        instruction = self.add("ManagerAgent", context_tokens + persona + INTERVIEW_START_PROMPT_TOKENS, stage)
+        question, answer = self.out("InterviewerAgent"), self.out("PersonaResponderAgent")
+        turn_tokens = question + answer + TURN_JSON_OVERHEAD_TOKENS
+        for turn in range(max_turns): # ConversationHistory (recent turns + digest) is re-sent on every call
+            history = self.history(turn, turn_tokens, stage)
+            self.add("InterviewerAgent", instruction if turn == 0 else INTERVIEW_TURN_PROMPT_TOKENS + persona + guide_tokens + history, stage)
+            self.add("PersonaResponderAgent", RESPONDER_PROMPT_TOKENS + persona + history + question, stage)
+        return self.add_summary(context_tokens, guide_tokens, max_turns, turn_tokens, stage)
+
+    def add_simulated_interview(self, context_tokens: int, guide_tokens: int, max_turns: int, persona: int, stage: str, mode: str) -> int:
+        """ONE SimulatedInterviewAgent call writes all turns (and, with_summary, the summary). Returns the summary's tokens."""
+        turn_tokens = self.out("InterviewerAgent") + self.out("PersonaResponderAgent") + TURN_JSON_OVERHEAD_TOKENS
+        transcript = max_turns * turn_tokens
+        with_summary = mode == SIMULATION_MODE_SINGLE_SHOT_WITH_SUMMARY
+        summary = self.out("SummarizerAgent") if with_summary else 0
+        self.add("SimulatedInterviewAgent", SIMULATION_PROMPT_TOKENS + persona + guide_tokens * (2 if with_summary else 1), stage,
+                 output_tokens=transcript + summary)
+        return summary if with_summary else self.add_summary(context_tokens, guide_tokens, max_turns, turn_tokens, stage)
+
+    def add_panel(self, context_tokens: int, guide_tokens: int, max_turns: int, size: int, stage: str) -> List[int]:
+        """Personas, ONE panel interview loop and a summary per member. Returns the summaries' tokens."""
+        personas = self.add("PersonaManagerAgent", PERSONA_PROMPT_TOKENS, stage, output_tokens=size * self.out("PersonaManagerAgent"))
+        instruction = self.add("ManagerAgent", context_tokens + personas + INTERVIEW_START_PROMPT_TOKENS, stage)
+        question, answer = self.out("InterviewerAgent"), self.out("PersonaResponderAgent")
+        answers = size * (answer + PANEL_ANSWER_JSON_OVERHEAD_TOKENS) # One call's output holds the answers of all members
+        for turn in range(max_turns):
+            history = self.history(turn, question + answers, stage)
+            self.add("InterviewerAgent", instruction if turn == 0 else INTERVIEW_TURN_PROMPT_TOKENS + personas + guide_tokens + history, stage)
+            self.add("PanelResponderAgent", PANEL_RESPONDER_PROMPT_TOKENS + personas + history + question, stage, output_tokens=answers)
+        return [self.add_summary(context_tokens, guide_tokens, max_turns, question + answer + TURN_JSON_OVERHEAD_TOKENS, stage) for _ in range(size)]
+
+    def history(self, turn: int, turn_tokens: int, stage: str) -> int:
+        """Tokens of the ConversationHistory at 'turn' (see InterviewMemory); adds the digest call started at this turn."""
+        overflow = turn - MEMORY_VERBATIM_TURNS
+        folded = overflow // MEMORY_FOLD_EVERY_TURNS * MEMORY_FOLD_EVERY_TURNS if overflow > 0 else 0
+        if folded and overflow % MEMORY_FOLD_EVERY_TURNS == 0:
+            self.add("HistoryDigestAgent", DIGEST_PROMPT_TOKENS + self.out("HistoryDigestAgent") + MEMORY_FOLD_EVERY_TURNS * turn_tokens, stage)
+        return (turn - folded) * turn_tokens + (self.out("HistoryDigestAgent") if folded else 0)
+
+    def add_summary(self, context_tokens: int, guide_tokens: int, turns: int, turn_tokens: int, stage: str) -> int:
+        """Summary of a transcript of 'turns' turns; beyond SUMMARY_CHUNK_TURNS one call per overlapping window plus a merge call."""
+        summarizer_instruction = self.add("ManagerAgent", context_tokens + SUMMARIZER_INSTRUCTION_PROMPT_TOKENS, stage)
+        prompt_tokens = summarizer_instruction + SUMMARIZER_PROMPT_TOKENS + guide_tokens
+        windows = split_transcript_into_windows(list(range(turns)), SUMMARY_CHUNK_TURNS)
+        if len(windows) == 1: return self.add("SummarizerAgent", prompt_tokens + turns * turn_tokens, stage)
+        partial_summaries = sum(self.add("SummarizerAgent", prompt_tokens + len(window) * turn_tokens, stage) for window in windows)
+        return self.add("SummarizerAgent", prompt_tokens + partial_summaries, stage)
+
+
+def estimate_study(
+    study_context: Dict,
+    num_structured_interviews: int,
+    max_turns: int = MAX_INTERVIEW_TURNS_DEFAULT,
+    include_exploratory: bool = True,
+    exploratory_interviews: int = 1,
+    incremental_catalog: bool = True,
+    parallel_interviews: int = 1,
+    panel_size: int = 1,
+    calibration: Optional[Dict[str, Any]] = None,
+    model_override: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Predicted input/output tokens, cost (USD) and wall-clock seconds of a study shape, in total and per agent/stage.
+    model_override prices every hosted call at one model (e.g. the budget's fallback model). exploratory_interviews > 1 models the
+    exploratory fan-out (interviews run side by side, one merged proposal). panel_size > 1 models the structured interviews
+    as panel interviews (one responder call per turn for the whole panel). study_context's SimulationMode is applied to
+    the single (non-panel) AI interviews. Human interviewee time is not included.
+    """
+    calibration = calibration or calibrate()
+    plan = _CallPlan(calibration, model_override)
+    context_tokens = count_tokens(json.dumps(study_context, indent=2, ensure_ascii=False))
+    guide_tokens = FORMALIZED_GUIDES_TOKENS // 2
+    mode = simulation_mode(study_context)
+
+    summary_tokens: List[int] = []
+    if include_exploratory:
+        for _ in range(max(1, exploratory_interviews)): exploratory_summary = plan.add_interview(context_tokens, guide_tokens, max_turns, "exploratory", mode)
+        plan.add("ManagerAgent", FORMALIZE_PROMPT_TOKENS + exploratory_summary, "exploratory", output_tokens=FORMALIZED_GUIDES_TOKENS)
+        summary_tokens.append(exploratory_summary)
+    if not study_context.get("InterviewGuideStructure_DEFINED"): context_tokens += FORMALIZED_GUIDES_TOKENS
+
+    if panel_size > 1:
+        for panel in split_into_panels(list(range(num_structured_interviews)), panel_size):
+            summary_tokens += plan.add_panel(context_tokens, guide_tokens, max_turns, len(panel), "structured")
+    else:
+        for _ in range(num_structured_interviews):
+            summary_tokens.append(plan.add_interview(context_tokens, guide_tokens, max_turns, "structured", mode))
+
+    structured_summaries = summary_tokens[1:] if include_exploratory else summary_tokens
+    if incremental_catalog:
+        for i, summary in enumerate(structured_summaries):
+            delta = plan.add("CatalogDeltaAgent", CATALOG_DELTA_PROMPT_TOKENS + guide_tokens + i * OUTLINE_TOKENS_PER_INTERVIEW + summary, "catalog")
+            if i > 0: plan.add("CatalogDeltaAgent", CATALOG_DELTA_PROMPT_TOKENS + 2 * delta, "catalog") # Merge of existing factors
+    elif summary_tokens:
+        instruction = plan.add("ManagerAgent", context_tokens + sum(summary_tokens) + CATALOG_INSTRUCTION_PROMPT_TOKENS, "catalog")
+        plan.add("CatalogWriterAgent", instruction + guide_tokens + sum(summary_tokens) + CATALOG_INSTRUCTION_PROMPT_TOKENS, "catalog")
+    return _summarize_plan(plan, {"structured": max(1, parallel_interviews),
+                                  "exploratory": max(1, min(exploratory_interviews, MAX_PARALLEL_INTERVIEWS))})
+
+def _summarize_plan(plan: _CallPlan, parallel_by_stage: Dict[str, int]) -> Dict[str, Any]:
+    by_model: Dict[str, Dict[str, int]] = {}
+    by_agent: Dict[str, Dict[str, int]] = {}
+    seconds_by_stage: Dict[str, float] = {}
+    for agent_name, model, input_tokens, output_tokens, stage in plan.calls:
+        for bucket in (by_model.setdefault(model, {"input_tokens": 0, "output_tokens": 0, "calls": 0}),
+                       by_agent.setdefault(agent_name, {"input_tokens": 0, "output_tokens": 0, "calls": 0})):
+            bucket["input_tokens"] += input_tokens; bucket["output_tokens"] += output_tokens; bucket["calls"] += 1
+        base_s, per_token_s = plan.calibration["latency"].get(model, DEFAULT_LATENCY)
+        seconds_by_stage[stage] = seconds_by_stage.get(stage, 0.0) + base_s + per_token_s * output_tokens
+    for stage, parallel in parallel_by_stage.items(): # Interviews of these stages run side by side
+        if stage in seconds_by_stage: seconds_by_stage[stage] /= parallel
+    return {
+        "input_tokens": sum(u["input_tokens"] for u in by_model.values()), "output_tokens": sum(u["output_tokens"] for u in by_model.values()),
+        "calls": len(plan.calls), "cost_usd": estimate_cost_usd(by_model), "wall_clock_s": sum(seconds_by_stage.values()),
+        "seconds_by_stage": seconds_by_stage, "by_model": by_model, "by_agent": by_agent,
+        "calibrated_from_calls": plan.calibration.get("calibrated_from_calls", 0),
+    }
+
+
+# --- Fitting a Study into a Budget ---
+def fit_study_to_budget(
+    study_context: Dict,
+    max_cost_usd: float,
+    num_structured_interviews: int,
+    max_turns: int = MAX_INTERVIEW_TURNS_DEFAULT,
+    min_turns: int = 2,
+    **estimate_kwargs: Any
+) -> Dict[str, Any]:
+    """
+    Degrades a study shape until its estimate fits the budget: fewer turns first (each re-sends the history), then fewer
+    interviews, then the budget's fallback model for every call. Returns the shape, its estimate and whether it fits.
+    """
+    calibration = estimate_kwargs.pop("calibration", None) or calibrate()
+    shape = {"num_structured_interviews": num_structured_interviews, "max_turns": max_turns, "fallback_model_only": False}
+    def estimate() -> Dict[str, Any]:
+        return estimate_study(study_context, shape["num_structured_interviews"], shape["max_turns"], calibration=calibration,
+                              model_override=BUDGET_FALLBACK_MODEL if shape["fallback_model_only"] else None, **estimate_kwargs)
+
+    def shrink() -> Dict[str, Any]:
+        current = estimate()
+        while current["cost_usd"] > max_cost_usd and shape["max_turns"] > min(min_turns, max_turns):
+            shape["max_turns"] -= 1; current = estimate()
+        while current["cost_usd"] > max_cost_usd and shape["num_structured_interviews"] > 1:
+            shape["num_structured_interviews"] -= 1; current = estimate()
+        return current
+
+    current = shrink()
+    if current["cost_usd"] > max_cost_usd: # Not even the smallest shape fits: start over on the fallback model
+        shape.update(num_structured_interviews=num_structured_interviews, max_turns=max_turns, fallback_model_only=True)
+        current = shrink()
+    return {**shape, "estimate": current, "fits": current["cost_usd"] <= max_cost_usd}
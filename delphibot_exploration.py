@@ -0,0 +1,148 @@
+# delphibot_exploration.py
+# Exploratory fan-out: K diverse exploratory interviews run concurrently, and the System Levels (Systemebenen) they
+# propose are merged locally by frequency and similarity. formalize_structure_from_exploratory_summary then runs ONCE
+# on the merged proposal, which no longer depends on a single simulated expert.
+
+from typing import Any, Dict, List, Optional, Set
+import math
+import re
+
+from delphibot_engine import MAX_INTERVIEW_TURNS_DEFAULT, perform_study_phase
+from delphibot_persona_pool import MAX_PARALLEL_INTERVIEWS, build_persona_pool, run_interviews_concurrently
+
+EXPLORATORY_FANOUT_DEFAULT = 3
+LEVEL_SIMILARITY_THRESHOLD = 0.3 # Proposed levels at least this similar are treated as the same Systemebene
+LEVEL_NAME_WEIGHT = 0.7 # Similarity = weighted name overlap + description overlap
+TERM_STEM_CHARS = 6 # Terms are cut to a prefix, so plural/inflected and German/English forms match (Technologie ~ Technology)
+MIN_MERGED_LEVELS, MAX_MERGED_LEVELS = 4, 6 # Same range the SummarizerAgent is asked to propose
+LEVEL_NAME_MAX_WORDS = 8
+
+_TERM_PATTERN = re.compile(r"\w{4,}")
+_HEADING_LINE = re.compile(r"^#{1,6}\s*(.+)$")
+_LIST_LINE = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s+(.+)$")
+_BOLD_LINE = re.compile(r"^\*\*(.+?)\*\*\s*[:\-–]?\s*(.*)$")
+_NAME_SEPARATOR = re.compile(r"\s*(?::|\s[-–]\s)\s*")
+_LEVEL_PREFIX = re.compile(r"^(?:(?:system\s*levels?|systemebenen?|levels?|ebenen?)\s*\d+\s*[:.)\-–]?|(?:system\s*levels?|systemebenen?)\s*[:\-–])\s*",
+                           re.IGNORECASE) # "System Level 2:", "Systemebene 3 -", but not "Ebene der Politik"
+
+
+# --- Parsing the proposed System Levels ---
+def _clean_level_name(name: str) -> str:
+    name = name.replace("**", "").replace("__", "").strip(" #*:-–\t")
+    return _LEVEL_PREFIX.sub("", name).strip(" :-–")
+
+def _split_name_and_description(text: str) -> Optional[Dict[str, str]]:
+    bold = _BOLD_LINE.match(text)
+    if bold and _LEVEL_PREFIX.sub("", bold.group(1)).strip(" :-–"): name, description = bold.group(1), bold.group(2)
+    else:
+        parts = _NAME_SEPARATOR.split(_LEVEL_PREFIX.sub("", text.replace("**", "").strip()), maxsplit=1)
+        name, description = parts[0], parts[1] if len(parts) > 1 else ""
+    name = _clean_level_name(name)
+    if not name or len(name.split()) > LEVEL_NAME_MAX_WORDS: return None
+    return {"name": name, "description": description.strip()}
+
+def parse_proposed_levels(summary: str) -> List[Dict[str, str]]:
+    """
+    System Levels ({name, description}) from an exploratory summary. The summary is free text, so the dominant layout
+    is used: list items ('1. **Name**: ...'), else headings ('### Name'), else bold lines; other lines become description.
+    """
+    lines = [line.rstrip() for line in (summary or "").splitlines() if line.strip()]
+    patterns = {"list": _LIST_LINE, "heading": _HEADING_LINE, "bold": _BOLD_LINE}
+    counts = {kind: sum(1 for line in lines if pattern.match(line) and not line.startswith(" ")) for kind, pattern in patterns.items()}
+    kind = next((k for k in ("list", "heading", "bold") if counts[k] >= MIN_MERGED_LEVELS - 1), max(counts, key=counts.get))
+    pattern = patterns[kind]
+
+    levels: List[Dict[str, str]] = []
+    for line in lines:
+        match = pattern.match(line) if not line.startswith(" ") else None
+        level = _split_name_and_description(line.strip() if kind == "bold" else match.group(1)) if match else None
+        if level: levels.append(level)
+        elif levels: # Continuation of the previous level's description
+            levels[-1]["description"] = f"{levels[-1]['description']} {line.strip(' -*#')}".strip()
+    return levels
+
+
+# --- Local Merge by Frequency & Similarity ---
+def _stemmed_terms(text: str) -> Set[str]:
+    return {term.lower()[:TERM_STEM_CHARS] for term in _TERM_PATTERN.findall(text or "") if not term.isdigit()}
+
+def _jaccard(a: Set[str], b: Set[str]) -> float:
+    return len(a & b) / len(a | b) if a | b else 0.0
+
+def level_similarity(level_a: Dict[str, Any], level_b: Dict[str, Any]) -> float:
+    name_a, name_b = _stemmed_terms(level_a["name"]), _stemmed_terms(level_b["name"])
+    all_a = name_a | _stemmed_terms(level_a.get("description", ""))
+    all_b = name_b | _stemmed_terms(level_b.get("description", ""))
+    return LEVEL_NAME_WEIGHT * _jaccard(name_a, name_b) + (1 - LEVEL_NAME_WEIGHT) * _jaccard(all_a, all_b)
+
+def merge_proposed_levels(levels_per_interview: List[List[Dict[str, str]]]) -> Dict[str, Any]:
+    """
+    Greedy single-link clustering of all proposed levels (one level per interview per cluster). Clusters named in at
+    least half of the interviews are kept (topped up/capped to MIN/MAX_MERGED_LEVELS by support); the medoid names them.
+    """
+    clusters: List[Dict[str, Any]] = []
+    for interview_index, levels in enumerate(levels_per_interview):
+        for level in levels:
+            best, best_similarity = None, LEVEL_SIMILARITY_THRESHOLD
+            for cluster in clusters:
+                if interview_index in cluster["interviews"]: continue
+                similarity = max(level_similarity(level, member) for member in cluster["members"])
+                if similarity >= best_similarity: best, best_similarity = cluster, similarity
+            if best is None: clusters.append({"members": [level], "interviews": {interview_index}, "first_seen": len(clusters)})
+            else: best["members"].append(level); best["interviews"].add(interview_index)
+
+    merged = []
+    for cluster in clusters:
+        members = cluster["members"]
+        medoid = max(members, key=lambda m: sum(level_similarity(m, other) for other in members if other is not m))
+        merged.append({"name": medoid["name"], "description": medoid["description"], "support": len(cluster["interviews"]),
+                       "variants": sorted({m["name"] for m in members} - {medoid["name"]}), "first_seen": cluster["first_seen"]})
+    merged.sort(key=lambda level: (-level["support"], level["first_seen"]))
+
+    num_interviews = sum(1 for levels in levels_per_interview if levels)
+    min_support = max(1, math.ceil(num_interviews / 2))
+    kept = [level for level in merged if level["support"] >= min_support][:MAX_MERGED_LEVELS]
+    if len(kept) < MIN_MERGED_LEVELS: kept = merged[:MIN_MERGED_LEVELS]
+    return {"levels": kept, "dropped": [level for level in merged if level not in kept], "num_interviews": num_interviews}
+
+def render_merged_structure(merged: Dict[str, Any]) -> str:
+    """Merged proposal as an exploratory summary (reviewed/edited by the user, then formalized)."""
+    lines = [f"Proposed System Levels (merged from {merged['num_interviews']} exploratory interviews):", ""]
+    for number, level in enumerate(merged["levels"], start=1):
+        lines.append(f"{number}. **{level['name']}** (named in {level['support']} of {merged['num_interviews']} interviews): {level['description']}".rstrip(": "))
+        if level["variants"]: lines.append(f"   Also named: {'; '.join(level['variants'])}")
+    if merged["dropped"]:
+        lines += ["", "Further themes mentioned only in single interviews: " + "; ".join(level["name"] for level in merged["dropped"])]
+    return "\n".join(lines)
+
+
+# --- Fan-out ---
+def run_exploratory_fanout(
+    study_context: Dict,
+    k: int = EXPLORATORY_FANOUT_DEFAULT,
+    max_interview_turns: int = MAX_INTERVIEW_TURNS_DEFAULT,
+    max_workers: int = MAX_PARALLEL_INTERVIEWS
+) -> Dict[str, Any]:
+    """
+    K exploratory interviews with diverse personas (one batched persona pool call), run concurrently, and their
+    proposals merged locally. Returns the per-interview results, the merge details and 'summary' (the merged proposal).
+    """
+    personas = build_persona_pool(study_context, k)
+    if personas: results = run_interviews_concurrently(study_context, personas, True, max_interview_turns, max_workers)
+    else:
+        print("ENGINE WARNING: No persona pool for the exploratory fan-out, running a single exploratory interview.")
+        results = [perform_study_phase(study_context.copy(), True, max_interview_turns)]
+    summaries = [res["summary"] for res in results if res.get("summary", "").strip() and not res.get("error_message")]
+    if not summaries:
+        return {"results": results, "merged": None, "summary": "", "error_message": "No exploratory interview produced a summary."}
+    if len(summaries) == 1: return {"results": results, "merged": None, "summary": summaries[0], "error_message": None}
+
+    levels_per_interview = [parse_proposed_levels(summary) for summary in summaries]
+    if sum(1 for levels in levels_per_interview if levels) < 2: # Nothing parseable to merge: hand all proposals to the user
+        print("ENGINE WARNING: Could not parse System Levels from the exploratory summaries; showing them unmerged.")
+        return {"results": results, "merged": None, "error_message": None,
+                "summary": "\n\n---\n\n".join(f"Proposal {i}:\n{summary}" for i, summary in enumerate(summaries, start=1))}
+    merged = merge_proposed_levels(levels_per_interview)
+    print(f"ENGINE: Merged {sum(len(levels) for levels in levels_per_interview)} proposed levels from {len(summaries)} "
+          f"exploratory interviews into {len(merged['levels'])} Systemebenen.")
+    return {"results": results, "merged": merged, "summary": render_merged_structure(merged), "error_message": None}
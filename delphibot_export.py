@@ -0,0 +1,180 @@
+# delphibot_export.py
+# Columnar export of study artifacts for downstream analytics. Every table is written per study to
+# <export_dir>/<table>/<study_id>.parquet (or .arrow), so hundreds of studies can be queried as ONE dataset
+# (pyarrow.dataset, DuckDB: SELECT ... FROM 'exports/factors/*.parquet'). Transcripts go to gzip JSONL.
+# Writers stream in row groups: large batch runs never hold a whole study in memory.
+
+from typing import Any, Dict, List, Optional, Tuple, Union
+import gzip
+import json
+import os
+import threading
+import uuid
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError: # Optional dependency: without pyarrow, tables fall back to gzip JSONL
+    pa = None
+    pq = None
+
+EXPORT_DIR_ENV_VAR = "DELPHIBOT_EXPORT_DIR"
+DEFAULT_EXPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "exports")
+EXPORT_FORMATS = ("parquet", "arrow", "jsonl")
+ROW_GROUP_SIZE = 1000 # Rows buffered per table before they are written out
+
+TABLE_COLUMNS: Dict[str, List[Tuple[str, str]]] = {
+    "interviews": [("study_id", "string"), ("interview_id", "string"), ("phase", "string"), ("persona_name", "string"),
+                   ("role_title", "string"), ("persona_json", "string"), ("num_turns", "int64"), ("summary", "string"),
+                   ("error_message", "string")],
+    "factors": [("study_id", "string"), ("systemebene", "string"), ("faktorname", "string"), ("definition", "string"),
+                ("dimensions", "string"), ("trends", "string"), ("num_mentions", "int64")],
+    "mentions": [("study_id", "string"), ("interview_id", "string"), ("systemebene", "string"), ("faktorname", "string")],
+    "usage": [("study_id", "string"), ("timestamp", "float64"), ("agent", "string"), ("model", "string"),
+              ("input_tokens", "int64"), ("output_tokens", "int64"), ("latency_s", "float64")],
+}
+
+
+def _arrow_schema(table_name: str) -> Any:
+    types = {"string": pa.string(), "int64": pa.int64(), "float64": pa.float64()}
+    return pa.schema([(name, types[type_name]) for name, type_name in TABLE_COLUMNS[table_name]])
+
+
+class _TableWriter:
+    """Buffers rows of one table and writes them out per row group (Parquet / Arrow IPC file / gzip JSONL)."""
+
+    def __init__(self, table_name: str, path: str, export_format: str):
+        self.table_name, self.path, self.export_format = table_name, path, export_format
+        self.rows_written = 0
+        self._buffer: List[Dict[str, Any]] = []
+        self._writer: Any = None
+        self._sink: Any = None
+
+    def write(self, row: Dict[str, Any]) -> None:
+        self._buffer.append(row)
+        if len(self._buffer) >= ROW_GROUP_SIZE: self.flush()
+
+    def flush(self) -> None:
+        if not self._buffer: return
+        if self.export_format == "jsonl":
+            if self._writer is None: self._writer = gzip.open(self.path, "wt", encoding="utf-8")
+            for row in self._buffer: self._writer.write(json.dumps(row, ensure_ascii=False) + "\n")
+        else:
+            if self._writer is None: self._open_arrow_writer()
+            self._writer.write_table(pa.Table.from_pylist(self._buffer, schema=_arrow_schema(self.table_name)))
+        self.rows_written += len(self._buffer)
+        self._buffer = []
+
+    def _open_arrow_writer(self) -> None:
+        schema = _arrow_schema(self.table_name)
+        if self.export_format == "parquet": self._writer = pq.ParquetWriter(self.path, schema, compression="zstd")
+        else: self._sink = pa.OSFile(self.path, "wb"); self._writer = pa.ipc.new_file(self._sink, schema)
+
+    def close(self) -> None:
+        self.flush()
+        if self._writer is None and self.export_format != "jsonl": self._open_arrow_writer() # Empty table: still write the schema
+        if self._writer is not None: self._writer.close()
+        if self._sink is not None: self._sink.close()
+
+
+class StudyExporter:
+    """
+    Streams ONE study into the export directory. Use as a context manager, or call close().
+    Thread-safe: write_interview can be passed as on_result callback and stream_usage_from() feeds the call log
+    directly from the engine's StudyUsage.
+    """
+
+    def __init__(self, study_id: Optional[str] = None, export_dir: Optional[str] = None, export_format: str = "parquet"):
+        if export_format not in EXPORT_FORMATS: raise ValueError(f"export_format must be one of {EXPORT_FORMATS}")
+        if export_format != "jsonl" and pa is None:
+            print("ENGINE WARNING: pyarrow is not installed; exporting tables as gzip JSONL instead."); export_format = "jsonl"
+        self.study_id = study_id or uuid.uuid4().hex[:12]
+        self.export_dir = export_dir or os.environ.get(EXPORT_DIR_ENV_VAR) or DEFAULT_EXPORT_DIR
+        self.export_format = export_format
+        self._writers: Dict[str, _TableWriter] = {}
+        self._transcripts: Any = None
+        self._lock = threading.Lock()
+        self._paths: Optional[Dict[str, str]] = None
+
+    def _path(self, table_name: str, extension: str) -> str:
+        table_dir = os.path.join(self.export_dir, table_name)
+        os.makedirs(table_dir, exist_ok=True)
+        return os.path.join(table_dir, f"{self.study_id}{extension}")
+
+    def _write_row(self, table_name: str, row: Dict[str, Any]) -> None:
+        writer = self._writers.get(table_name)
+        if writer is None:
+            extension = {"parquet": ".parquet", "arrow": ".arrow", "jsonl": ".jsonl.gz"}[self.export_format]
+            writer = self._writers[table_name] = _TableWriter(table_name, self._path(table_name, extension), self.export_format)
+        writer.write({"study_id": self.study_id, **row})
+
+    def write_interview(self, phase_results: Dict[str, Any], phase: str = "structured") -> None:
+        persona = phase_results.get("selected_persona_dict") or {}
+        interview_id = phase_results.get("interview_id") or uuid.uuid4().hex[:12]
+        transcript = phase_results.get("transcript") or []
+        with self._lock:
+            self._write_row("interviews", {
+                "interview_id": interview_id, "phase": phase,
+                "persona_name": phase_results.get("selected_persona_name", persona.get("name", "")),
+                "role_title": str(persona.get("role_title", persona.get("Role", "")) or ""),
+                "persona_json": json.dumps(persona, ensure_ascii=False), "num_turns": sum(1 for qa in transcript if "event" not in qa),
+                "summary": phase_results.get("summary") or "", "error_message": phase_results.get("error_message") or ""})
+            if self._transcripts is None: self._transcripts = gzip.open(self._path("transcripts", ".jsonl.gz"), "wt", encoding="utf-8")
+            for turn, qa in enumerate(transcript, start=1):
+                self._transcripts.write(json.dumps({"study_id": self.study_id, "interview_id": interview_id, "turn": turn, **qa}, ensure_ascii=False) + "\n")
+
+    def write_catalog(self, catalog_state: Dict[str, Any]) -> None:
+        with self._lock:
+            for level, factors in catalog_state["systemebenen"].items():
+                for factor_name, details in factors.items():
+                    interview_ids = details.get("interview_ids", [])
+                    self._write_row("factors", {"systemebene": level, "faktorname": factor_name, "definition": details.get("definition", ""),
+                                                "dimensions": details.get("dimensions", ""), "trends": details.get("trends", ""),
+                                                "num_mentions": len(interview_ids)})
+                    for interview_id in interview_ids:
+                        self._write_row("mentions", {"interview_id": interview_id, "systemebene": level, "faktorname": factor_name})
+
+    def write_usage_record(self, call_record: Dict[str, Any]) -> None:
+        with self._lock:
+            self._write_row("usage", {column: call_record.get(column) for column, _ in TABLE_COLUMNS["usage"] if column != "study_id"})
+
+    def stream_usage_from(self, study_usage: Any) -> None:
+        """Writes the calls recorded so far and streams all further ones (StudyUsage.call_sink) instead of keeping them in memory."""
+        study_usage.set_call_sink(self.write_usage_record)
+
+    def close(self) -> Dict[str, str]:
+        """Flushes everything; returns {table: path} of the written files."""
+        with self._lock:
+            if self._paths is not None: return self._paths
+            for writer in self._writers.values(): writer.close()
+            paths = {name: writer.path for name, writer in self._writers.items()}
+            if self._transcripts is not None: self._transcripts.close(); paths["transcripts"] = self._transcripts.name
+            self._paths = paths
+        print(f"ENGINE: Study {self.study_id} exported to {self.export_dir} ({', '.join(sorted(paths))}).")
+        return paths
+
+    def __enter__(self) -> "StudyExporter":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+def export_study(
+    study_id: Optional[str],
+    results_list: List[Dict[str, Any]],
+    catalog_state: Optional[Dict[str, Any]] = None,
+    study_usage: Any = None,
+    exploratory_results: Optional[Union[Dict[str, Any], List[Dict[str, Any]]]] = None,
+    export_dir: Optional[str] = None,
+    export_format: str = "parquet"
+) -> Dict[str, str]:
+    """One-shot export of a finished study (e.g. from the app). For long runs, stream with a StudyExporter instead."""
+    with StudyExporter(study_id, export_dir, export_format) as exporter:
+        if isinstance(exploratory_results, dict): exploratory_results = [exploratory_results]
+        for phase_results in exploratory_results or []: exporter.write_interview(phase_results, phase="exploratory")
+        for phase_results in results_list: exporter.write_interview(phase_results)
+        if catalog_state: exporter.write_catalog(catalog_state)
+        if study_usage is not None:
+            for call_record in study_usage.call_records(): exporter.write_usage_record(call_record)
+    return exporter.close()
@@ -0,0 +1,141 @@
+# delphibot_persona_library.py
+# Persistent persona library (SQLite + FTS5 index over role_title / expertise_areas / topic).
+# perform_study_phase looks here first and only asks the PersonaManagerAgent when no good match exists. Matching uses the
+# persona requirements against role and expertise only: the topic words of study titles ("Zukunft", "Deutschland") are too generic.
+
+from typing import Any, Dict, Iterator, List, Optional, Set
+from contextlib import contextmanager
+import difflib
+import hashlib
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+
+PERSONA_LIBRARY_ENV_VAR = "DELPHIBOT_PERSONA_LIBRARY"
+DEFAULT_PERSONA_LIBRARY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "persona_library.sqlite3")
+MIN_MATCHED_TERMS_DEFAULT = 2 # A stored persona must share at least this many query terms to count as a good match ...
+MIN_MATCHED_TERMS_FRACTION = 0.1 # ... and at least this fraction of them for long requirements
+SIMILAR_ROLE_MIN_RATIO = 0.8 # Roles this similar count as the same role for the diversity exclusion (e.g. Verlagsmanager/-in)
+SIMILAR_ROLE_MIN_TERM_OVERLAP = 0.5
+MAX_FTS_CANDIDATES = 25
+
+_TERM_PATTERN = re.compile(r"\w{4,}") # Words with < 4 chars are mostly stop words (der, die, und, the, ...)
+
+
+def _terms(text: str) -> Set[str]:
+    return {term.lower() for term in _TERM_PATTERN.findall(text or "") if not term.isdigit()}
+
+def _persona_role(persona: Dict[str, Any]) -> str:
+    return str(persona.get("role_title", persona.get("Role", persona.get("role", ""))) or "")
+
+def _persona_expertise(persona: Dict[str, Any]) -> str:
+    expertise = persona.get("expertise_areas", "")
+    return ", ".join(str(e) for e in expertise) if isinstance(expertise, list) else str(expertise or "")
+
+def _similar_roles(role: str, other_role: str) -> bool:
+    role, other_role = " ".join(role.lower().split()), " ".join(other_role.lower().split())
+    if not role or not other_role: return False
+    if role == other_role or difflib.SequenceMatcher(None, role, other_role).ratio() >= SIMILAR_ROLE_MIN_RATIO: return True
+    role_terms, other_terms = _terms(role), _terms(other_role)
+    return bool(role_terms and other_terms) and len(role_terms & other_terms) / len(role_terms | other_terms) >= SIMILAR_ROLE_MIN_TERM_OVERLAP
+
+
+class PersonaLibrary:
+    def __init__(self, db_path: str = DEFAULT_PERSONA_LIBRARY_PATH):
+        self.db_path = db_path
+        self._write_lock = threading.Lock()
+        self.fts_enabled = True
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS personas (
+                    id INTEGER PRIMARY KEY, fingerprint TEXT UNIQUE, role_title TEXT, expertise TEXT, topic TEXT,
+                    persona_json TEXT NOT NULL, created_at REAL, times_used INTEGER DEFAULT 0
+                )""")
+            try:
+                conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS personas_fts USING fts5(role_title, expertise, topic, content='personas', content_rowid='id')")
+            except sqlite3.OperationalError as e:
+                self.fts_enabled = False
+                print(f"ENGINE WARNING: SQLite FTS5 not available ({e}); persona library falls back to term matching.")
+
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        # One short-lived connection per operation: the library is used from several worker threads.
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            with conn: yield conn # commits on success, rolls back on error
+        finally: conn.close()
+
+    def save_persona(self, persona: Dict[str, Any], topic: str = "") -> bool:
+        """Stores a persona (deduplicated by content). Returns False if it was already in the library."""
+        persona_json = json.dumps(persona, ensure_ascii=False, sort_keys=True)
+        fingerprint = hashlib.sha256(persona_json.encode("utf-8")).hexdigest()
+        role_title, expertise = _persona_role(persona), _persona_expertise(persona)
+        with self._write_lock, self._connection() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO personas (fingerprint, role_title, expertise, topic, persona_json, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (fingerprint, role_title, expertise, topic, persona_json, time.time()))
+            if cursor.rowcount == 0: return False
+            if self.fts_enabled:
+                conn.execute("INSERT INTO personas_fts (rowid, role_title, expertise, topic) VALUES (?, ?, ?, ?)",
+                             (cursor.lastrowid, role_title, expertise, topic))
+        print(f"ENGINE: Persona '{role_title}' saved to persona library.")
+        return True
+
+    def find_persona(
+        self,
+        topic: str,
+        persona_requirements: str = "",
+        exclude_roles: Optional[List[str]] = None,
+        min_matched_terms: int = MIN_MATCHED_TERMS_DEFAULT
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Best stored persona whose role/expertise matches the requirements (the topic only if there are none) and whose role
+        is not similar to an excluded one; None if nothing matches well enough.
+        """
+        query_terms = _terms(persona_requirements) or _terms(topic)
+        if not query_terms: return None
+        required_matches = max(min_matched_terms, math.ceil(len(query_terms) * MIN_MATCHED_TERMS_FRACTION))
+        excluded = [role for role in (exclude_roles or []) if role]
+        with self._connection() as conn:
+            if self.fts_enabled:
+                match_query = "{role_title expertise} : (" + " OR ".join(f'"{term}"' for term in sorted(query_terms)) + ")"
+                rows = conn.execute(
+                    "SELECT p.id, p.role_title, p.expertise, p.topic, p.persona_json FROM personas_fts f JOIN personas p ON p.id = f.rowid "
+                    "WHERE personas_fts MATCH ? ORDER BY bm25(personas_fts), p.times_used LIMIT ?",
+                    (match_query, MAX_FTS_CANDIDATES)).fetchall()
+            else:
+                rows = conn.execute("SELECT id, role_title, expertise, topic, persona_json FROM personas ORDER BY times_used").fetchall()
+
+        best_row, best_matched = None, 0
+        for row_id, role_title, expertise, stored_topic, persona_json in rows:
+            if any(_similar_roles(role_title or "", role) for role in excluded): continue
+            matched = len(query_terms & _terms(f"{role_title} {expertise}"))
+            if matched > best_matched: best_row, best_matched = (row_id, persona_json), matched
+        if best_row is None or best_matched < required_matches: return None
+
+        with self._write_lock, self._connection() as conn:
+            conn.execute("UPDATE personas SET times_used = times_used + 1 WHERE id = ?", (best_row[0],))
+        return json.loads(best_row[1])
+
+    def count(self) -> int:
+        with self._connection() as conn:
+            return conn.execute("SELECT COUNT(*) FROM personas").fetchone()[0]
+
+
+_persona_library: Optional[PersonaLibrary] = None
+_persona_library_lock = threading.Lock()
+
+def get_persona_library() -> Optional[PersonaLibrary]:
+    """Process-wide library at $DELPHIBOT_PERSONA_LIBRARY (default: persona_library.sqlite3); None if it cannot be opened."""
+    global _persona_library
+    with _persona_library_lock:
+        if _persona_library is None:
+            db_path = os.environ.get(PERSONA_LIBRARY_ENV_VAR) or DEFAULT_PERSONA_LIBRARY_PATH
+            try: _persona_library = PersonaLibrary(db_path)
+            except sqlite3.Error as e:
+                print(f"ENGINE WARNING: Could not open persona library '{db_path}': {e}"); return None
+        return _persona_library
@@ -0,0 +1,175 @@
+# delphibot_persona_pool.py
+# Diversity-optimized persona pool: K candidate personas come from ONE batched PersonaManagerAgent call,
+# the N most diverse are picked locally (greedy max-min distance) and handed to concurrent interviews
+# (one interview per persona, or panel interviews where one responder call answers for several personas).
+
+from typing import Any, Dict, List, Optional, Set
+from concurrent.futures import ThreadPoolExecutor
+import json
+import re
+
+from delphibot_engine import (
+    PersonaManagerAgent,
+    MAX_INTERVIEW_TURNS_DEFAULT,
+    PANEL_SIZE_DEFAULT,
+    PERSONA_SCHEMA_HINT,
+    _run_agent_internal,
+    conduct_panel_interview_stage,
+    parse_json_with_repair,
+    perform_study_phase,
+    submit_in_context,
+    summarize_interview_stage,
+    validate_persona_dict,
+)
+from delphibot_persona_library import get_persona_library
+
+PERSONA_POOL_OVERSAMPLING = 2 # K = N * oversampling candidates are generated for N interviews
+PERSONA_POOL_MAX_CANDIDATES = 12
+MAX_PARALLEL_INTERVIEWS = 4
+PERSONA_POOL_SCHEMA_HINT = '{"personas": [' + PERSONA_SCHEMA_HINT + ', ...]}'
+
+# Keys whose words describe the perspective of a persona (the name is deliberately ignored)
+_PERSONA_FEATURE_KEYS = ("role_title", "Role", "role", "expertise_areas", "stance", "key_belief", "key_beliefs", "background", "focus", "perspective")
+_WORD_PATTERN = re.compile(r"\w{3,}")
+
+
+# --- Local Diversity Scoring ---
+def persona_feature_set(persona: Dict[str, Any]) -> Set[str]:
+    features: Set[str] = set()
+    for key in _PERSONA_FEATURE_KEYS:
+        value = persona.get(key)
+        if isinstance(value, list): value = " ".join(str(v) for v in value)
+        if value: features.update(word.lower() for word in _WORD_PATTERN.findall(str(value)))
+    return features
+
+def persona_distance(features_a: Set[str], features_b: Set[str]) -> float:
+    """Jaccard distance between two persona feature sets (1.0 = nothing in common)."""
+    union = features_a | features_b
+    if not union: return 0.0
+    return 1.0 - len(features_a & features_b) / len(union)
+
+def select_diverse_personas(
+    candidates: List[Dict[str, Any]],
+    n: int,
+    already_used: Optional[List[Dict[str, Any]]] = None
+) -> List[Dict[str, Any]]:
+    """Greedy max-min selection: repeatedly take the candidate farthest from everything selected or already interviewed."""
+    candidate_features = [persona_feature_set(p) for p in candidates]
+    reference_features = [persona_feature_set(p) for p in (already_used or [])]
+    remaining = list(range(len(candidates)))
+    selected: List[int] = []
+    while remaining and len(selected) < n:
+        chosen_features = reference_features + [candidate_features[i] for i in selected]
+        if chosen_features:
+            score = lambda i: min(persona_distance(candidate_features[i], f) for f in chosen_features)
+        else: # First pick without history: the most "central" persona is the least informative, so take the most distinct one
+            score = lambda i: sum(persona_distance(candidate_features[i], candidate_features[j]) for j in remaining if j != i)
+        best = max(remaining, key=score)
+        selected.append(best); remaining.remove(best)
+    return [candidates[i] for i in selected]
+
+
+# --- Pool Generation ---
+def _validate_persona_pool(pool: Dict[str, Any]) -> List[str]:
+    personas = pool.get("personas")
+    if not isinstance(personas, list) or not personas: return ["missing non-empty list 'personas'"]
+    valid_count = sum(1 for p in personas if isinstance(p, dict) and not validate_persona_dict(p))
+    return [] if valid_count else ["no persona in 'personas' has both 'name' and 'role_title'"]
+
+def generate_persona_candidates(study_context: Dict, k: int) -> List[Dict[str, Any]]:
+    roles_list = [role for role in study_context.get("roles_interviewed_so_far", []) if role and role != "UnknownRole"]
+    instruction_for_persona_manager = (
+        f"OverallStudyTopic: {study_context.get('OverallStudyTopic')}\n\n"
+        f"PersonaRequirementsGuidance: {study_context.get('PersonaRequirementsGuidance')}\n\n"
+        f"PredefinedPersonas (for you to choose from if a suitable, diverse option exists): {json.dumps(study_context.get('PredefinedPersonas', []), ensure_ascii=False)}\n"
+        f"roles_or_expertise_already_interviewed: {json.dumps(roles_list, ensure_ascii=False)}\n\n"
+        f"Provide {k} DIFFERENT expert personas at once, each with a distinct role, focus and stance "
+        f"(vary optimism/pessimism, technical/social/economic/ethical focus, academic/corporate/governmental/activist background). "
+        f"Output ONLY a JSON object of the form {{\"personas\": [<persona JSON>, ...]}}."
+    )
+    print(f"\nENGINE: --- PersonaManagerAgent: Task -> Provide Persona Pool (K={k}) ---")
+    response_obj = _run_agent_internal(PersonaManagerAgent, instruction_for_persona_manager)
+    if not (response_obj and response_obj.final_output):
+        print("!ENGINE ERROR: PersonaManagerAgent failed to provide a persona pool."); return []
+    pool = parse_json_with_repair(response_obj.final_output, _validate_persona_pool, PERSONA_POOL_SCHEMA_HINT)
+    if not pool: return []
+    candidates = [p for p in pool["personas"] if isinstance(p, dict) and not validate_persona_dict(p)]
+    print(f"ENGINE: Persona pool contains {len(candidates)} valid candidates.")
+    return candidates
+
+def build_persona_pool(
+    study_context: Dict,
+    n: int,
+    k: Optional[int] = None,
+    already_used: Optional[List[Dict[str, Any]]] = None
+) -> List[Dict[str, Any]]:
+    """Returns up to N diverse personas, chosen from K generated candidates."""
+    k = k or min(max(n * PERSONA_POOL_OVERSAMPLING, n + 2), PERSONA_POOL_MAX_CANDIDATES)
+    candidates = generate_persona_candidates(study_context, k)
+    selected = select_diverse_personas(candidates, n, already_used)
+    persona_library = get_persona_library() if study_context.get("UsePersonaLibrary", True) else None
+    if persona_library is not None:
+        for persona in selected: persona_library.save_persona(persona, study_context.get("OverallStudyTopic", ""))
+    print(f"ENGINE: Selected {len(selected)} diverse personas: {[p.get('role_title', p.get('Role', '?')) for p in selected]}")
+    return selected
+
+
+# --- Concurrent Interviews ---
+def run_interviews_concurrently(
+    study_context: Dict,
+    personas: List[Dict[str, Any]],
+    is_exploratory_phase: bool,
+    max_interview_turns: int = MAX_INTERVIEW_TURNS_DEFAULT,
+    max_workers: int = MAX_PARALLEL_INTERVIEWS
+) -> List[Dict[str, Any]]:
+    """Runs one interview (incl. summary) per persona in parallel; results keep the order of 'personas'."""
+    if not personas: return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(personas)), thread_name_prefix="delphibot-interview") as executor:
+        futures = [submit_in_context(executor, perform_study_phase, study_context.copy(), is_exploratory_phase, max_interview_turns, False, persona)
+                   for persona in personas]
+        return [future.result() for future in futures]
+
+def run_structured_interviews_concurrently(
+    study_context: Dict,
+    personas: List[Dict[str, Any]],
+    max_interview_turns: int = MAX_INTERVIEW_TURNS_DEFAULT,
+    max_workers: int = MAX_PARALLEL_INTERVIEWS
+) -> List[Dict[str, Any]]:
+    return run_interviews_concurrently(study_context, personas, False, max_interview_turns, max_workers)
+
+
+# --- Panel Interviews ---
+def split_into_panels(personas: List[Dict[str, Any]], panel_size: int) -> List[List[Dict[str, Any]]]:
+    """Consecutive panels of (nearly) equal size, so no panel is left with a single persona unless panel_size is 1."""
+    if not personas: return []
+    num_panels = -(-len(personas) // max(1, panel_size))
+    base, extra = divmod(len(personas), num_panels)
+    panels, start = [], 0
+    for index in range(num_panels):
+        size = base + (1 if index < extra else 0)
+        panels.append(personas[start:start + size]); start += size
+    return panels
+
+def _run_panel(study_context: Dict, panel: List[Dict[str, Any]], is_exploratory_phase: bool, max_interview_turns: int) -> List[Dict[str, Any]]:
+    panel_results = conduct_panel_interview_stage(study_context, panel, is_exploratory_phase, max_interview_turns)
+    with ThreadPoolExecutor(max_workers=len(panel_results), thread_name_prefix="delphibot-panel-summary") as executor:
+        futures = [submit_in_context(executor, summarize_interview_stage, result, study_context, is_exploratory_phase) for result in panel_results]
+        return [future.result() for future in futures]
+
+def run_panel_interviews(
+    study_context: Dict,
+    personas: List[Dict[str, Any]],
+    is_exploratory_phase: bool,
+    max_interview_turns: int = MAX_INTERVIEW_TURNS_DEFAULT,
+    panel_size: int = PANEL_SIZE_DEFAULT,
+    max_workers: int = MAX_PARALLEL_INTERVIEWS
+) -> List[Dict[str, Any]]:
+    """
+    Interviews the personas as panels of up to panel_size (panels run in parallel): the interview loop costs as many
+    round trips per panel as one interview; each persona still gets its own transcript and summary. Results keep the order of 'personas'.
+    """
+    panels = split_into_panels(personas, panel_size)
+    if not panels: return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(panels)), thread_name_prefix="delphibot-panel") as executor:
+        futures = [submit_in_context(executor, _run_panel, study_context.copy(), panel, is_exploratory_phase, max_interview_turns) for panel in panels]
+        return [result for future in futures for result in future.result()]
@@ -0,0 +1,130 @@
+# delphibot_pipeline.py
+# Pipelined study executor: as soon as an interview transcript is done, its summary (and catalog delta)
+# runs in the background while the next interview starts. Results are collected in interview order.
+
+from typing import Any, Callable, Dict, List, Optional
+from concurrent.futures import Future, ThreadPoolExecutor
+import threading
+
+from delphibot_engine import (
+    MAX_INTERVIEW_TURNS_DEFAULT,
+    conduct_interview_stage,
+    summarize_interview_stage,
+    submit_in_context,
+)
+from delphibot_catalog import merge_summary_into_catalog
+
+MAX_BACKGROUND_SUMMARY_WORKERS = 4
+
+_background_executor: Optional[ThreadPoolExecutor] = None
+_background_executor_lock = threading.Lock()
+
+def get_background_executor() -> ThreadPoolExecutor:
+    """Process-wide executor for background summaries and speculative formalizations (shared by all pipelines / app sessions)."""
+    global _background_executor
+    with _background_executor_lock:
+        if _background_executor is None:
+            _background_executor = ThreadPoolExecutor(max_workers=MAX_BACKGROUND_SUMMARY_WORKERS, thread_name_prefix="delphibot-pipeline")
+        return _background_executor
+
+
+class StudyPipeline:
+    """Runs summarize_interview_stage (+ optional catalog merge) in the background and hands results back in submission order."""
+
+    def __init__(self):
+        self._futures: List[Future] = []
+        self._next_to_collect = 0
+        self._catalog_lock = threading.Lock() # Catalog merges mutate shared state; one at a time
+
+    def submit_summary(
+        self,
+        phase_results: Dict[str, Any],
+        study_context: Dict,
+        is_exploratory_phase: bool = False,
+        catalog_state: Optional[Dict[str, Any]] = None,
+        summary_chunk_turns: Optional[int] = None
+    ) -> Future:
+        future = submit_in_context(
+            get_background_executor(), self._summarize, phase_results, study_context.copy(), is_exploratory_phase, catalog_state, summary_chunk_turns)
+        self._futures.append(future)
+        print(f"ENGINE: Summary of interview {phase_results.get('interview_id')} scheduled in background ({self.pending_count()} pending).")
+        return future
+
+    def add_completed(self, phase_results: Dict[str, Any]) -> None:
+        """Queues a result that needs no background work (e.g. a failed interview) so collection order stays intact."""
+        phase_results.pop("error_message_interview_loop", None)
+        future: Future = Future()
+        future.set_result(phase_results)
+        self._futures.append(future)
+
+    def _summarize(
+        self,
+        phase_results: Dict[str, Any],
+        study_context: Dict,
+        is_exploratory_phase: bool,
+        catalog_state: Optional[Dict[str, Any]],
+        summary_chunk_turns: Optional[int]
+    ) -> Dict[str, Any]:
+        try:
+            phase_results = summarize_interview_stage(phase_results, study_context, is_exploratory_phase, summary_chunk_turns=summary_chunk_turns)
+            if catalog_state is not None and (phase_results.get("summary") or "").strip():
+                self.merge_into_catalog(catalog_state, study_context, phase_results["summary"],
+                                        phase_results["interview_id"], phase_results.get("selected_persona_name", ""))
+        except Exception as e:
+            print(f"!ENGINE ERROR during background summary: {e}")
+            phase_results.pop("error_message_interview_loop", None)
+            phase_results["error_message"] = phase_results.get("error_message") or f"Background summary failed: {e}"
+        return phase_results
+
+    def merge_into_catalog(self, catalog_state: Dict[str, Any], study_context: Dict, summary: str, interview_id: str, source_label: str = "") -> bool:
+        """merge_summary_into_catalog under the pipeline's catalog lock; foreground merges must use it while background merges may run."""
+        with self._catalog_lock:
+            return merge_summary_into_catalog(catalog_state, study_context, summary, interview_id, source_label)
+
+    def pending_count(self) -> int:
+        """Submitted results that have not been collected yet."""
+        return len(self._futures) - self._next_to_collect
+
+    def collect_ready(self) -> List[Dict[str, Any]]:
+        """Finished results, in order; stops at the first one still running so the order is preserved."""
+        ready = []
+        while self._next_to_collect < len(self._futures) and self._futures[self._next_to_collect].done():
+            ready.append(self._futures[self._next_to_collect].result())
+            self._next_to_collect += 1
+        return ready
+
+    def collect_all(self, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        results = []
+        while self._next_to_collect < len(self._futures):
+            results.append(self._futures[self._next_to_collect].result(timeout=timeout))
+            self._next_to_collect += 1
+        return results
+
+
+def run_pipelined_structured_study(
+    study_context: Dict,
+    num_structured_interviews: int,
+    max_interview_turns: int = MAX_INTERVIEW_TURNS_DEFAULT,
+    catalog_state: Optional[Dict[str, Any]] = None,
+    on_result: Optional[Callable[[Dict[str, Any]], None]] = None
+) -> List[Dict[str, Any]]:
+    """Structured phase where interview N+1 runs while interview N is summarized. Returns all results in order."""
+    study_context = study_context.copy()
+    study_context["roles_interviewed_so_far"] = list(study_context.get("roles_interviewed_so_far", []))
+    pipeline = StudyPipeline()
+    results: List[Dict[str, Any]] = []
+    for i in range(num_structured_interviews):
+        print(f"\nENGINE: === Pipelined structured interview {i + 1}/{num_structured_interviews} ===")
+        phase_results = conduct_interview_stage(study_context, False, max_interview_turns)
+        persona = phase_results.get("selected_persona_dict") or {}
+        study_context["roles_interviewed_so_far"].append(persona.get("role_title", persona.get("Role", "UnknownRole")))
+        if phase_results.get("error_message"): pipeline.add_completed(phase_results)
+        else:
+            pipeline.submit_summary(phase_results, study_context, False, catalog_state)
+        for ready in pipeline.collect_ready():
+            results.append(ready)
+            if on_result: on_result(ready)
+    for ready in pipeline.collect_all():
+        results.append(ready)
+        if on_result: on_result(ready)
+    return results
@@ -0,0 +1,235 @@
+# delphibot_providers.py
+# Registry of self-hosted OpenAI-compatible model backends (llama.cpp server, vLLM, ...). An agent runs on a backend
+# when the model policy names its model as "<provider>:<model>". Every backend keeps ONE pooled client on its own event
+# loop thread, caps its concurrent requests and is accounted at zero cost unless the policy prices it.
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+
+PROVIDER_SEPARATOR = ":"
+DEFAULT_MAX_CONCURRENCY = 4 # CPU boxes serve few requests at once; more just queue inside the server
+DEFAULT_REQUEST_TIMEOUT_S = 600.0
+DEFAULT_LOCAL_API_KEY = "local" # OpenAI-compatible servers usually ignore the key, but the client requires one
+ZERO_PRICING = {"input": 0.0, "output": 0.0}
+
+
+class ModelProvider:
+    """
+    One OpenAI-compatible backend. The AsyncOpenAI client (and its HTTP connection pool) lives on a dedicated event loop
+    thread, so connections are reused across calls from any thread; a semaphore limits the requests in flight.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        base_url: str,
+        api_key: str = DEFAULT_LOCAL_API_KEY,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        timeout_s: float = DEFAULT_REQUEST_TIMEOUT_S,
+        pricing: Optional[Dict[str, float]] = None
+    ):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.timeout_s = timeout_s
+        self.pricing = dict(pricing or ZERO_PRICING)
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._start_lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client: Any = None
+        self._models: Dict[str, Any] = {}
+        self._stats_lock = threading.Lock()
+        self.calls = 0; self.in_flight = 0; self.max_in_flight = 0
+
+    def _ensure_started(self) -> None:
+        """Starts the event loop thread and creates the pooled client on first use (imports stay out of app startup)."""
+        with self._start_lock:
+            if self._loop is not None: return
+            from openai import AsyncOpenAI
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name=f"delphibot-provider-{self.name}", daemon=True).start()
+            async def create_client() -> Any: # The client's own keep-alive pool; the semaphore keeps it at max_concurrency connections
+                return AsyncOpenAI(base_url=self.base_url, api_key=self.api_key, timeout=self.timeout_s, max_retries=1)
+            self._client = asyncio.run_coroutine_threadsafe(create_client(), loop).result()
+            self._loop = loop
+            print(f"ENGINE: Model provider '{self.name}' connected to {self.base_url} (max {self.max_concurrency} concurrent requests).")
+
+    def _model(self, model_name: str) -> Any:
+        if model_name not in self._models:
+            from agents import OpenAIChatCompletionsModel # Local servers implement Chat Completions, not the Responses API
+            self._models[model_name] = OpenAIChatCompletionsModel(model=model_name, openai_client=self._client)
+        return self._models[model_name]
+
+    def run(self, agent: Any, model_name: str, prompt_text: str) -> Any:
+        """Runs 'agent' on model_name of this backend (blocking; waits for a free slot). Tracing stays local."""
+        from agents import RunConfig, Runner
+        self._ensure_started()
+        with self._slots:
+            with self._stats_lock:
+                self.calls += 1; self.in_flight += 1; self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            try:
+                coroutine = Runner.run(agent.clone(model=self._model(model_name)), prompt_text, run_config=RunConfig(tracing_disabled=True))
+                return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result(timeout=self.timeout_s)
+            finally:
+                with self._stats_lock: self.in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {"provider": self.name, "base_url": self.base_url, "calls": self.calls, "in_flight": self.in_flight,
+                    "max_in_flight": self.max_in_flight, "max_concurrency": self.max_concurrency}
+
+    def close(self) -> None:
+        with self._start_lock:
+            if self._loop is None: return
+            asyncio.run_coroutine_threadsafe(self._client.close(), self._loop).result(timeout=10)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop = None; self._client = None; self._models = {}
+
+
+# --- Registry ---
+_providers: Dict[str, ModelProvider] = {}
+_providers_lock = threading.Lock()
+
+def register_provider(name: str, base_url: str, **options: Any) -> ModelProvider:
+    """Registers (or replaces) a backend; agents use it via the model name '<name>:<model>'."""
+    if not name or PROVIDER_SEPARATOR in name: raise ValueError(f"Invalid provider name '{name}'.")
+    provider = ModelProvider(name, base_url, **options)
+    with _providers_lock:
+        previous = _providers.pop(name, None)
+        _providers[name] = provider
+    if previous is not None: previous.close()
+    return provider
+
+def unregister_provider(name: str) -> None:
+    with _providers_lock: provider = _providers.pop(name, None)
+    if provider is not None: provider.close()
+
+def list_providers() -> List[ModelProvider]:
+    with _providers_lock: return list(_providers.values())
+
+def resolve_provider(model_name: str) -> Tuple[Optional[ModelProvider], str]:
+    """(provider, model on that provider) for '<provider>:<model>'; (None, model_name) for hosted OpenAI models
+    (a prefix that is not a registered provider, e.g. 'ft:gpt-4.1-mini:...', stays a hosted model name)."""
+    prefix, separator, provider_model = model_name.partition(PROVIDER_SEPARATOR)
+    if not separator: return None, model_name
+    with _providers_lock: provider = _providers.get(prefix)
+    return (provider, provider_model) if provider is not None else (None, model_name)
+
+def provider_pricing(model_name: str) -> Optional[Dict[str, float]]:
+    provider, _ = resolve_provider(model_name)
+    return provider.pricing if provider is not None else None
+
+def register_providers_from_policy(providers: Dict[str, Any]) -> int:
+    """
+    The 'providers' section of the model policy: {"<name>": {"base_url": ..., "api_key_env": "<ENV VAR>" or "api_key": ...,
+    "max_concurrency": 4, "timeout_s": 600, "pricing": {"input": 0.0, "output": 0.0}}}.
+    """
+    registered = 0
+    for name, config in (providers or {}).items():
+        if not isinstance(config, dict) or not config.get("base_url"):
+            print(f"!ENGINE WARNING: Ignoring model provider '{name}' (needs 'base_url')."); continue
+        api_key = os.environ.get(config["api_key_env"], "") if config.get("api_key_env") else config.get("api_key", "")
+        options = {key: config[key] for key in ("max_concurrency", "timeout_s", "pricing") if key in config}
+        try: register_provider(name, config["base_url"], api_key=api_key or DEFAULT_LOCAL_API_KEY, **options)
+        except (TypeError, ValueError) as e:
+            print(f"!ENGINE WARNING: Ignoring model provider '{name}': {e}"); continue
+        registered += 1
+    return registered
+
+
+# --- Local stand-in server (for tests and offline development) ---
+class LocalStubServer:
+    """
+    Minimal OpenAI-compatible /v1/chat/completions endpoint on localhost. 'responder' maps the request body to the
+    answer text; 'latency_s' simulates a slow CPU backend. max_concurrent shows whether a provider's limit held.
+    Usage: with LocalStubServer() as server: register_provider("stub", server.base_url)
+    """
+
+    def __init__(self, responder: Optional[Callable[[Dict[str, Any]], str]] = None, latency_s: float = 0.0,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.responder = responder or (lambda body: f"[local stub response for {body.get('model')}]")
+        self.latency_s = latency_s
+        self.requests = 0; self.concurrent = 0; self.max_concurrent = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _completion(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            self.requests += 1; self.concurrent += 1; self.max_concurrent = max(self.max_concurrent, self.concurrent)
+        try:
+            if self.latency_s: time.sleep(self.latency_s)
+            answer = self.responder(body)
+        finally:
+            with self._lock: self.concurrent -= 1
+        prompt_chars = sum(len(str(message.get("content") or "")) for message in body.get("messages", []))
+        return {
+            "id": f"chatcmpl-local-{uuid.uuid4().hex[:12]}", "object": "chat.completion", "created": int(time.time()),
+            "model": body.get("model", ""),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop", "logprobs": None}],
+            "usage": {"prompt_tokens": prompt_chars // 4, "completion_tokens": len(answer) // 4, "total_tokens": (prompt_chars + len(answer)) // 4},
+        }
+
+    def _handler_class(self) -> type:
+        stub = self
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1" # Keep-alive, so the client's connection pooling is exercised
+
+            def _send_json(self, status: int, payload: Dict[str, Any]) -> None:
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json"); self.send_header("Content-Length", str(len(data)))
+                self.end_headers(); self.wfile.write(data)
+
+            def do_GET(self) -> None:
+                if self.path.rstrip("/").endswith("/models"): self._send_json(200, {"object": "list", "data": []})
+                else: self._send_json(404, {"error": {"message": "not found"}})
+
+            def do_POST(self) -> None:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if not self.path.rstrip("/").endswith("/chat/completions"): self._send_json(404, {"error": {"message": "not found"}}); return
+                if body.get("stream"): self._send_json(400, {"error": {"message": "streaming is not supported by the stub server"}}); return
+                self._send_json(200, stub._completion(body))
+
+            def log_message(self, format: str, *args: Any) -> None: pass
+        return Handler
+
+    def start(self) -> "LocalStubServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="delphibot-stub-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown(); self._server.server_close()
+
+    def __enter__(self) -> "LocalStubServer":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Serve the local OpenAI-compatible stand-in (canned answers) for offline development.")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds per request")
+    args = parser.parse_args()
+    server = LocalStubServer(latency_s=args.latency, port=args.port).start()
+    print(f"Stub server on {server.base_url} (Ctrl+C to stop)")
+    try:
+        while True: time.sleep(3600)
+    except KeyboardInterrupt: server.stop()
@@ -0,0 +1,176 @@
+# delphibot_retrieval.py
+# Local retrieval index over earlier studies (SQLite + FTS5/BM25 over catalog factors and interview summaries).
+# New studies get only the top-k relevant prior factors injected into the structure formalization and the
+# interviewer guide instead of starting from zero (or pasting whole prior catalogs into the prompts).
+
+from typing import Any, Dict, Iterator, List, Optional
+from contextlib import contextmanager
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+
+PRIOR_STUDY_INDEX_ENV_VAR = "DELPHIBOT_PRIOR_STUDY_INDEX"
+DEFAULT_PRIOR_STUDY_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prior_studies.sqlite3")
+TOP_K_PRIOR_FACTORS_DEFAULT = 8
+MAX_FTS_CANDIDATES = 50
+MAX_QUERY_TERMS = 40 # Long queries (e.g. a whole exploratory summary) are cut to their most frequent terms
+MIN_MATCHED_TERMS = 2 # A document must share at least this many query terms (with or without FTS5) ...
+MIN_MATCHED_TERMS_FRACTION = 0.1 # ... and this fraction of them for long queries: one shared generic topic word is no match
+SUMMARY_PASSAGE_MAX_CHARS = 600 # Summaries are indexed as passages, so a hit injects one paragraph, not a whole summary
+PRIOR_FACTOR_TEXT_MAX_CHARS = 220
+
+_TERM_PATTERN = re.compile(r"\w{4,}") # Same stop-word heuristic as the persona library
+_PARAGRAPH_SPLIT = re.compile(r"\n\s*\n")
+
+
+def _terms(text: str) -> List[str]:
+    return [term.lower() for term in _TERM_PATTERN.findall(text or "") if not term.isdigit()]
+
+def _query_terms(text: str) -> List[str]:
+    counts: Dict[str, int] = {}
+    for term in _terms(text): counts[term] = counts.get(term, 0) + 1
+    return sorted(counts, key=lambda term: (-counts[term], term))[:MAX_QUERY_TERMS]
+
+def _summary_passages(summary: str) -> Iterator[str]:
+    passage = ""
+    for paragraph in _PARAGRAPH_SPLIT.split(summary or ""):
+        paragraph = paragraph.strip()
+        if not paragraph: continue
+        if passage and len(passage) + len(paragraph) > SUMMARY_PASSAGE_MAX_CHARS: yield passage; passage = ""
+        passage = f"{passage}\n{paragraph}".strip()
+    if passage: yield passage[:SUMMARY_PASSAGE_MAX_CHARS * 2]
+
+
+class PriorStudyIndex:
+    """Incremental on-disk index: documents are deduplicated by content, so re-indexing a study only adds what is new."""
+
+    def __init__(self, db_path: str = DEFAULT_PRIOR_STUDY_INDEX_PATH):
+        self.db_path = db_path
+        self._write_lock = threading.Lock()
+        self.fts_enabled = True
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    id INTEGER PRIMARY KEY, fingerprint TEXT UNIQUE, kind TEXT NOT NULL, study_id TEXT, topic TEXT, target_year INTEGER,
+                    systemebene TEXT, faktorname TEXT, text TEXT NOT NULL, created_at REAL
+                )""")
+            try:
+                conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(faktorname, systemebene, text, content='documents', content_rowid='id')")
+            except sqlite3.OperationalError as e:
+                self.fts_enabled = False
+                print(f"ENGINE WARNING: SQLite FTS5 not available ({e}); prior study index falls back to term matching.")
+
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            with conn: yield conn
+        finally: conn.close()
+
+    def _add_documents(self, documents: List[Dict[str, Any]]) -> int:
+        added = 0
+        with self._write_lock, self._connection() as conn:
+            for doc in documents:
+                fingerprint = hashlib.sha256(f"{doc['kind']}|{doc['topic']}|{doc['systemebene']}|{doc['faktorname']}|{doc['text']}".encode("utf-8")).hexdigest()
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO documents (fingerprint, kind, study_id, topic, target_year, systemebene, faktorname, text, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (fingerprint, doc["kind"], doc["study_id"], doc["topic"], doc["target_year"], doc["systemebene"], doc["faktorname"], doc["text"], time.time()))
+                if cursor.rowcount == 0: continue
+                added += 1
+                if self.fts_enabled:
+                    conn.execute("INSERT INTO documents_fts (rowid, faktorname, systemebene, text) VALUES (?, ?, ?, ?)",
+                                 (cursor.lastrowid, doc["faktorname"], doc["systemebene"], doc["text"]))
+        return added
+
+    def index_study(
+        self,
+        study_context: Dict,
+        catalog_state: Optional[Dict[str, Any]] = None,
+        summaries: Optional[List[str]] = None
+    ) -> int:
+        """Adds the factors of a (structured) catalog and the summary passages of a finished study. Returns the number of new documents."""
+        base = {"study_id": str(study_context.get("StudyId", "")), "topic": str(study_context.get("OverallStudyTopic", "")),
+                "target_year": study_context.get("TargetYear")}
+        documents = []
+        for level, factors in ((catalog_state or {}).get("systemebenen") or {}).items():
+            for factor_name, details in factors.items():
+                text = " ".join(str(details.get(key, "")) for key in ("definition", "dimensions", "trends") if details.get(key))
+                documents.append({**base, "kind": "factor", "systemebene": level, "faktorname": factor_name, "text": text})
+        for summary in summaries or []:
+            documents += [{**base, "kind": "summary", "systemebene": "", "faktorname": "", "text": passage} for passage in _summary_passages(summary)]
+        added = self._add_documents(documents)
+        print(f"ENGINE: Prior study index: {added} new of {len(documents)} documents from study '{base['topic']}'.")
+        return added
+
+    def search(self, query: str, k: int = TOP_K_PRIOR_FACTORS_DEFAULT, exclude_study_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Top-k documents for the query (factors before summary passages at equal rank), excluding the running study."""
+        terms = _query_terms(query)
+        if not terms: return []
+        query_terms = set(terms)
+        required_matches = max(MIN_MATCHED_TERMS, math.ceil(len(terms) * MIN_MATCHED_TERMS_FRACTION))
+        def matched_terms(row: tuple) -> int: return len(query_terms.intersection(_terms(f"{row[6]} {row[5]} {row[7]}")))
+        columns = "d.id, d.kind, d.study_id, d.topic, d.target_year, d.systemebene, d.faktorname, d.text"
+        with self._connection() as conn:
+            if self.fts_enabled:
+                rows = conn.execute(
+                    f"SELECT {columns} FROM documents_fts f JOIN documents d ON d.id = f.rowid WHERE documents_fts MATCH ? "
+                    f"ORDER BY bm25(documents_fts, 3.0, 1.0, 1.0), d.kind = 'summary' LIMIT ?",
+                    (" OR ".join(f'"{term}"' for term in terms), MAX_FTS_CANDIDATES)).fetchall()
+                rows = [row for row in rows if matched_terms(row) >= required_matches] # BM25 order; an OR query also returns single-term hits
+            else:
+                scored = [(matched_terms(row), row) for row in conn.execute(f"SELECT {columns} FROM documents d").fetchall()]
+                rows = [row for matched, row in sorted(scored, key=lambda s: (-s[0], s[1][1] == "summary")) if matched >= required_matches]
+
+        hits = []
+        for _, kind, study_id, topic, target_year, level, factor_name, text in rows:
+            if exclude_study_id and study_id == exclude_study_id: continue
+            hits.append({"kind": kind, "study_id": study_id, "topic": topic, "target_year": target_year,
+                         "systemebene": level, "faktorname": factor_name, "text": text})
+            if len(hits) >= k: break
+        return hits
+
+    def count(self) -> int:
+        with self._connection() as conn:
+            return conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+
+def format_prior_factors(hits: List[Dict[str, Any]]) -> str:
+    """One short line per hit, for prompt injection."""
+    lines = []
+    for hit in hits:
+        text = " ".join(hit["text"].split())[:PRIOR_FACTOR_TEXT_MAX_CHARS]
+        source = f"(study '{hit['topic']}', {hit['target_year']})"
+        if hit["kind"] == "factor": lines.append(f"- [{hit['systemebene']}] {hit['faktorname']}: {text} {source}")
+        else: lines.append(f"- Summary excerpt {source}: {text}")
+    return "\n".join(lines)
+
+
+_prior_study_index: Optional[PriorStudyIndex] = None
+_prior_study_index_lock = threading.Lock()
+
+def get_prior_study_index() -> Optional[PriorStudyIndex]:
+    """Process-wide index at $DELPHIBOT_PRIOR_STUDY_INDEX (default: prior_studies.sqlite3); None if it cannot be opened."""
+    global _prior_study_index
+    with _prior_study_index_lock:
+        if _prior_study_index is None:
+            db_path = os.environ.get(PRIOR_STUDY_INDEX_ENV_VAR) or DEFAULT_PRIOR_STUDY_INDEX_PATH
+            try: _prior_study_index = PriorStudyIndex(db_path)
+            except sqlite3.Error as e:
+                print(f"ENGINE WARNING: Could not open prior study index '{db_path}': {e}"); return None
+        return _prior_study_index
+
+def prior_factors_for_prompt(study_context: Dict, query: str, k: int = TOP_K_PRIOR_FACTORS_DEFAULT) -> str:
+    """Formatted top-k prior factors for the query, or "" if disabled (UsePriorStudies=False) or nothing relevant is indexed."""
+    if not study_context.get("UsePriorStudies", True): return ""
+    index = get_prior_study_index()
+    if index is None: return ""
+    try: hits = index.search(query, k, exclude_study_id=study_context.get("StudyId"))
+    except sqlite3.Error as e:
+        print(f"ENGINE WARNING: Prior study search failed: {e}"); return ""
+    if hits: print(f"ENGINE: {len(hits)} prior factor(s) retrieved from earlier studies.")
+    return format_prior_factors(hits)
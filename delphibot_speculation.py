@@ -0,0 +1,83 @@
+# delphibot_speculation.py
+# Speculative structure formalization: the AI-proposed exploratory summary is formalized in the background while the
+# user still reviews it. On confirmation the result is reused (unchanged summary), reconciled with a cheap diff-only
+# call (small edits) or discarded for a full formalization of the confirmed summary (large edits).
+
+from typing import Dict, List, Optional, Tuple
+from concurrent.futures import Executor
+import difflib
+import json
+
+from delphibot_engine import formalize_structure_from_exploratory_summary, reconcile_formalized_guides, submit_in_context
+from delphibot_pipeline import get_background_executor
+
+FORMALIZATION_CONTEXT_KEYS = ("OverallStudyTopic", "TargetYear", "UsePriorStudies", "StudyId") # All that formalization reads besides the summary
+RECONCILE_MIN_SIMILARITY = 0.8 # Word-level similarity of the confirmed to the proposed summary; below it the guides are formalized anew
+RECONCILE_MAX_DIFF_CHARS = 4000 # A longer diff costs about as much as formalizing again
+DIFF_CONTEXT_LINES = 1
+
+OUTCOME_REUSED = "reused"
+OUTCOME_RECONCILED = "reconciled"
+OUTCOME_REFORMALIZED = "reformalized"
+
+
+def _context_fingerprint(study_context: Dict) -> str:
+    return json.dumps({key: study_context.get(key) for key in FORMALIZATION_CONTEXT_KEYS}, sort_keys=True, default=str)
+
+def _lines(text: str) -> List[str]:
+    return [" ".join(line.split()) for line in (text or "").strip().splitlines() if line.strip()]
+
+def summary_edit_diff(proposed_summary: str, confirmed_summary: str) -> Tuple[float, str]:
+    """(word-level similarity, unified line diff) of the user's edits; whitespace-only edits count as no edits (1.0, "")."""
+    proposed_lines, confirmed_lines = _lines(proposed_summary), _lines(confirmed_summary)
+    if proposed_lines == confirmed_lines: return 1.0, ""
+    similarity = difflib.SequenceMatcher(None, " ".join(proposed_lines).split(), " ".join(confirmed_lines).split(), autojunk=False).ratio()
+    diff = difflib.unified_diff(proposed_lines, confirmed_lines, "proposed", "confirmed", n=DIFF_CONTEXT_LINES, lineterm="")
+    return similarity, "\n".join(list(diff)[2:]) # Without the ---/+++ file header
+
+
+class SpeculativeFormalization:
+    """
+    formalize_structure_from_exploratory_summary for the proposed summary, started right away on a background thread
+    (the caller's bound StudyUsage records its tokens). resolve() turns it into the guides for the confirmed summary.
+    """
+
+    def __init__(self, study_context: Dict, proposed_summary: str, executor: Optional[Executor] = None):
+        self.proposed_summary = proposed_summary
+        self.context_fingerprint = _context_fingerprint(study_context)
+        self.outcome: Optional[str] = None
+        self._future = submit_in_context(executor or get_background_executor(), self._formalize, study_context.copy(), proposed_summary)
+        print("ENGINE: Speculative formalization of the proposed summary started in background.")
+
+    @staticmethod
+    def _formalize(study_context: Dict, proposed_summary: str) -> Optional[Dict[str, str]]:
+        try: return formalize_structure_from_exploratory_summary(study_context, proposed_summary)
+        except Exception as e: print(f"!ENGINE ERROR during speculative formalization: {e}"); return None
+
+    def matches(self, study_context: Dict, proposed_summary: str) -> bool:
+        return proposed_summary == self.proposed_summary and _context_fingerprint(study_context) == self.context_fingerprint
+
+    def done(self) -> bool:
+        return self._future.done()
+
+    def resolve(self, study_context: Dict, confirmed_summary: str) -> Optional[Dict[str, str]]:
+        """Guides for the confirmed summary; waits for the speculative call if it is still running."""
+        if _context_fingerprint(study_context) != self.context_fingerprint:
+            self._future.cancel(); return self._reformalize(study_context, confirmed_summary, "study context changed")
+        similarity, summary_diff = summary_edit_diff(self.proposed_summary, confirmed_summary)
+        if similarity < RECONCILE_MIN_SIMILARITY or len(summary_diff) > RECONCILE_MAX_DIFF_CHARS:
+            self._future.cancel(); return self._reformalize(study_context, confirmed_summary, f"large edits (similarity {similarity:.2f})")
+        speculative_guides = self._future.result()
+        if not speculative_guides: return self._reformalize(study_context, confirmed_summary, "speculative formalization failed")
+        if not summary_diff:
+            self.outcome = OUTCOME_REUSED; print("ENGINE: Summary confirmed unchanged; speculative guides reused.")
+            return speculative_guides
+        reconciled_guides = reconcile_formalized_guides(study_context, speculative_guides, summary_diff)
+        if not reconciled_guides: return self._reformalize(study_context, confirmed_summary, "reconciliation failed")
+        self.outcome = OUTCOME_RECONCILED; print(f"ENGINE: Speculative guides reconciled with small edits (similarity {similarity:.2f}).")
+        return reconciled_guides
+
+    def _reformalize(self, study_context: Dict, confirmed_summary: str, reason: str) -> Optional[Dict[str, str]]:
+        print(f"ENGINE: Speculative guides not usable ({reason}); formalizing the confirmed summary.")
+        self.outcome = OUTCOME_REFORMALIZED
+        return formalize_structure_from_exploratory_summary(study_context, confirmed_summary)
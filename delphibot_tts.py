@@ -0,0 +1,157 @@
+# delphibot_tts.py
+# Streams interviewer questions as speech to the user's BROWSER. A small process-wide HTTP endpoint hands the MP3 bytes
+# of the TTS provider (OpenAI or gTTS) to an <audio> element while they arrive. Long questions are split into sentences:
+# the first (short) one streams right away, the next ones are synthesized ahead in parallel and appended in order.
+
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import os
+import re
+import statistics
+import threading
+import time
+import uuid
+
+TTS_HOST_ENV_VAR = "DELPHIBOT_TTS_HOST"
+TTS_PORT_ENV_VAR = "DELPHIBOT_TTS_PORT"
+TTS_PUBLIC_URL_ENV_VAR = "DELPHIBOT_TTS_PUBLIC_URL" # e.g. https://example.org/tts behind a reverse proxy; default: same host, TTS port
+DEFAULT_TTS_HOST = "0.0.0.0" # The browser, not the server, fetches the audio
+DEFAULT_TTS_PORT = 8502
+OPENAI_TTS_MODEL = "gpt-4o-mini-tts"
+GTTS_LANGUAGE = "de"
+FIRST_CHUNK_MAX_CHARS = 120 # Short first chunk: its audio starts while the rest is still being synthesized
+CHUNK_MAX_CHARS = 300
+MAX_PREFETCH_CHUNKS = 2 # Chunks synthesized ahead per stream
+MAX_PARALLEL_SYNTHESES = 8 # Shared by all streams of the process
+READ_CHUNK_BYTES = 4096
+STREAM_TTL_S = 600 # Stream URLs (and their cached audio for replays) expire after this
+MAX_CACHED_STREAMS = 64
+
+_SENTENCE_END = re.compile(r"(?<=[.!?…:;])\s+")
+
+
+# --- Sentence Chunking ---
+def _split_long_sentence(sentence: str, limit: int) -> List[str]:
+    parts = []
+    while len(sentence) > limit:
+        cut = sentence.rfind(", ", 0, limit) + 1 # After a comma if there is one in the latter part, else at a word boundary
+        if cut < limit // 3: cut = sentence.rfind(" ", 0, limit)
+        if cut <= 0: cut = limit
+        parts.append(sentence[:cut].strip()); sentence = sentence[cut:].strip()
+    return parts + ([sentence] if sentence else [])
+
+def split_into_speech_chunks(text: str, first_max_chars: int = FIRST_CHUNK_MAX_CHARS, max_chars: int = CHUNK_MAX_CHARS) -> List[str]:
+    """Sentences of 'text', with short neighbours merged up to max_chars (the first chunk only up to first_max_chars)."""
+    chunks: List[str] = []
+    for sentence in _SENTENCE_END.split(" ".join((text or "").split())):
+        for part in _split_long_sentence(sentence, first_max_chars if not chunks else max_chars):
+            limit = first_max_chars if len(chunks) == 1 else max_chars
+            if chunks and len(chunks[-1]) + 1 + len(part) <= limit: chunks[-1] = f"{chunks[-1]} {part}"
+            else: chunks.append(part)
+    return chunks
+
+
+# --- Providers (each yields MP3 bytes as they arrive; MP3 frames are self-contained, so chunks can be concatenated) ---
+def openai_speech(client: Any, voice: str, model: str = OPENAI_TTS_MODEL) -> Callable[[str], Iterator[bytes]]:
+    def synthesize(text: str) -> Iterator[bytes]:
+        with client.audio.speech.with_streaming_response.create(model=model, voice=voice, input=text, response_format="mp3") as response:
+            yield from response.iter_bytes(READ_CHUNK_BYTES)
+    return synthesize
+
+def gtts_speech(language: str = GTTS_LANGUAGE) -> Callable[[str], Iterator[bytes]]:
+    def synthesize(text: str) -> Iterator[bytes]:
+        from gtts import gTTS
+        yield from gTTS(text=text, lang=language, slow=False).stream()
+    return synthesize
+
+
+class TTSStreamServer:
+    """
+    Serves GET /tts/<token>.mp3. register() returns the path for one text; every request runs on its own thread, so
+    concurrent users never wait for each other. The finished audio is kept for replays until the stream expires.
+    """
+
+    def __init__(self, host: Optional[str] = None, port: Optional[int] = None, public_url: Optional[str] = None):
+        self.host = host or os.environ.get(TTS_HOST_ENV_VAR) or DEFAULT_TTS_HOST
+        self.port = int(port if port is not None else os.environ.get(TTS_PORT_ENV_VAR) or DEFAULT_TTS_PORT)
+        self.public_url = (public_url or os.environ.get(TTS_PUBLIC_URL_ENV_VAR) or "").rstrip("/")
+        self._streams: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=MAX_PARALLEL_SYNTHESES, thread_name_prefix="delphibot-tts")
+        self._first_audio_ms: deque = deque(maxlen=100)
+        self._server = ThreadingHTTPServer((self.host, self.port), self._handler_class())
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1] # Resolves port 0
+
+    def start(self) -> "TTSStreamServer":
+        threading.Thread(target=self._server.serve_forever, name="delphibot-tts-server", daemon=True).start()
+        print(f"ENGINE: TTS stream server listening on {self.host}:{self.port}.")
+        if not self.public_url: # Plain HTTP on the TTS port: an app page served over HTTPS may not load it (mixed content)
+            print(f"ENGINE WARNING: {TTS_PUBLIC_URL_ENV_VAR} is not set; browsers block the plain-HTTP audio stream if the app is served over HTTPS.")
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown(); self._server.server_close(); self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def register(self, text: str, synthesize: Callable[[str], Iterator[bytes]]) -> Optional[str]:
+        """Path (relative to the server's base URL) that streams 'text' spoken by 'synthesize'; None for empty text."""
+        chunks = split_into_speech_chunks(text)
+        if not chunks: return None
+        token = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            for expired in [t for t, s in self._streams.items() if now - s["created"] > STREAM_TTL_S]: del self._streams[expired]
+            while len(self._streams) >= MAX_CACHED_STREAMS: del self._streams[min(self._streams, key=lambda t: self._streams[t]["created"])]
+            self._streams[token] = {"chunks": chunks, "synthesize": synthesize, "created": now, "audio": None, "lock": threading.Lock()}
+        return f"/tts/{token}.mp3"
+
+    def _write_stream(self, stream: Dict[str, Any], write: Callable[[bytes], None]) -> None:
+        """Streams the first chunk directly and the others from the prefetch pool; keeps the audio if the stream completed."""
+        chunks, synthesize = stream["chunks"], stream["synthesize"]
+        audio = bytearray()
+        started = time.perf_counter(); first_audio_ms: Optional[float] = None
+        prefetched = [self._executor.submit(lambda chunk: b"".join(synthesize(chunk)), chunk) for chunk in chunks[1:1 + MAX_PREFETCH_CHUNKS]]
+        try:
+            for data in synthesize(chunks[0]):
+                if first_audio_ms is None: first_audio_ms = (time.perf_counter() - started) * 1000; self._first_audio_ms.append(first_audio_ms)
+                write(data); audio += data
+            for index in range(1, len(chunks)):
+                next_index = index + MAX_PREFETCH_CHUNKS
+                if next_index < len(chunks): prefetched.append(self._executor.submit(lambda chunk: b"".join(synthesize(chunk)), chunks[next_index]))
+                data = prefetched[index - 1].result()
+                write(data); audio += data
+        except (BrokenPipeError, ConnectionResetError): # Browser stopped listening (page rerendered or closed)
+            for future in prefetched: future.cancel()
+            return
+        except Exception as e:
+            for future in prefetched: future.cancel()
+            print(f"!ENGINE ERROR: TTS synthesis failed: {e}"); return
+        stream["audio"] = bytes(audio)
+        first_audio = f"first audio after {first_audio_ms:.0f} ms" if first_audio_ms is not None else "no audio from the first chunk"
+        print(f"ENGINE: TTS streamed {len(chunks)} chunk(s), {len(audio)} bytes, {first_audio}.")
+
+    def _handler_class(self) -> type:
+        tts = self
+        class Handler(BaseHTTPRequestHandler):
+            # HTTP/1.0 without Content-Length: the browser plays the MP3 progressively until the connection closes
+            def do_GET(self) -> None:
+                match = re.fullmatch(r"/tts/([0-9a-f]{32})\.mp3", self.path.split("?", 1)[0])
+                with tts._lock: stream = tts._streams.get(match.group(1)) if match else None
+                if stream is None: self.send_error(404, "Unknown or expired TTS stream"); return
+                with stream["lock"]: # A second request (e.g. a replay) waits for the first stream and gets the kept audio
+                    self.send_response(200)
+                    self.send_header("Content-Type", "audio/mpeg"); self.send_header("Cache-Control", "no-store")
+                    if stream["audio"] is not None:
+                        self.send_header("Content-Length", str(len(stream["audio"]))); self.end_headers(); self.wfile.write(stream["audio"]); return
+                    self.end_headers()
+                    def write(data: bytes) -> None: self.wfile.write(data); self.wfile.flush()
+                    tts._write_stream(stream, write)
+
+            def log_message(self, format: str, *args: Any) -> None: pass
+        return Handler
+
+    def stats(self) -> Dict[str, Any]:
+        first_audio = list(self._first_audio_ms)
+        return {"streams": len(self._streams), "median_first_audio_ms": statistics.median(first_audio) if first_audio else None}
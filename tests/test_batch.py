@@ -0,0 +1,45 @@
+import pytest
+
+import delphibot_batch
+from delphibot_batch import LocalBatchClient, run_structured_study_in_batch_mode
+from delphibot_engine import BATCH_USAGE_SUFFIX, StudyUsage, bind_study_usage, get_session_usage, set_study_budget
+
+STUDY_CONTEXT = {"OverallStudyTopic": "Zukunft der Tageszeitung", "TargetYear": 2040,
+                 "InterviewGuideStructure_DEFINED": "Technik, Wirtschaft", "DesiredOutputCatalogStructureGuidance_DEFINED": "Nach Systemebenen"}
+
+
+@pytest.fixture(autouse=True)
+def offline_study(monkeypatch):
+    bind_study_usage(StudyUsage())
+    interviews = iter(range(100))
+    def fake_phase(study_context, is_exploratory_phase, max_interview_turns, defer_summary=False):
+        number = next(interviews)
+        return {"interview_id": f"i{number}", "selected_persona_name": f"Expert {number}", "selected_persona_dict": {"role_title": f"Role {number}"},
+                "transcript": [{"question": "Q", "answer": "A"}], "summary": "", "error_message": None,
+                "pending_summary_prompt": f"Summarize interview {number}. " + "Transcript text. " * 50}
+    monkeypatch.setattr(delphibot_batch, "perform_study_phase", fake_phase)
+    monkeypatch.setattr(delphibot_batch, "_build_final_catalog_writer_prompt", lambda study_context, summaries: f"Write the catalog from:\n{summaries}")
+
+def _responder(body):
+    prompt = body["messages"][-1]["content"]
+    return "# Faktorenkatalog" if prompt.startswith("Write the catalog") else f"Summary of: {prompt.split('.')[0]}"
+
+def test_batch_study_against_local_client():
+    client = LocalBatchClient(_responder, polls_until_complete=2)
+    results = run_structured_study_in_batch_mode(STUDY_CONTEXT, 3, client=client, poll_interval_s=0)
+    summaries = [result["summary"] for result in results["structured_interview_results_list"]]
+    assert summaries == [f"Summary of: Summarize interview {i}" for i in range(3)]
+    assert all("pending_summary_prompt" not in result for result in results["structured_interview_results_list"])
+    assert results["final_catalog"] == "# Faktorenkatalog"
+    usage = get_session_usage()
+    assert usage["by_model"] and all(model.endswith(BATCH_USAGE_SUFFIX) for model in usage["by_model"])
+    assert sum(model_usage["calls"] for model_usage in usage["by_model"].values()) == 4 # 3 summaries + 1 catalog
+
+def test_batch_requests_respect_the_study_budget():
+    set_study_budget(1e-6) # Too small for any hosted request
+    client = LocalBatchClient(_responder)
+    results = run_structured_study_in_batch_mode(STUDY_CONTEXT, 2, client=client, poll_interval_s=0)
+    assert all(result["error_message"] for result in results["structured_interview_results_list"])
+    assert results["final_catalog"] is None
+    usage = get_session_usage()
+    assert usage["cost_usd"] == 0 and usage["budget"]["skipped_calls"] == 2
@@ -0,0 +1,32 @@
+import json
+from types import SimpleNamespace
+
+import delphibot_catalog
+import delphibot_engine
+from delphibot_catalog import _validate_factor_list, catalog_state_from_markdown, list_catalog_factors
+
+
+def _reply_with(payload):
+    return lambda agent, prompt: SimpleNamespace(final_output=payload if isinstance(payload, str) else json.dumps(payload))
+
+def test_validator_requires_non_empty_strings():
+    validate = _validate_factor_list("factors")
+    entries = [{"systemebene": "Technik", "faktorname": "KI"}, {"systemebene": 3, "faktorname": "KI"},
+               {"systemebene": "Technik", "faktorname": ["KI"]}, {"systemebene": "Technik", "faktorname": "  "}]
+    assert validate({"factors": entries}) == ["entries [1, 2, 3] need non-empty string 'systemebene' and 'faktorname'"]
+    assert validate({"factors": entries[:1]}) == []
+
+def test_catalog_from_markdown(monkeypatch):
+    monkeypatch.setattr(delphibot_catalog, "_run_agent_internal", _reply_with(
+        {"factors": [{"systemebene": "Technik", "faktorname": "KI", "definition": "Sprachmodelle", "dimensions": "", "trends": "wächst"}]}))
+    catalog_state = catalog_state_from_markdown({"TargetYear": 2040}, "# Katalog\n## Technik\n### KI")
+    assert [factor["faktorname"] for factor in list_catalog_factors(catalog_state)] == ["KI"]
+
+def test_failed_extraction_returns_none(monkeypatch):
+    monkeypatch.setattr(delphibot_catalog, "_run_agent_internal", _reply_with("no json here"))
+    monkeypatch.setattr(delphibot_engine, "_run_agent_internal", lambda agent, prompt: None) # JSON repair fails as well
+    assert catalog_state_from_markdown({"TargetYear": 2040}, "# Katalog") is None
+
+def test_empty_extraction_returns_none(monkeypatch):
+    monkeypatch.setattr(delphibot_catalog, "_run_agent_internal", _reply_with({"factors": []}))
+    assert catalog_state_from_markdown({"TargetYear": 2040}, "# Katalog") is None
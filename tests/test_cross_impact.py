@@ -0,0 +1,34 @@
+import numpy as np
+
+from delphibot_cross_impact import consistent_scenario_bundles
+
+
+def _reinforcing_matrix() -> np.ndarray:
+    # Two clusters that strengthen themselves and weaken each other
+    return np.array([[0, 3, 2, -2, -1],
+                     [3, 0, 2, -1, -2],
+                     [2, 2, 0, -1, -1],
+                     [-2, -1, -1, 0, 3],
+                     [-1, -2, -1, 3, 0]], dtype=float)
+
+def test_scenario_bundles_contain_no_mirror_pairs():
+    # Two independent self-reinforcing pairs: 4 consistent scenarios, i.e. 2 mirror pairs
+    matrix = np.array([[0, 2, 0, 0], [2, 0, 0, 0], [0, 0, 0, 2], [0, 0, 2, 0]], dtype=float)
+    scenarios = consistent_scenario_bundles(matrix)
+    states = [tuple(bundle["states"]) for bundle in scenarios["bundles"]]
+    assert len(states) == 2
+    assert all(bundle["consistency"] >= 0 for bundle in scenarios["bundles"])
+    assert all(state[0] == 1 for state in states)
+    assert not any(tuple(-s for s in state) in states for state in states)
+
+def test_best_bundle_is_the_consistent_cluster_split():
+    scenarios = consistent_scenario_bundles(_reinforcing_matrix())
+    best = scenarios["bundles"][0]
+    by_factor = dict(zip(scenarios["key_factor_indices"], best["states"]))
+    assert best["consistency"] >= 0
+    assert by_factor[0] == by_factor[1] == by_factor[2] == -by_factor[3] == -by_factor[4]
+
+def test_failed_rows_count_as_zero():
+    matrix = _reinforcing_matrix()
+    matrix[4] = np.nan
+    assert consistent_scenario_bundles(matrix)["bundles"]
@@ -0,0 +1,26 @@
+import pytest
+
+from delphibot_engine import SUMMARY_CHUNK_TURNS, split_transcript_into_windows
+from delphibot_estimator import DEFAULT_OUTPUT_TOKENS, calibrate, estimate_study
+
+STUDY_CONTEXT = {"OverallStudyTopic": "Zukunft der Tageszeitung", "TargetYear": 2040,
+                 "InterviewGuideStructure_DEFINED": "Technik, Wirtschaft", "DesiredOutputCatalogStructureGuidance_DEFINED": "Nach Systemebenen"}
+
+
+def _summarizer_calls(max_turns, **kwargs):
+    estimate = estimate_study(STUDY_CONTEXT, 2, max_turns, include_exploratory=False, calibration=calibrate([]), **kwargs)
+    return estimate["by_agent"]["SummarizerAgent"]["calls"]
+
+@pytest.mark.parametrize("agent_name", ["DelphiRaterAgent", "CrossImpactAgent", "SimulatedInterviewAgent", "PanelResponderAgent"])
+def test_every_agent_has_a_default_output_size(agent_name):
+    assert calibrate([])["output_tokens"][agent_name] == DEFAULT_OUTPUT_TOKENS[agent_name]
+
+def test_short_transcripts_are_summarized_in_one_call():
+    assert _summarizer_calls(SUMMARY_CHUNK_TURNS) == 2
+
+@pytest.mark.parametrize("max_turns", [SUMMARY_CHUNK_TURNS + 1, 2 * SUMMARY_CHUNK_TURNS + 3])
+def test_long_transcripts_add_a_call_per_chunk_and_a_merge(max_turns):
+    chunks = len(split_transcript_into_windows(list(range(max_turns))))
+    assert chunks > 1
+    assert _summarizer_calls(max_turns) == 2 * (chunks + 1)
+    assert _summarizer_calls(max_turns, panel_size=2) == 2 * (chunks + 1) # A summary per panel member
@@ -0,0 +1,28 @@
+import threading
+import time
+
+import delphibot_pipeline
+from delphibot_pipeline import StudyPipeline
+
+
+def test_foreground_and_background_merges_never_overlap(monkeypatch):
+    active, overlaps, merged = [0], [0], []
+    counter_lock = threading.Lock()
+    def fake_merge(catalog_state, study_context, summary, interview_id, source_label=""):
+        with counter_lock:
+            active[0] += 1; overlaps[0] += active[0] > 1
+        time.sleep(0.02)
+        merged.append(interview_id)
+        with counter_lock: active[0] -= 1
+        return True
+    monkeypatch.setattr(delphibot_pipeline, "merge_summary_into_catalog", fake_merge)
+    monkeypatch.setattr(delphibot_pipeline, "summarize_interview_stage", lambda phase_results, *args, **kwargs: {**phase_results, "summary": "S"})
+
+    pipeline, catalog_state = StudyPipeline(), {"systemebenen": {}}
+    for i in range(4): pipeline.submit_summary({"interview_id": f"bg{i}"}, {}, False, catalog_state)
+    for i in range(4): assert pipeline.merge_into_catalog(catalog_state, {}, "S", f"fg{i}")
+    results = pipeline.collect_all()
+
+    assert [result["interview_id"] for result in results] == ["bg0", "bg1", "bg2", "bg3"]
+    assert sorted(merged) == sorted([f"bg{i}" for i in range(4)] + [f"fg{i}" for i in range(4)])
+    assert overlaps[0] == 0
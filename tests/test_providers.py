@@ -0,0 +1,68 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from delphibot_engine import StudyUsage, _run_agent_internal, bind_study_usage, estimate_cost_usd, get_session_usage, set_study_budget, submit_in_context
+from delphibot_providers import LocalStubServer, list_providers, provider_pricing, register_provider, register_providers_from_policy, resolve_provider, unregister_provider
+
+
+@pytest.fixture
+def stub_server():
+    with LocalStubServer(lambda body: f"Antwort von {body.get('model')}", latency_s=0.05) as server:
+        yield server
+    for provider in list_providers(): unregister_provider(provider.name)
+
+def test_registered_provider_resolves_by_model_prefix(stub_server):
+    provider = register_provider("stub", stub_server.base_url, max_concurrency=2)
+    assert resolve_provider("stub:llama-3-8b") == (provider, "llama-3-8b")
+    assert resolve_provider("gpt-4.1-mini") == (None, "gpt-4.1-mini")
+    assert resolve_provider("ft:gpt-4.1-mini:org:custom") == (None, "ft:gpt-4.1-mini:org:custom") # Not a registered provider
+    with pytest.raises(ValueError): register_provider("bad:name", stub_server.base_url)
+    unregister_provider("stub")
+    assert resolve_provider("stub:llama-3-8b") == (None, "stub:llama-3-8b")
+
+def test_policy_providers_are_zero_cost_unless_priced(stub_server):
+    providers = {"cpu": {"base_url": stub_server.base_url}, "gpu": {"base_url": stub_server.base_url, "pricing": {"input": 0.1, "output": 0.2}},
+                 "broken": {"max_concurrency": 2}}
+    assert register_providers_from_policy(providers) == 2
+    assert provider_pricing("cpu:llama") == {"input": 0.0, "output": 0.0}
+    assert estimate_cost_usd({"cpu:llama": {"input_tokens": 10**6, "output_tokens": 10**6}}) == 0.0
+    assert estimate_cost_usd({"gpu:llama": {"input_tokens": 10**6, "output_tokens": 10**6}}) == pytest.approx(0.3)
+
+
+# --- Calls through the pooled client ---
+# These need the real OpenAI Agents SDK (OpenAIChatCompletionsModel on an AsyncOpenAI client).
+@pytest.fixture
+def agents_sdk():
+    pytest.importorskip("openai")
+    agents = pytest.importorskip("agents")
+    if not hasattr(agents, "OpenAIChatCompletionsModel"): pytest.skip("OpenAI Agents SDK not installed")
+    bind_study_usage(StudyUsage())
+    return agents
+
+def _run_in_parallel(agent, model_name, count):
+    with ThreadPoolExecutor(max_workers=count) as executor:
+        futures = [submit_in_context(executor, _run_agent_internal, agent.clone(model=model_name), f"Frage {index}") for index in range(count)]
+        return [future.result() for future in futures]
+
+def test_provider_caps_concurrency_and_reuses_one_client(stub_server, agents_sdk):
+    provider = register_provider("stub", stub_server.base_url, max_concurrency=2)
+    agent = agents_sdk.Agent(name="InterviewerAgent", instructions="Stelle Fragen.")
+    results = _run_in_parallel(agent, "stub:llama-3-8b", 6)
+    assert [result.final_output for result in results] == ["Antwort von llama-3-8b"] * 6
+    assert stub_server.requests == 6
+    assert stub_server.max_concurrent == 2 # Six threads, at most two requests reach the server at once
+    client = provider._client
+    _run_in_parallel(agent, "stub:llama-3-8b", 2)
+    assert provider._client is client # One pooled client per provider, created on first use
+    assert provider.stats()["calls"] == 8 and provider.stats()["max_in_flight"] == 2
+
+def test_provider_calls_cost_nothing_and_bypass_the_budget(stub_server, agents_sdk):
+    register_provider("stub", stub_server.base_url)
+    set_study_budget(1e-9)
+    agent = agents_sdk.Agent(name="SummarizerAgent", instructions="Fasse zusammen.")
+    results = _run_in_parallel(agent, "stub:llama-3-8b", 3)
+    assert all(result is not None for result in results)
+    usage = get_session_usage()
+    assert usage["by_model"]["stub:llama-3-8b"]["calls"] == 3
+    assert usage["cost_usd"] == 0.0 and usage["budget"]["skipped_calls"] == 0
@@ -0,0 +1,25 @@
+import pytest
+
+from delphibot_retrieval import PriorStudyIndex
+
+
+@pytest.fixture(params=[True, False], ids=["fts", "term-matching"])
+def index(request, tmp_path):
+    index = PriorStudyIndex(str(tmp_path / "prior.sqlite3"))
+    index.fts_enabled = index.fts_enabled and request.param
+    catalog = {"systemebenen": {
+        "Technologie": {"Autonomes Fahren": {"definition": "Zukunft des autonomen Fahrens in Deutschland", "trends": "Robotaxis, Sensorik"}},
+        "Landwirtschaft": {"Bodenqualität": {"definition": "Ackerbau und Humus in Deutschland", "trends": "Zukunft der Düngung"}},
+    }}
+    index.index_study({"StudyId": "old", "OverallStudyTopic": "Zukunft der Mobilität", "TargetYear": 2040}, catalog)
+    return index
+
+def test_single_generic_term_is_no_match(index):
+    assert index.search("Zukunft der Medien") == []
+
+def test_both_paths_return_the_matching_factor(index):
+    hits = index.search("Zukunft autonomes Fahren, Robotaxis und Sensorik")
+    assert [hit["faktorname"] for hit in hits] == ["Autonomes Fahren"]
+
+def test_running_study_is_excluded(index):
+    assert index.search("Robotaxis Sensorik", exclude_study_id="old") == []
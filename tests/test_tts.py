@@ -0,0 +1,39 @@
+from urllib.request import urlopen
+
+import pytest
+
+from delphibot_tts import TTSStreamServer, split_into_speech_chunks
+
+
+@pytest.fixture
+def tts_server():
+    server = TTSStreamServer(host="127.0.0.1", port=0, public_url="http://127.0.0.1/tts").start()
+    yield server
+    server.stop()
+
+def _fetch(server, path):
+    with urlopen(f"http://127.0.0.1:{server.port}{path}", timeout=10) as response: return response.read()
+
+def test_long_text_is_split_with_a_short_first_chunk():
+    chunks = split_into_speech_chunks("Erste Frage. " + "Ein längerer Satz mit vielen Worten, der weitergeht. " * 10)
+    assert len(chunks) > 1 and chunks[0].startswith("Erste Frage.")
+    assert len(chunks[0]) <= 120 and all(len(chunk) <= 300 for chunk in chunks)
+
+def test_stream_concatenates_chunks_in_order_and_keeps_the_audio(tts_server):
+    path = tts_server.register("Erste Frage. Zweite Frage! Dritte Frage?", lambda text: iter([text.encode("utf-8")]))
+    assert _fetch(tts_server, path) == "Erste Frage. Zweite Frage! Dritte Frage?".encode("utf-8")
+    assert _fetch(tts_server, path) == "Erste Frage. Zweite Frage! Dritte Frage?".encode("utf-8") # Replay from the kept audio
+    assert tts_server.stats()["median_first_audio_ms"] is not None
+
+def test_first_chunk_without_audio_records_no_latency(tts_server, capsys):
+    tts_server._first_audio_ms.append(123.0) # An earlier stream's latency must not be reported for this one
+    path = tts_server.register("Kurz.", lambda text: iter([]))
+    assert _fetch(tts_server, path) == b""
+    assert list(tts_server._first_audio_ms) == [123.0]
+    assert "no audio from the first chunk" in capsys.readouterr().out
+
+def test_missing_public_url_warns_at_startup(capsys, monkeypatch):
+    monkeypatch.delenv("DELPHIBOT_TTS_PUBLIC_URL", raising=False)
+    server = TTSStreamServer(host="127.0.0.1", port=0).start()
+    server.stop()
+    assert "DELPHIBOT_TTS_PUBLIC_URL is not set" in capsys.readouterr().out